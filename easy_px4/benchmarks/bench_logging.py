@@ -0,0 +1,91 @@
+"""
+Throughput of the easy_px4 log handlers, as seen by the thread producing the records
+(e.g. the reader of `make` output in debug mode).
+
+    python benchmarks/bench_logging.py --records 200000
+    python benchmarks/bench_logging.py --records 20000 --sink-delay 0.0001  # slow terminal/pipe
+
+Compares the previous synchronous colored formatter (mutating record.msg), the
+synchronous and queued text formatter and the queued JSON formatter.
+"""
+import io
+import time
+import queue
+import logging
+import logging.handlers
+import argparse
+
+from easy_px4.backend.logger import LOG_COLORS, ColoredCommandFormatter, CommandAdapter, JsonFormatter, PhaseFilter, _QueueHandler
+
+
+class LegacyColoredCommandFormatter(logging.Formatter):
+    def format(self, record):
+        color = LOG_COLORS.get(record.levelname, '')
+        reset = LOG_COLORS['RESET']
+        level = f"{color}[{record.levelname}]{reset}"
+
+        command = record.__dict__.get("command", "easy_px4")
+        record.msg = f"{level} [{command}] {record.msg}"
+        return super().format(record)
+
+
+class SlowSink(io.StringIO):
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+
+    def write(self, s):
+        if self.delay:
+            time.sleep(self.delay)
+        return len(s)
+
+
+def run(name: str, formatter: logging.Formatter, queued: bool, records: int, delay: float) -> None:
+    logger = logging.getLogger(f"bench.{name}")
+    logger.handlers.clear()
+    logger.filters.clear()
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addFilter(PhaseFilter())
+
+    handler = logging.StreamHandler(SlowSink(delay))
+    handler.setFormatter(formatter)
+
+    listener = None
+    if queued:
+        q = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(q, handler)
+        logger.addHandler(_QueueHandler(q))
+        listener.start()
+    else:
+        logger.addHandler(handler)
+
+    adapter = CommandAdapter(logger, {"command": "build"})
+    line = "[1234/5678] Building CXX object src/modules/ekf2/CMakeFiles/modules__ekf2.dir/EKF/ekf.cpp.o"
+
+    start = time.perf_counter()
+    for _ in range(records):
+        adapter.debug(line)
+    producer = time.perf_counter() - start
+
+    if listener is not None:
+        listener.stop()
+    total = time.perf_counter() - start
+
+    print(f"{name:<16} producer {records / producer:>12,.0f} rec/s   total {records / total:>12,.0f} rec/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--sink-delay", type=float, default=0.0, help="Seconds per write of the output stream.")
+    args = parser.parse_args()
+
+    run("legacy text", LegacyColoredCommandFormatter("%(message)s"), False, args.records, args.sink_delay)
+    run("text", ColoredCommandFormatter("%(message)s"), False, args.records, args.sink_delay)
+    run("text, queued", ColoredCommandFormatter("%(message)s"), True, args.records, args.sink_delay)
+    run("json, queued", JsonFormatter(), True, args.records, args.sink_delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,41 @@
 import sys
+import signal
 import argparse
 
 from .backend.commands.command import Command
+from .backend.logger import LOG_FORMATS, configure_logging, get_logger
 from .backend.commands.build import BuildCommand
+from .backend.commands.watch import WatchCommand
+from .backend.commands.sitl import SitlCommand
+from .backend.commands.size import SizeCommand
+from .backend.commands.dds import DdsCommand
+from .backend.commands.msgs import MsgsCommand
+from .backend.commands.snapshot import ExportSnapshotCommand, ImportSnapshotCommand
+from .backend.commands.gc import GcCommand
 
 # available command registration
 COMMAND_REGISTRY: list[type[Command]] = [
-    BuildCommand
+    BuildCommand,
+    WatchCommand,
+    SitlCommand,
+    SizeCommand,
+    DdsCommand,
+    MsgsCommand,
+    ExportSnapshotCommand,
+    ImportSnapshotCommand,
+    GcCommand,
 ]
 
 
+class _Terminated(KeyboardInterrupt):
+    pass
+
+
+def _interrupt(signum, frame):
+    # CI timeouts send SIGTERM: unwind like Ctrl+C, so the commands clean up (and a build can be resumed)
+    raise _Terminated
+
+
 def main():
     """
     Main entrypoint for the CLI tool.
@@ -26,6 +52,11 @@ def main():
         description="A simple tool to help building custom PX4-firmwares"
     )
 
+    parser.add_argument("--log-format",
+                        choices=LOG_FORMATS,
+                        default="text",
+                        help="text (colored, default) or json (one object per line with command, phase and fields).")
+
     subparsers = parser.add_subparsers(dest="command", required=True, help="Available commands")
 
     cmd_register = {}
@@ -37,8 +68,17 @@ def main():
 
     args = parser.parse_args()
 
-    with cmd_register[args.command]() as worker:
-        worker.execute(args)
+    configure_logging(args.log_format)
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    try:
+        with cmd_register[args.command]() as worker:
+            worker.execute(args)
+    except KeyboardInterrupt as e:
+        # the command has cleaned up on the way out
+        signum = signal.SIGTERM if isinstance(e, _Terminated) else signal.SIGINT
+        get_logger(args.command).error(f"Interrupted by {signal.Signals(signum).name}.")
+        return 128 + signum
 
     return 0
 
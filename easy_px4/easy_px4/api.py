@@ -3,6 +3,9 @@ from pathlib import Path
 from easy_px4_utils import load_info_dict
 
 from .backend.paths import PX4_DIR, WORK_DIR
+from .backend.builder import BuildOptions, BuildResult, build
+from .backend.matrix import MatrixEntry, build_matrix
+from .backend.errors import EasyPX4Error, ConfigurationError, GitError, DependencyError, CompilationError, LockTimeoutError, ReproducibilityError
 
 def get_dir() -> Path:
     """
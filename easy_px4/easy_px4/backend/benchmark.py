@@ -0,0 +1,170 @@
+import os
+import json
+import time
+from pathlib import Path
+from typing import Optional
+from datetime import datetime, timezone
+from dataclasses import asdict, dataclass
+
+from .errors import EasyPX4Error
+from .manifest import MANIFEST_NAME, load_manifest
+from .paths import STATE_DIR
+from .sitl import SitlLauncher
+
+BENCH_DIR = STATE_DIR / "bench"
+
+# printed by the PX4 posix startup once rcS completed
+READY_PATTERN = "Startup script returned successfully"
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class BenchmarkError(EasyPX4Error):
+    """
+    The SITL instance did not reach the ready state.
+    """
+
+
+@dataclass
+class BenchResult:
+    airframe: str
+    target: str
+    commit: Optional[str]
+    boot_s: float
+    cpu_percent: float
+    cpu_percent_max: float
+    rss_mb: float
+    rss_mb_max: float
+    window_s: float
+    timestamp: str
+
+
+def _proc_sample(pid: int) -> tuple[int, int]:
+    """
+    (user + system CPU ticks, resident pages) of a process, read from /proc.
+    """
+    with open(f"/proc/{pid}/stat", "r") as f:
+        # the command name may contain spaces, fields start after the closing parenthesis
+        fields = f.read().rsplit(")", 1)[1].split()
+    ticks = int(fields[11]) + int(fields[12])
+    with open(f"/proc/{pid}/statm", "r") as f:
+        rss_pages = int(f.read().split()[1])
+    return ticks, rss_pages
+
+
+def run_benchmark(launcher: SitlLauncher,
+                  airframe: str,
+                  ready_pattern: str = READY_PATTERN,
+                  boot_timeout: float = 60.0,
+                  window: float = 30.0,
+                  interval: float = 0.5) -> BenchResult:
+    """
+    Starts a single headless instance, measures the time until `ready_pattern`
+    shows up in its output, then samples CPU and RSS for `window` seconds.
+    """
+    started = time.monotonic()
+    (instance,) = launcher.start()
+    pid = instance.process.pid
+    out_log = instance.workdir / "out.log"
+
+    try:
+        boot_s = None
+        while time.monotonic() - started < boot_timeout:
+            if instance.process.poll() is not None:
+                raise BenchmarkError(f"SITL exited with code {instance.process.returncode} before being ready, see {out_log}")
+            if ready_pattern in out_log.read_text(errors="replace"):
+                boot_s = time.monotonic() - started
+                break
+            time.sleep(0.01)
+
+        if boot_s is None:
+            raise BenchmarkError(f"SITL not ready after {boot_timeout}s ('{ready_pattern}' not found in {out_log})")
+
+        def sample() -> tuple[int, int]:
+            # an exited instance stays in /proc as a zombie until reaped, with frozen ticks and no RSS
+            if instance.process.poll() is not None:
+                raise BenchmarkError(f"SITL exited with code {instance.process.returncode} during the "
+                                     f"measurement window, see {out_log}")
+            return _proc_sample(pid)
+
+        cpu_samples = []
+        rss_samples = []
+        last_ticks, _ = sample()
+        last_time = time.monotonic()
+        window_end = last_time + window
+
+        while time.monotonic() < window_end:
+            time.sleep(interval)
+            ticks, rss_pages = sample()
+            now = time.monotonic()
+            cpu_samples.append(100.0 * (ticks - last_ticks) / _CLK_TCK / (now - last_time))
+            rss_samples.append(rss_pages * _PAGE_SIZE / 2**20)
+            last_ticks, last_time = ticks, now
+    finally:
+        launcher.stop()
+
+    manifest_file = launcher.build_dir / MANIFEST_NAME
+    commit = load_manifest(manifest_file).get("commit") if manifest_file.is_file() else None
+
+    return BenchResult(
+        airframe=airframe,
+        target=launcher.build_dir.name,
+        commit=commit,
+        boot_s=round(boot_s, 3),
+        cpu_percent=round(sum(cpu_samples) / len(cpu_samples), 2) if cpu_samples else 0.0,
+        cpu_percent_max=round(max(cpu_samples, default=0.0), 2),
+        rss_mb=round(sum(rss_samples) / len(rss_samples), 2) if rss_samples else 0.0,
+        rss_mb_max=round(max(rss_samples, default=0.0), 2),
+        window_s=window,
+        timestamp=datetime.now(timezone.utc).isoformat(),
+    )
+
+
+def history_file(airframe: str) -> Path:
+    return BENCH_DIR / f"{airframe}.json"
+
+
+def load_history(airframe: str) -> list[dict]:
+    try:
+        with history_file(airframe).open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def record(result: BenchResult) -> Optional[dict]:
+    """
+    Appends the result to the history of the airframe and returns the record to compare
+    against: the latest one of a different commit (the previous build), else the latest one.
+    """
+    history = load_history(result.airframe)
+    previous = next((r for r in reversed(history) if r.get("commit") != result.commit), None)
+    if previous is None and history:
+        previous = history[-1]
+
+    history.append(asdict(result))
+    path = history_file(result.airframe)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f"{path.name}.tmp")
+    with temp.open("w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    temp.replace(path)
+
+    return previous
+
+
+def regressions(result: BenchResult, previous: Optional[dict], threshold: float) -> list[str]:
+    """
+    Metrics that got worse than `previous` by more than `threshold` (relative, e.g. 0.1 = 10 %).
+    """
+    if previous is None:
+        return []
+
+    found = []
+    for metric in ("boot_s", "cpu_percent", "rss_mb"):
+        before = previous.get(metric)
+        after = getattr(result, metric)
+        if before and after > before * (1.0 + threshold):
+            found.append(f"{metric}: {before} -> {after} (+{100.0 * (after - before) / before:.1f}%)")
+    return found
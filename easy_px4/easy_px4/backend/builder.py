@@ -0,0 +1,1087 @@
+import os
+import json
+import time
+import zlib
+import struct
+import shutil
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, Union
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from argparse import ArgumentTypeError, Namespace
+from dataclasses import asdict, dataclass, field, fields, replace
+
+from easy_px4_utils import load_directory, valid_dir_path
+
+from .errors import EasyPX4Error, ConfigurationError, GitError, DependencyError, CompilationError, ReproducibilityError
+from .logger import get_logger, log_phase
+from .paths import PX4_DIR
+from .runner import Rusage, account_rusage, run_command, CommandResult
+from .manifest import MANIFEST_NAME, describe_artifact, hash_inputs, load_manifest, store_artifact, write_manifest
+from .overlay import Overlay, OverlayCopy, OverlayInsertion
+from .planner import MAKE_FULL, MAKE_ROMFS, BuildPlan, Planner, git, load_tags_cache, remember_tag
+from .metrics import METRICS_DIR_ENV, ccache_delta, ccache_stats, write_metrics
+from .lock import TreeLock
+from .size import SizeReport, analyze, deltas, record
+from .dds import estimate
+from .msgs import read_msgs
+from .tree import check_airframe, load_tree_index
+from . import reproducible
+from .gc import GC_QUOTA_ENV, collect, disk_size, record_use
+from .checkpoint import Checkpoint, checkpoint_file, fingerprint
+
+BUILD_TYPES = [
+    "firmware",
+    "sitl"
+]
+
+# mtimes of the PX4 files staged for the last successful build of a target
+STAGED_NAME = "easy_px4_staged.json"
+
+
+@dataclass
+class BuildOptions:
+    """
+    Options of a single build. Mirrors the arguments of `easy_px4 build`.
+    """
+    build_type: str
+    path: Path
+    comps: Optional[Path] = None
+    output: Optional[Path] = None
+    dry_run: bool = False
+    clean_run: bool = False
+    install_dependencies: bool = False
+    overwrite: bool = False
+    skip_compilation: bool = False
+    msgs_output: Optional[Path] = None
+    params_check: bool = False
+    force: bool = False
+    # override the PX4 release/commit of info.toml (version matrix builds)
+    px4_version: Optional[str] = None
+    px4_commit: Optional[str] = None
+    # node-exporter textfile collector directory, defaults to $EASY_PX4_METRICS_DIR
+    metrics_dir: Optional[Path] = None
+    # seconds to wait for other jobs using the PX4 tree, None waits forever
+    lock_timeout: Optional[float] = None
+    # uXRCE-DDS bandwidth budgets (bytes/s) of a custom dds_topics.yaml and (topic, Hz) rate overrides
+    dds_budget_out: Optional[float] = None
+    dds_budget_in: Optional[float] = None
+    dds_rate: list[tuple[str, float]] = field(default_factory=list)
+    dds_budget_fail: bool = False
+    # boards of a multi-board firmware compiled at once (default: all) and the CPU cores they share
+    board_jobs: Optional[int] = None
+    cpu_budget: Optional[int] = None
+    # pinned build environment, and a second build from scratch to check the artifacts are identical
+    reproducible: bool = False
+    verify_reproducible: bool = False
+    # bytes the build directories may use after the build, defaults to $EASY_PX4_GC_QUOTA
+    gc_quota: Optional[int] = None
+    # continue an interrupted build of the same inputs after its completed phases
+    resume: bool = False
+
+    def __post_init__(self) -> None:
+        if self.build_type not in BUILD_TYPES:
+            raise ConfigurationError(f"Unknown build type: {self.build_type}. Expected one of {BUILD_TYPES}")
+
+        for name in ("board_jobs", "cpu_budget"):
+            if getattr(self, name) is not None and getattr(self, name) < 1:
+                raise ConfigurationError(f"'{name}' must be at least 1, got {getattr(self, name)}")
+
+        if self.verify_reproducible:
+            self.reproducible = True
+
+        if self.gc_quota is None and os.environ.get(GC_QUOTA_ENV):
+            try:
+                self.gc_quota = disk_size(os.environ[GC_QUOTA_ENV])
+            except ArgumentTypeError as e:
+                raise ConfigurationError(f"Invalid {GC_QUOTA_ENV}: {e}") from e
+
+        if self.metrics_dir is None and os.environ.get(METRICS_DIR_ENV):
+            self.metrics_dir = Path(os.environ[METRICS_DIR_ENV])
+
+        for name in ("path", "comps", "output", "msgs_output", "metrics_dir"):
+            value = getattr(self, name)
+            if value is None:
+                continue
+            try:
+                setattr(self, name, valid_dir_path(value))
+            except (TypeError, FileNotFoundError, NotADirectoryError) as e:
+                raise ConfigurationError(f"Invalid '{name}': {e}") from e
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> "BuildOptions":
+        """
+        Creates the options from the parsed cli arguments.
+        """
+        values = {f.name: getattr(args, f.name) for f in fields(cls) if hasattr(args, f.name)}
+        values["build_type"] = args.type
+        return cls(**values)
+
+
+@dataclass
+class BuildResult:
+    """
+    Structured outcome of a build.
+
+    status is one of:
+    - "success": the target was compiled.
+    - "skipped": compilation was skipped on request (--skip-compilation).
+    - "up-to-date": the target was already built (and --overwrite was not given
+      or the build outputs were produced from the same commit and inputs).
+    - "planned": --dry-run, nothing was executed. See `plan`.
+    - "failed": the build raised an error, see `error` and `tail`.
+    """
+    status: str
+    target: Optional[str] = None
+    # every target of the build, `target` first (more than one for a multi-board firmware)
+    targets: list[str] = field(default_factory=list)
+    commit: Optional[str] = None
+    renamed_tag: Optional[str] = None
+    timings: dict[str, float] = field(default_factory=dict)
+    # unix times the build started and finished (phases can nest, their timings do not add up to it)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # resources of the child processes (git, installer, make, ...) per phase
+    rusage: dict[str, Rusage] = field(default_factory=dict)
+    # hits/misses of the checkout, submodules and ccache caches
+    cache: dict[str, dict[str, int]] = field(default_factory=dict)
+    # flash/RAM usage of a firmware build
+    size: Optional[SizeReport] = None
+    # estimated uXRCE-DDS bandwidth (bytes/s) per direction of a custom dds_topics.yaml
+    dds_bandwidth: dict[str, float] = field(default_factory=dict)
+    artifacts: list[dict] = field(default_factory=list)
+    manifest: Optional[Path] = None
+    error: Optional[str] = None
+    tail: list[str] = field(default_factory=list)
+    plan: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.status != "failed"
+
+
+class Layout(NamedTuple):
+    """
+    Where an airframe of a given build type lives inside the PX4 tree.
+    """
+    tooling_cmd: list[str]
+    px4board: Path
+    init_romfs_dir: Path
+    airframe_match: str
+    target: str
+
+
+class BoardTarget(NamedTuple):
+    """
+    One PX4 target of a build: its `.px4board` file and the name of its exported files.
+    """
+    target: str
+    px4board: Path
+    output_name: str
+
+
+def renamed_tag_for(info) -> str:
+    """
+    Tag placed on the PX4 commit so that the firmware reports the custom version.
+    """
+    # =====================================================================================
+    # Hacky way (for now) to make the tags work without changing the PX4 source code
+    # or maybe I should start a conversation with PX4 to see what can we do ?
+    px4_split = info.px4_version.split("-")
+
+    if len(px4_split) > 1:
+        px4_version = px4_split[0]
+        px4_release = px4_split[1]
+        return f"{px4_version}-{info.custom_fw_version.split('-')[0]}-{px4_release}"
+    return f"{px4_split[0]}-{info.custom_fw_version.split('-')[0]}"
+    # =====================================================================================
+
+
+class Builder:
+    """
+    Builds one airframe directory inside the PX4 tree.
+
+    A builder is single use: create one per build and always call `cleanup`
+    afterwards (the `easy_px4 build` command and `easy_px4.build` take care of it).
+    Failures raise subclasses of `EasyPX4Error` carrying the partial `BuildResult`.
+    """
+
+    def __init__(self, options: BuildOptions, logger=None, px4_dir: Path = PX4_DIR,
+                 live: bool = True, git_lock=None, tree_lock: Optional[TreeLock] = None,
+                 compile_slots=None) -> None:
+        self.options = options
+        self.logger = logger if logger is not None else get_logger("build")
+        self.px4_dir = px4_dir
+        # live prints the output of long commands, disable it when builds run concurrently
+        self.live = live
+        # serializes git steps when several builders share one repository (worktrees)
+        self.git_lock = git_lock if git_lock is not None else nullcontext()
+        # a lock given by the caller (watch mode) is held across builds and not released here
+        self.tree_lock = tree_lock
+        self.__own_lock = tree_lock is None
+        # semaphore bounding the builders compiling at once (pipelined batches), taken only around `make`
+        self.compile_slots = compile_slots
+
+        self.target_commit = None
+        self.commit_hash = None
+        self.renamed_tag = None
+        # environment of the build commands (reproducible mode), None inherits ours
+        self.env = None
+        self.source_date_epoch = None
+        # phases completed by this build (and the interrupted one it resumes)
+        self.checkpoint: Optional[Checkpoint] = None
+        self.resumed = False
+
+        self.planner = Planner(px4_dir)
+        self.info = None
+        self.overlay = None
+        self.result = BuildResult(status="failed")
+        self.__tree_modified = False
+
+    @contextmanager
+    def _phase(self, name: str):
+        """
+        Accumulates the wall-clock time and the child process resources of a build phase.
+        """
+        start = time.perf_counter()
+        try:
+            with account_rusage() as usage, log_phase(name):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.result.timings[name] = round(self.result.timings.get(name, 0.0) + elapsed, 3)
+            if usage.user_s or usage.system_s:
+                self.result.rusage.setdefault(name, Rusage()).add(usage)
+
+    @staticmethod
+    def _components(info) -> list[str]:
+        if info.components is None:
+            return []
+        return info.components if isinstance(info.components, list) else [info.components]
+
+    @staticmethod
+    def _tail(res: CommandResult) -> list[str]:
+        output = "\n".join(part for part in (res.stdout, res.stderr, res.error) if part)
+        return output.splitlines()[-50:]
+
+    def __validate_comps(self, components, comps_path: Path) -> bool:
+        files = {f.name for f in comps_path.glob('*') if f.is_file()}
+        missing = [comp for comp in components if comp not in files]
+
+        if missing:
+            raise ConfigurationError(f"Missing components {missing} in {comps_path.absolute()}")
+        return True
+
+    def _layout(self, info) -> Layout:
+        return {
+            "firmware": Layout(
+                ["bash", "./Tools/setup/ubuntu.sh", "--no-sim-tools"],
+                self.px4_dir / "boards" / info.vendor / info.model / f"{info.name}.px4board",
+                self.px4_dir / "ROMFS" / "px4fmu_common" / "init.d",
+                "[4000, 4999] Quadrotor x",
+                f"{info.vendor}_{info.model}_{info.name}"
+            ),
+            "sitl": Layout(
+                ["bash", "./Tools/setup/ubuntu.sh"],
+                self.px4_dir / "boards" / "px4" / "sitl" / f"{info.name}.px4board",
+                self.px4_dir / "ROMFS" / "px4fmu_common" / "init.d-posix",
+                "# [22000, 22999] Reserve for custom models",
+                f"px4_sitl_{info.name}"
+            )
+        }[self.options.build_type]
+
+    def _targets(self, info, layout: Layout) -> list[BoardTarget]:
+        """
+        Targets compiled for the airframe. A firmware gets one per board of info.toml,
+        `vendor`/`model` first.
+        """
+        if self.options.build_type != "firmware":
+            return [BoardTarget(layout.target, layout.px4board, info.name)]
+
+        boards = info.all_boards()
+        return [
+            BoardTarget(f"{vendor}_{model}_{info.name}",
+                        self.px4_dir / "boards" / vendor / model / f"{info.name}.px4board",
+                        f"{info.name}_{vendor}_{model}" if len(boards) > 1 else info.name)
+            for vendor, model in boards
+        ]
+
+    def _overlay(self, directory, info, layout: Layout) -> Overlay:
+        """
+        Files and CMake insertions staged into the PX4 tree for this airframe.
+        """
+        opts = self.options
+        overlay = Overlay()
+
+        dds_topics_file = getattr(directory, "dds_topics_file", None)
+        if dds_topics_file is None:
+            self.logger.debug("No custom dds_topics.yaml provided. Using PX4 default.")
+        else:
+            overlay.copies.append(OverlayCopy(
+                opts.path / dds_topics_file,
+                self.px4_dir / "src" / "modules" / "uxrce_dds_client" / "dds_topics.yaml",
+                replaces=True
+            ))
+
+        # the same board.modules on top of the defaults of every board
+        for board in self._targets(info, layout):
+            overlay.copies.append(OverlayCopy(opts.path / directory.modules_file, board.px4board))
+
+        airframes = layout.init_romfs_dir / "airframes"
+        cmake_airframes = airframes / "CMakeLists.txt"
+
+        airframe_file = f"{info.id}_{info.name}"
+        overlay.copies.append(OverlayCopy(opts.path / directory.params_file, airframes / airframe_file))
+        overlay.insertions.append(OverlayInsertion(cmake_airframes, layout.airframe_match, airframe_file))
+
+        if directory.params_post_file is not None:
+            airframe_post_file = f"{info.id}_{info.name}.post"
+            overlay.copies.append(OverlayCopy(opts.path / directory.params_post_file, airframes / airframe_post_file))
+            overlay.insertions.append(OverlayInsertion(cmake_airframes, layout.airframe_match, airframe_post_file))
+
+        components_insert_dir = self.px4_dir / "ROMFS" / "px4fmu_common" / "init.d"
+
+        if opts.comps is not None:
+            components = self._components(info)
+            if components and self.__validate_comps(components, opts.comps):
+                for component in components:
+                    overlay.copies.append(OverlayCopy(opts.comps / component, components_insert_dir / component))
+                overlay.insertions.append(OverlayInsertion(components_insert_dir / "CMakeLists.txt", "rcS", " ".join(components)))
+            else:
+                self.logger.warning(f"No components defined in {directory.info_file}, skipping components population.")
+        elif info.components is not None:
+            raise ConfigurationError(f"{directory.info_file} defines components but no --comps provided.")
+
+        return overlay
+
+    def __collect_inputs(self, directory, info) -> dict[str, Path]:
+        opts = self.options
+        inputs = {
+            directory.info_file: opts.path / directory.info_file,
+            directory.params_file: opts.path / directory.params_file,
+            directory.modules_file: opts.path / directory.modules_file,
+        }
+
+        for optional in (directory.params_post_file, getattr(directory, "dds_topics_file", None)):
+            if optional is not None:
+                inputs[optional] = opts.path / optional
+
+        if opts.comps is not None:
+            for component in self._components(info):
+                inputs[f"components/{component}"] = opts.comps / component
+
+        return inputs
+
+    def __hash_inputs(self, directory, info) -> dict[str, str]:
+        inputs = hash_inputs(self.__collect_inputs(directory, info))
+        if self.options.reproducible:
+            # not a file: switching the mode on or off needs a full build
+            inputs["reproducible"] = reproducible.profile()
+        return inputs
+
+    def __write_manifests(self, info, board: BoardTarget, inputs: dict[str, str], started: float,
+                          reuse: bool = False) -> None:
+        """
+        Manifest of a target in its build directory (and the output directory) and its artifacts.
+        The manifest of the first target is `result.manifest`, the artifacts of all targets add up.
+        """
+        opts = self.options
+        target = board.target
+        build_dir = self.px4_dir / "build" / target
+        primary = target == self.result.target
+
+        export = opts.output is not None and opts.build_type == "firmware"
+
+        if reuse:
+            # outputs of a previous build are reused, keep its manifest and only export
+            manifest = load_manifest(build_dir / MANIFEST_NAME)
+            artifacts = manifest.get("artifacts", [])
+            if primary:
+                self.result.manifest = build_dir / MANIFEST_NAME
+            if export:
+                output_file = opts.output / f"{board.output_name}.px4"
+                manifest["artifacts"] = artifacts = [store_artifact(build_dir / f"{target}.px4", output_file)]
+                manifest.pop("schema", None)
+                write_manifest(opts.output / f"{board.output_name}.manifest.json", manifest)
+                self.logger.info(f"firmware file in: {output_file}")
+            self.result.artifacts.extend(artifacts)
+            return
+
+        artifacts = []
+        if opts.build_type == "firmware":
+            firmware = build_dir / f"{target}.px4"
+            if export:
+                output_file = opts.output / f"{board.output_name}.px4"
+                artifacts.append(store_artifact(firmware, output_file))
+                self.logger.info(f"firmware file in: {output_file}")
+            else:
+                artifacts.append(describe_artifact(firmware))
+        elif (build_dir / "bin" / "px4").is_file():
+            artifacts.append(describe_artifact(build_dir / "bin" / "px4"))
+
+        manifest = {
+            "airframe": info.name,
+            "id": info.id,
+            "type": opts.build_type,
+            "target": target,
+            "px4_version": info.px4_version,
+            "px4_commit": info.px4_commit,
+            "custom_fw_version": info.custom_fw_version,
+            "commit": self.commit_hash,
+            "renamed_tag": renamed_tag_for(info),
+            "inputs": inputs,
+            "artifacts": artifacts,
+            "started_at": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+            "duration_s": round(time.time() - started, 3),
+        }
+        if opts.reproducible:
+            manifest["reproducible"] = {"source_date_epoch": self.source_date_epoch,
+                                        "verified": opts.verify_reproducible}
+
+        self.result.artifacts.extend(artifacts)
+        if primary:
+            self.result.manifest = build_dir / MANIFEST_NAME
+
+        write_manifest(build_dir / MANIFEST_NAME, manifest)
+        if export:
+            manifest_file = opts.output / f"{board.output_name}.manifest.json"
+            write_manifest(manifest_file, manifest)
+            self.logger.info(f"build manifest in: {manifest_file}")
+
+    def __restore(self) -> None:
+        self.logger.debug(f"PX4 Autopilot directory: {self.px4_dir}")
+        self.__tree_modified = True
+        restore_res = run_command(['git', 'restore', '.'], live=self.live, logger=self.logger, cwd=self.px4_dir)
+        if restore_res.returncode != 0:
+            raise GitError(f"Failed to restore repo: {restore_res.stderr}", self._tail(restore_res))
+
+    def __fetch(self, info) -> str:
+        self.logger.debug(f"Fetching PX4 tag: {info.px4_version}")
+        fetch_res = run_command(['git', 'fetch', 'origin', 'tag', info.px4_version], cwd=self.px4_dir)
+        if fetch_res.returncode != 0:
+            raise GitError(f"Failed to fetch tag {info.px4_version}", self._tail(fetch_res))
+
+        commit = self.planner.resolve(info)
+        if commit is None:
+            raise GitError(f"Tag {info.px4_version} not found after fetch.")
+        remember_tag(info.px4_version, commit)
+        return commit
+
+    def __checkout(self, ref: str) -> None:
+        self.logger.info(f"Checking out to: {ref}")
+        self.__tree_modified = True
+        git_checkout = run_command(['git', 'checkout', ref], cwd=self.px4_dir)
+        if git_checkout.returncode != 0:
+            raise GitError(
+                f"Failed to checkout to {ref}. Make sure is a valid px4 tag or commit.",
+                self._tail(git_checkout)
+            )
+
+    def __sync_submodules(self, resume: bool = False) -> None:
+        self.logger.info("Syncronizing submodules")
+        if resume:
+            # keep what the interrupted update already cloned
+            self.logger.info("Resuming the interrupted submodule update.")
+        else:
+            run_command(["git", "submodule", "deinit", "-f", "--all"], cwd=self.px4_dir)
+        run_command(["git", "submodule", "sync", "--recursive"], cwd=self.px4_dir)
+        run_command(["git", "submodule", "update", "--init", "--recursive"], cwd=self.px4_dir)
+
+    def __retag(self, info) -> None:
+        if not info.px4_commit:
+            self.logger.debug("px4_commit not provided. We are in a tagged commit.")
+            self.logger.debug(f"Removing original px4 tag: {info.px4_version}")
+            run_command(['git', 'tag', '-d', info.px4_version], cwd=self.px4_dir)
+
+        self.logger.debug(f"Re-tagging: {info.px4_version} -> {self.renamed_tag}")
+        run_command(['git', 'tag', '-f', self.renamed_tag], cwd=self.px4_dir, check=True)
+
+    def __check_tree(self, info, directory, layout: Layout, boards: list[BoardTarget], commit: str) -> None:
+        """
+        Checks boards, airframe id and dds_topics.yaml against the index of `commit`,
+        before the working tree is touched.
+        """
+        try:
+            index = load_tree_index(self.px4_dir, commit)
+        except ValueError as e:
+            raise GitError(str(e)) from e
+
+        problems = check_airframe(index, info,
+                                  [(board.px4board.parent.parent.name, board.px4board.parent.name) for board in boards],
+                                  layout.init_romfs_dir.name,
+                                  dds_topics=getattr(directory, "dds_topics_file", None) is not None)
+        if problems:
+            raise ConfigurationError(f"{directory.info_file} does not fit PX4 {info.px4_commit or info.px4_version} "
+                                     f"({commit[:12]}).", problems)
+
+    def __start_checkpoint(self, info, inputs: dict[str, str]) -> None:
+        """
+        Starts recording the completed phases. With --resume, continues those of the
+        interrupted build if it had the same inputs and the tree is still at its commit.
+        """
+        opts = self.options
+        key = fingerprint(type=opts.build_type, targets=self.result.targets, inputs=inputs,
+                          px4=info.px4_commit or info.px4_version, clean_run=opts.clean_run,
+                          install_dependencies=opts.install_dependencies, reproducible=opts.reproducible)
+
+        previous = Checkpoint.load(self.px4_dir) if opts.resume else None
+        if opts.resume:
+            if previous is None:
+                self.logger.info("No interrupted build to resume, starting from the beginning.")
+            elif previous.fingerprint != key:
+                self.logger.info("The interrupted build had other inputs, starting from the beginning.")
+            elif previous.commit is not None and git(self.px4_dir, "rev-parse", "HEAD") != previous.commit:
+                self.logger.info("The PX4 tree moved since the interrupted build, starting from the beginning.")
+            else:
+                self.resumed = True
+                self.logger.info(f"Resuming the interrupted build, done: {', '.join(previous.phases) or 'nothing'}")
+
+        if self.resumed:
+            self.checkpoint = previous
+        else:
+            self.checkpoint = Checkpoint(checkpoint_file(self.px4_dir), key)
+            self.checkpoint.save()
+
+    def __setup_git(self, info, plan: BuildPlan, check: Callable[[str], None]) -> None:
+        """
+        Brings the PX4 tree to the target commit, running only the steps the plan requires.
+        `check` validates the airframe against a commit only known after the fetch, before the checkout.
+        """
+        if info.px4_commit:
+            self.logger.info("Found 'px4_commit'. Note that 'px4_commit' takes precedence over 'px4_version'. In this case 'px4_version' is used solely for annotation purposes and does not represent a tagged version of PX4.")
+
+        if plan.needs("restore"):
+            self.__restore()
+
+        commit = plan.target_commit
+        if plan.needs("fetch"):
+            commit = self.__fetch(info)
+            check(commit)
+
+        if not info.px4_commit and commit is not None and load_tags_cache().get(info.px4_version) != commit:
+            # the release tag is deleted by the re-tagging, later builds resolve it from the cache
+            remember_tag(info.px4_version, commit)
+
+        self.target_commit = info.px4_commit or commit
+
+        if plan.needs("checkout"):
+            self.__checkout(self.target_commit)
+
+        if plan.needs("submodules"):
+            self.__sync_submodules(resume=self.resumed)
+
+        self.commit_hash = run_command(['git', 'rev-parse', 'HEAD'], cwd=self.px4_dir).stdout.strip()
+        self.logger.debug(f"Saving commit_hash: {self.commit_hash}")
+        self.result.commit = self.commit_hash
+
+        self.renamed_tag = renamed_tag_for(info)
+        if plan.needs("tag"):
+            self.__retag(info)
+
+    def __make_romfs(self, target: str, live: bool) -> CommandResult:
+        """
+        Incremental build of an already configured target after a ROMFS-only change.
+        """
+        build_dir = self.px4_dir / "build" / target
+
+        if self.options.build_type == "sitl":
+            # SITL reads its ROMFS from build/<target>/etc, the binary does not need a relink
+            res = run_command(["cmake", "--build", str(build_dir), "--target", "romfs_gen_files_target"],
+                              live=live, logger=self.logger, cwd=self.px4_dir, env=self.env)
+            if res.returncode == 0:
+                return res
+            self.logger.warning("ROMFS target not available, falling back to an incremental build.")
+
+        # NuttX embeds the ROMFS in the image: regenerate it, relink and repackage
+        return run_command(["cmake", "--build", str(build_dir)], live=live, logger=self.logger, cwd=self.px4_dir, env=self.env)
+
+    def __analyze_size(self, info, board: BoardTarget, prefix: str = "") -> None:
+        """
+        Flash/RAM usage of the firmware against the board limit and the previous build of the airframe.
+        """
+        target = board.target
+        build_dir = self.px4_dir / "build" / target
+        if not (build_dir / f"{target}.elf").is_file():
+            self.logger.debug(f"No {target}.elf, skipping size analysis.")
+            return
+
+        try:
+            report = analyze(build_dir, target, info.name, self.commit_hash, board_dir=board.px4board.parent)
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            self.logger.warning(f"{prefix}Size analysis failed: {e}")
+            return
+
+        if target == self.result.target:
+            self.result.size = report
+        self.logger.info(f"{prefix}size: {report.describe()}")
+
+        percent = report.flash_percent
+        if percent is not None and percent >= 100.0:
+            self.logger.error(f"{prefix}Firmware exceeds the flash of the board by {report.flash - report.flash_limit} B.")
+        elif percent is not None and percent >= 95.0:
+            self.logger.warning(f"{prefix}Firmware uses {percent:.1f}% of the flash of the board.")
+
+        previous = record(report)
+        if previous is not None:
+            for line in deltas(report, previous):
+                self.logger.info(f"{prefix}size change since {(previous.get('commit') or 'unknown')[:12]}: {line}")
+
+    def __check_dds_bandwidth(self, directory) -> None:
+        """
+        Estimated link bandwidth of the custom dds_topics.yaml against the budgets.
+        """
+        opts = self.options
+        try:
+            bandwidth = estimate((opts.path / directory.dds_topics_file).read_text(encoding="utf-8"),
+                                 read_msgs(self.px4_dir, self.commit_hash), dict(opts.dds_rate))
+        except (OSError, ValueError) as e:
+            if opts.dds_budget_fail:
+                raise ConfigurationError(f"Cannot estimate the DDS bandwidth: {e}") from e
+            self.logger.warning(f"Cannot estimate the DDS bandwidth: {e}")
+            return
+
+        self.result.dds_bandwidth = {direction: bandwidth.total(direction) for direction in ("out", "in")}
+        self.logger.info(f"dds: out {bandwidth.total('out') / 1000:.1f} kB/s, in {bandwidth.total('in') / 1000:.1f} kB/s "
+                         f"({len(bandwidth.topics)} topics)")
+
+        problems = bandwidth.over_budget({"out": opts.dds_budget_out, "in": opts.dds_budget_in})
+        if problems and opts.dds_budget_fail:
+            raise ConfigurationError("DDS bandwidth over budget.", problems)
+        for problem in problems:
+            self.logger.warning(problem)
+
+    def __make(self, opts, scope: str, target: str, overlay: Overlay,
+               live: bool, jobs: Optional[int] = None, env: Optional[dict] = None) -> None:
+        """
+        Compiles one target: a full `make`, or only the ROMFS when nothing else changed.
+        `jobs` is passed to the PX4 Makefile as `j=`, the parallelism of ninja.
+        """
+        build_dir = self.px4_dir / "build" / target
+        env = env if env is not None else self.env
+
+        if opts.reproducible and build_dir.exists() and not reproducible.configured_reproducibly(build_dir, self.px4_dir):
+            # CMake only reads the flags of the environment when it configures the build directory
+            self.logger.info(f"{target} was not configured for reproducible builds, rebuilding it from scratch.")
+            shutil.rmtree(build_dir)
+            scope = MAKE_FULL
+
+        if scope == MAKE_ROMFS:
+            self.logger.info(f"Only startup scripts changed, rebuilding ROMFS and packaging of {target}.")
+            build_px4 = self.__make_romfs(target, live)
+        else:
+            cmd = ["make", target] + ([f"j={jobs}"] if jobs is not None else [])
+            build_px4 = run_command(cmd, live=live, logger=self.logger, cwd=self.px4_dir, env=env)
+
+        if build_px4.returncode != 0:
+            raise CompilationError(f"Build failed for {target}.", self._tail(build_px4))
+
+        if opts.reproducible:
+            reproducible.mark_configured(build_dir, self.px4_dir)
+            if opts.build_type == "firmware":
+                reproducible.normalize_px4(build_dir / f"{target}.px4", self.source_date_epoch)
+
+        with (build_dir / STAGED_NAME).open("w", encoding="utf-8") as f:
+            json.dump(overlay.snapshot(), f, indent=2)
+        self.checkpoint.complete(f"make {target}")
+
+    def __artifact(self, target: str) -> Path:
+        build_dir = self.px4_dir / "build" / target
+        return build_dir / f"{target}.px4" if self.options.build_type == "firmware" else build_dir / "bin" / "px4"
+
+    def __verify_reproducible(self, opts, targets: list[str], overlay: Overlay) -> None:
+        """
+        Builds every target a second time from scratch, without ccache, and compares the artifacts.
+        The first build is kept next to the second one when they differ.
+        """
+        env = reproducible.reproducible_env(self.px4_dir, self.source_date_epoch, ccache=False)
+        differences = []
+        for target in targets:
+            build_dir = self.px4_dir / "build" / target
+            first = build_dir.with_name(f"{target}.first")
+            if self.resumed and first.is_dir() and build_dir.is_dir():
+                # the interrupted build was already rebuilding it, the first build is set aside
+                self.logger.info(f"Resuming the rebuild of {target}")
+            else:
+                shutil.rmtree(first, ignore_errors=True)
+                build_dir.rename(first)
+
+            self.logger.info(f"Rebuilding {target} from scratch to verify it is reproducible")
+            self.__make(opts, MAKE_FULL, target, overlay, live=self.live, env=env)
+
+            artifact = self.__artifact(target)
+            difference = reproducible.compare_artifacts(first / artifact.relative_to(build_dir), artifact)
+            if difference is None:
+                shutil.rmtree(first)
+                self.checkpoint.complete(f"verify {target}")
+                self.logger.info(f"{target} is reproducible: {artifact.name} is identical after a clean rebuild")
+            else:
+                differences.append(f"{target}: {difference} (first build kept in {first})")
+
+        if differences:
+            raise ReproducibilityError("Rebuilding from the same inputs produced different artifacts.", differences)
+
+    def __compile(self, opts, plans: dict[str, BuildPlan], targets: list[str], overlay: Overlay) -> None:
+        """
+        Compiles the targets. Several targets (multi-board firmware) are compiled
+        concurrently, sharing `cpu_budget` cores between the `board_jobs` running at once.
+        """
+        self.logger.info(f"Building firmware for target {', '.join(targets)}")
+        ccache_before = ccache_stats()
+
+        with self._phase("make"):
+            if opts.clean_run and self.checkpoint.done("clean"):
+                self.logger.info("The interrupted build already cleaned, continuing its make.")
+            elif opts.clean_run and any(plans[target].make_scope == MAKE_FULL for target in targets):
+                self.logger.info("Make clean build")
+                run_command(["make", "clean"], live=self.live, logger=self.logger, cwd=self.px4_dir, env=self.env)
+                self.checkpoint.complete("clean")
+
+            if len(targets) == 1:
+                self.__make(opts, plans[targets[0]].make_scope, targets[0], overlay, live=self.live)
+            else:
+                self.__make_concurrently(opts, plans, targets, overlay)
+
+        ccache = ccache_delta(ccache_before, ccache_stats())
+        if ccache is not None:
+            self.result.cache["ccache"] = ccache
+
+    def __make_concurrently(self, opts, plans: dict[str, BuildPlan], targets: list[str], overlay: Overlay) -> None:
+        workers = min(opts.board_jobs or len(targets), len(targets))
+        jobs = max(1, (opts.cpu_budget or os.cpu_count() or 1) // workers)
+        self.logger.info(f"Compiling {len(targets)} targets, {workers} at once with j={jobs}")
+
+        def compile_target(target: str) -> tuple[Rusage, float]:
+            start = time.perf_counter()
+            # the child processes of a worker thread are only accounted in that thread
+            with account_rusage() as usage, log_phase(f"make {target}"):
+                self.__make(opts, plans[target].make_scope, target, overlay, live=False, jobs=jobs)
+            return usage, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {target: pool.submit(compile_target, target) for target in targets}
+
+        failed = []
+        for target, future in futures.items():
+            try:
+                usage, elapsed = future.result()
+            except CompilationError as e:
+                failed.append((target, e.tail))
+                continue
+            self.result.rusage.setdefault("make", Rusage()).add(usage)
+            self.logger.info(f"{target} compiled in {elapsed:.1f}s")
+
+        if failed:
+            raise CompilationError(f"Build failed for {', '.join(target for target, _ in failed)}.", failed[0][1])
+
+    @staticmethod
+    def __describe(plan: BuildPlan, plans: dict[str, BuildPlan]) -> list[str]:
+        """
+        Steps of the plan, with the make step of every target when there are several.
+        """
+        if len(plans) == 1:
+            return plan.describe()
+
+        lines = [line for line in plan.describe() if not line[5:].startswith("make ")]
+        for target, target_plan in plans.items():
+            for step in target_plan.steps:
+                if step.name == "make" or target_plan.up_to_date:
+                    lines.append(f"{'run ' if step.needed else 'skip'} {'make':<10} {target}: {step.reason}")
+                    break
+        return lines
+
+    def __copy_msgs(self) -> None:
+        msgs_output = self.options.msgs_output
+
+        self.logger.info("Copying msg/ and srv/ from firmware.")
+        self.logger.debug(f"Checking for msg/ and srv/ in {msgs_output}")
+        msg_src = self.px4_dir / "msg"
+        msg_versioned_src = self.px4_dir / "msg/versioned"
+        srv_src = self.px4_dir / "srv"
+        msg_dst = msgs_output / "msg"
+        srv_dst = msgs_output / "srv"
+
+        if msg_dst.exists() and msg_dst.exists():
+            self.logger.debug("Found msg and srv directories. Deleting ...")
+            shutil.rmtree(msg_dst)
+            shutil.rmtree(srv_dst)
+        else:
+            self.logger.warning(f"The provided directory {msgs_output} does not seem to contain the folders 'msg' and 'srv'.")
+            self.logger.warning("This may be intentional, or you may not be copying the files to the intended directory (usually to px4_msgs).")
+
+        self.logger.debug("Creating empty version of msg and srv directories.")
+        msg_dst.mkdir(parents=True, exist_ok=True)
+        srv_dst.mkdir(parents=True, exist_ok=True)
+
+        self.logger.debug(f"Copying *.msg and *.srv into {msgs_output}...")
+        for file in msg_src.glob("*.msg"):
+            shutil.copy(file, msg_dst)
+        for file in msg_versioned_src.glob("*.msg"):
+            shutil.copy(file, msg_dst)
+        for file in srv_src.glob("*.srv"):
+            shutil.copy(file, srv_dst)
+
+    def run(self) -> BuildResult:
+        """
+        Runs the build.
+
+        Returns:
+            BuildResult of the build.
+
+        Raises:
+            EasyPX4Error (or subclass) on failure, with `result` attached.
+        """
+        self.result.started_at = time.time()
+        try:
+            result = self.__run()
+            if result.status in ("success", "up-to-date"):
+                self.__track_usage()
+            return result
+        except EasyPX4Error as e:
+            self.result.status = "failed"
+            self.result.error = str(e)
+            self.result.tail = e.tail
+            e.result = self.result
+            raise
+        finally:
+            self.result.finished_at = time.time()
+            if self.options.metrics_dir is not None and self.result.status != "planned":
+                self.__export_metrics()
+
+    def __track_usage(self) -> None:
+        """
+        Records the use of the build directories and keeps all of them within the gc quota.
+        """
+        build_dirs = [self.px4_dir / "build" / target for target in self.result.targets]
+        try:
+            record_use(*(path for path in build_dirs if path.is_dir()))
+            if self.options.gc_quota is not None:
+                # the targets of this build are protected by its lock
+                with self._phase("gc"):
+                    collect(self.options.gc_quota, logger=self.logger)
+        except OSError as e:
+            self.logger.warning(f"Build directory collection failed: {e}")
+
+    def __export_metrics(self) -> None:
+        info = self.info
+        airframe = info.name if info is not None else self.options.path.name
+        px4_version = (info.px4_commit or info.px4_version) if info is not None else "unknown"
+        try:
+            path = write_metrics(self.options.metrics_dir, self.result, airframe, px4_version)
+            self.logger.debug(f"Metrics written to {path}")
+        except OSError as e:
+            self.logger.warning(f"Failed to write metrics: {e}")
+
+    def __run(self) -> BuildResult:
+        opts = self.options
+        started = self.result.started_at
+
+        with self._phase("load"):
+            self.logger.debug(f"Loading directory {opts.path} as {opts.build_type}")
+            try:
+                directory = load_directory(opts.path, opts.build_type)
+            except (FileNotFoundError, KeyError, TypeError, ValueError) as e:
+                raise ConfigurationError(f"Invalid airframe directory {opts.path}: {e}") from e
+
+            info = directory.get_info()
+            if opts.px4_version is not None or opts.px4_commit is not None:
+                info = replace(info,
+                               px4_version=opts.px4_version or info.px4_version,
+                               px4_commit=opts.px4_commit)
+            self.logger.debug(f"Info: {info}")
+            self.info = info
+
+        layout = self._layout(info)
+        boards = self._targets(info, layout)
+        target = layout.target
+        self.result.target = target
+        self.result.targets = [board.target for board in boards]
+
+        if self.__own_lock and not opts.dry_run:
+            with self._phase("lock"):
+                self.tree_lock = TreeLock(self.px4_dir, f"build {target}", timeout=opts.lock_timeout, logger=self.logger,
+                                          targets=self.result.targets)
+                self.tree_lock.acquire()
+
+        if opts.msgs_output and not opts.dry_run:
+            with self._phase("msgs"):
+                self.__copy_msgs()
+
+        if opts.skip_compilation:
+            self.logger.info("Found --skip-compilation. Skipping...")
+            self.result.status = "skipped"
+            return self.result
+
+        # an interrupted build leaves its build directories behind
+        if not opts.overwrite and not opts.resume and all((self.px4_dir / "build" / board.target).exists() for board in boards):
+            self.logger.info(f"Target {', '.join(self.result.targets)} already built. Use --overwrite to rebuild.")
+            self.result.status = "up-to-date"
+            return self.result
+
+        with self._phase("plan"):
+            overlay = self.overlay = self._overlay(directory, info, layout)
+            inputs = self.__hash_inputs(directory, info)
+            plans = {
+                board.target: self.planner.plan(info, renamed_tag_for(info), overlay, board.target, inputs,
+                                                clean_run=opts.clean_run, force=opts.force)
+                for board in boards
+            }
+            pending = [board.target for board in boards if not plans[board.target].up_to_date]
+            # the git and staging steps are shared, taken from a target that needs building
+            plan = plans[pending[0] if pending else target]
+            self.result.plan = self.__describe(plan, plans)
+            for step in ("checkout", "submodules"):
+                hit = not plan.needs(step)
+                self.result.cache[step] = {"hits": int(hit), "misses": int(not hit)}
+
+        for line in self.result.plan:
+            self.logger.info(f"plan: {line}")
+
+        def check(commit: str) -> None:
+            with self._phase("check"):
+                self.__check_tree(info, directory, layout, boards, commit)
+
+        if plan.target_commit is not None:
+            check(plan.target_commit)
+
+        if opts.dry_run:
+            self.logger.info("Found --dry-run. Nothing was executed.")
+            self.result.status = "planned"
+            self.result.commit = plan.target_commit
+            return self.result
+
+        if not pending:
+            self.logger.info(f"Target {', '.join(self.result.targets)} is up to date.")
+            self.result.status = "up-to-date"
+            self.result.commit = self.commit_hash = plan.target_commit
+            with self._phase("output"):
+                for board in boards:
+                    self.__write_manifests(info, board, inputs, started, reuse=True)
+            return self.result
+
+        self.__start_checkpoint(info, inputs)
+
+        with self._phase("git"), self.git_lock:
+            self.__setup_git(info, plan, check)
+        self.checkpoint.complete("git", commit=self.commit_hash)
+
+        if opts.reproducible:
+            self.source_date_epoch = reproducible.source_date_epoch(self.px4_dir, self.commit_hash)
+            self.env = reproducible.reproducible_env(self.px4_dir, self.source_date_epoch)
+            self.logger.info(f"Reproducible build: SOURCE_DATE_EPOCH={self.source_date_epoch}, "
+                             f"{self.px4_dir} mapped to {reproducible.PREFIX}")
+
+        if getattr(directory, "dds_topics_file", None) is not None:
+            with self._phase("dds"):
+                self.__check_dds_bandwidth(directory)
+
+        if opts.install_dependencies and self.checkpoint.done("installer"):
+            self.logger.info("PX4 dependencies were installed by the interrupted build.")
+        elif opts.install_dependencies:
+            with self._phase("installer"):
+                self.logger.info("Installing PX4 dependencies...")
+                tooling = run_command(layout.tooling_cmd, live=self.live, logger=self.logger, cwd=self.px4_dir)
+                if tooling.returncode != 0:
+                    raise DependencyError("Failed to install dependencies.", self._tail(tooling))
+            self.checkpoint.complete("installer")
+
+        # the overlay is the same for every target, any of them has the mtimes of the last staging
+        staged_file = self.px4_dir / "build" / pending[0] / STAGED_NAME
+
+        with self._phase("staging"):
+            if plan.needs("staging") or not overlay.is_applied():
+                self.__tree_modified = True
+                overlay.apply(self.logger)
+                if staged_file.is_file():
+                    with staged_file.open("r", encoding="utf-8") as f:
+                        overlay.restore_mtimes(json.load(f))
+
+        compiled = [target for target in pending if self.checkpoint.done(f"make {target}")]
+        if compiled:
+            self.logger.info(f"Already compiled by the interrupted build: {', '.join(compiled)}")
+        to_make = [target for target in pending if target not in compiled]
+        to_verify = [target for target in pending if not self.checkpoint.done(f"verify {target}")]
+
+        if self.compile_slots is not None:
+            with self._phase("queue"):
+                self.compile_slots.acquire()
+        try:
+            if to_make:
+                self.__compile(opts, plans, to_make, overlay)
+            if opts.verify_reproducible and to_verify:
+                with self._phase("verify"):
+                    self.__verify_reproducible(opts, to_verify, overlay)
+        finally:
+            if self.compile_slots is not None:
+                self.compile_slots.release()
+
+        self.result.status = "success"
+
+        if opts.build_type == "firmware":
+            with self._phase("size"):
+                for board in boards:
+                    if board.target in pending:
+                        self.__analyze_size(info, board, prefix=f"{board.target}: " if len(boards) > 1 else "")
+
+        with self._phase("output"):
+            for board in boards:
+                self.__write_manifests(info, board, inputs, started, reuse=board.target not in pending)
+        self.checkpoint.remove()
+
+        self.logger.debug(f"Phase timings: {self.result.timings}")
+        for name, usage in self.result.rusage.items():
+            wall_s = self.result.timings.get(name, 0.0)
+            self.logger.info(f"{name}: {wall_s:.1f}s wall, {usage.describe()}",
+                             extra={"phase": name, "fields": {"wall_s": wall_s, **asdict(usage)}})
+        self.logger.info("Done.", extra={"fields": {"status": self.result.status, "target": target,
+                                                     "commit": self.commit_hash, "timings": self.result.timings}})
+        return self.result
+
+    def cleanup(self) -> None:
+        """
+        Removes the custom tag and restores the PX4 tree.
+        """
+        try:
+            with self.git_lock:
+                restore_tree(self.px4_dir, self.renamed_tag, restore=self.__tree_modified, logger=self.logger)
+        finally:
+            # the tree is only handed over to the next job once it is restored
+            if self.__own_lock and self.tree_lock is not None:
+                self.tree_lock.release()
+        self.renamed_tag = None
+        self.__tree_modified = False
+
+
+def restore_tree(px4_dir: Path, renamed_tag: Optional[str] = None, restore: bool = True, logger=None) -> None:
+    """
+    Removes the custom tag and restores the files modified by easy_px4 in the PX4 tree.
+    """
+    logger = logger if logger is not None else get_logger("build")
+
+    if renamed_tag is not None:
+        logger.debug("Restoring tags.")
+        logger.debug(f"Deleting {renamed_tag}")
+        run_command(['git', 'tag', '-d', renamed_tag], cwd=px4_dir, check=True)
+
+    if restore:
+        run_command(['git', 'restore', '.'], cwd=px4_dir, check=True)
+
+
+def build(path: Union[str, Path], build_type: str = "firmware", logger=None, **options) -> BuildResult:
+    """
+    Builds an airframe directory in-process and returns a structured result.
+
+    Args:
+    - path: airframe directory (info.toml, params.airframe, ...).
+    - build_type: "firmware" or "sitl".
+    - logger: optional logger, defaults to the easy_px4 "build" logger.
+    - **options: any other field of `BuildOptions` (comps, output, clean_run, overwrite, ...).
+
+    Raises:
+        EasyPX4Error (or subclass). The partial `BuildResult` is available as `error.result`.
+    """
+    builder = Builder(BuildOptions(build_type=build_type, path=path, **options), logger=logger)
+    try:
+        return builder.run()
+    finally:
+        builder.cleanup()
@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .paths import STATE_DIR
+
+# progress of the last build per PX4 tree (<tree key>.json)
+CHECKPOINTS_DIR = STATE_DIR / "checkpoints"
+CHECKPOINT_SCHEMA = 1
+
+
+def fingerprint(**parts) -> str:
+    """
+    Identifies a build: everything that makes its phases produce a different tree or artifacts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def checkpoint_file(tree: Path) -> Path:
+    key = hashlib.sha1(str(Path(tree).resolve()).encode()).hexdigest()[:16]
+    return CHECKPOINTS_DIR / f"{key}.json"
+
+
+@dataclass
+class Checkpoint:
+    """
+    Phases a build of `fingerprint` completed in a PX4 tree, and the commit the tree was at.
+
+    Written after every phase, removed when the build succeeds. A `--resume`
+    run with the same fingerprint continues after the completed phases.
+    """
+    path: Path
+    fingerprint: str
+    phases: list[str] = field(default_factory=list)
+    commit: Optional[str] = None
+    updated: Optional[str] = None
+    # concurrently compiled targets complete their phase from worker threads
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @classmethod
+    def load(cls, tree: Path) -> Optional["Checkpoint"]:
+        path = checkpoint_file(tree)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.pop("schema", None) != CHECKPOINT_SCHEMA:
+                return None
+            return cls(path=path, **data)
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+
+    def done(self, phase: str) -> bool:
+        return phase in self.phases
+
+    def complete(self, phase: str, commit: Optional[str] = None) -> None:
+        with self._lock:
+            if phase not in self.phases:
+                self.phases.append(phase)
+            if commit is not None:
+                self.commit = commit
+            self.save()
+
+    def save(self) -> None:
+        self.updated = datetime.now(timezone.utc).isoformat()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with temp.open("w", encoding="utf-8") as f:
+            json.dump({"schema": CHECKPOINT_SCHEMA, "fingerprint": self.fingerprint, "phases": self.phases,
+                       "commit": self.commit, "updated": self.updated}, f, indent=2)
+        temp.replace(self.path)
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -1,14 +1,14 @@
 import sys
-import shutil
-import subprocess
-from pathlib import Path
 from argparse import ArgumentParser, Namespace
 
-from easy_px4_utils import load_directory, valid_dir_path
+from easy_px4_utils import valid_dir_path
 
 from .command import Command
-from ..paths import PX4_DIR
-from ..runner import run_command
+from ..builder import BUILD_TYPES, Builder, BuildOptions
+from ..matrix import MatrixBuilder
+from ..dds import bandwidth, topic_rate
+from ..errors import EasyPX4Error
+from ..gc import GC_QUOTA_ENV, disk_size
 
 
 class BuildCommand(Command):
@@ -24,16 +24,12 @@ class BuildCommand(Command):
     """
     cmd_name = "build"
 
-    BUILD_TYPES = [
-        "firmware",
-        "sitl"
-    ]
+    BUILD_TYPES = BUILD_TYPES
 
     def __init__(self) -> None:
         super().__init__()
-        self.target_commit = None
-        self.commit_hash = None
-        self.renamed_tag = None
+        self.builder = None
+        self.matrix = None
 
     def add_arguments(self, parser: ArgumentParser) -> None:
 
@@ -55,15 +51,16 @@ class BuildCommand(Command):
 
         parser.add_argument("--output",
                             type=valid_dir_path,
-                            help="Output directory (firmware only).")
+                            help="Output directory (firmware only). Firmware files are read-only hardlinks into the "
+                                 "artifact store: replace them instead of editing them in place.")
 
         parser.add_argument("--dry-run",
                             action="store_true",
-                            help="Run build without actually building anything (for testing)")
+                            help="Print the build plan (which steps the current PX4 tree already satisfies) without executing anything.")
 
         parser.add_argument("--clean-run",
                             action="store_true",
-                            help="Clean build artifacts before build.")
+                            help="Clean build artifacts before a full build. Changes limited to params and components only rebuild the ROMFS.")
 
         parser.add_argument("--install-dependencies",
                             action="store_true",
@@ -73,6 +70,15 @@ class BuildCommand(Command):
                             action="store_true",
                             help="Overwrite existing build if present.")
 
+        parser.add_argument("--force",
+                            action="store_true",
+                            help="Run every build step, even the ones the planner considers satisfied.")
+
+        parser.add_argument("--resume",
+                            action="store_true",
+                            help="Continue an interrupted build of the same inputs after its completed phases "
+                                 "(checkout, submodules, dependencies, clean, compiled boards) instead of starting over.")
+
         parser.add_argument("--skip-compilation",
                             action="store_true",
                             help="Skip compilation step on PX4. Useful to pull out just the msgs.")
@@ -85,241 +91,98 @@ class BuildCommand(Command):
                             action="store_true",
                             help="Check that parameters have correct default values.")
 
+        parser.add_argument("--metrics-dir",
+                            type=valid_dir_path,
+                            help="Write build metrics (Prometheus/node-exporter textfile format) to this directory "
+                                 "after the build. Defaults to $EASY_PX4_METRICS_DIR.")
+
+        parser.add_argument("--lock-timeout",
+                            type=float,
+                            help="Seconds to wait for other easy_px4 jobs using the same PX4 tree (default: wait forever).")
+
+        parser.add_argument("--dds-budget-out",
+                            type=bandwidth,
+                            help="Warn when the estimated uXRCE-DDS bandwidth from the flight controller of a custom "
+                                 "dds_topics.yaml exceeds this many bytes/s (e.g. 40k).")
+
+        parser.add_argument("--dds-budget-in",
+                            type=bandwidth,
+                            help="Same as --dds-budget-out for the topics sent to the flight controller.")
+
+        parser.add_argument("--dds-rate",
+                            type=topic_rate,
+                            action="append",
+                            default=[],
+                            metavar="TOPIC=HZ",
+                            help="Rate of a topic for the bandwidth estimate, overriding its rate_limit. Repeatable.")
+
+        parser.add_argument("--dds-budget-fail",
+                            action="store_true",
+                            help="Fail the build when a DDS bandwidth budget is exceeded.")
 
-    def __prepend_insertion(self, file: Path, match: str, insert: str):
-
-        if not file.is_file():
-            self.logger.error(f"Invalid file path: {file}")
-            sys.exit(1)
-
-        temp = file.parent / f"{file.stem}.tmp"
-
-        with file.open("r") as infile, temp.open("w") as outfile:
-            for line in infile:
-                if match in line:
-                    outfile.write(insert + '\n')
-                outfile.write(line)
-
-        temp.replace(file)
-
-
-    def __validate_comps(self, components, comps_path: Path) -> bool:
-        files = {f.name for f in comps_path.glob('*') if f.is_file()}
-        missing = [comp for comp in components if comp not in files]
-
-        if missing:
-            self.logger.error(f"Missing components {missing} in {comps_path.absolute()}")
-            sys.exit(1)
-        return True
-
-    def __copy_dds_topics(self, directory, settings_path: Path) -> None:
-        dds_topics_file = getattr(directory, "dds_topics_file", None)
-
-        if dds_topics_file is None:
-            self.logger.debug("No custom dds_topics.yaml provided. Using PX4 default.")
-            return
-
-        source = settings_path / dds_topics_file
-        target = PX4_DIR / Path("src/modules/uxrce_dds_client/dds_topics.yaml")
-
-        if not target.is_file():
-            self.logger.error(
-                f"PX4 dds_topics.yaml target does not exist: {target}. "
-                "The selected PX4 version may have changed the uXRCE-DDS path."
-            )
-            sys.exit(1)
-
-        self.logger.info(f"Applying custom DDS topics: {source} -> {target}")
-        shutil.copy2(source, target)
-
-    def __setup_git(self, info) -> None:
-
-        self.logger.debug(f"PX4 Autopilot directory: {PX4_DIR}")
-
-        restore_res = run_command(['git', 'restore', '.'], live=True, logger=self.logger, cwd=PX4_DIR)
-        if restore_res.returncode != 0:
-            self.logger.error(f"Failed to restore repo: {restore_res.stderr}. {restore_res.stdout}")
-            sys.exit(1)
-
-        if info.px4_commit:
-            self.logger.info("Found 'px4_commit'. Note that 'px4_commit' takes precedence over 'px4_version'. In this case 'px4_version' is used solely for annotation purposes and does not represent a tagged version of PX4.")
-
-            self.target_commit = info.px4_commit
-        else:
-            self.logger.debug(f"Fetching PX4 tag: {info.px4_version}")
-            fetch_res = run_command(['git', 'fetch', 'origin', 'tag', info.px4_version], cwd=PX4_DIR)
-            if fetch_res.returncode != 0:
-                self.logger.error(f"Failed to fetch tag {info.px4_version}: {fetch_res.stderr}, {fetch_res.stdout}")
-                sys.exit(1)
-
-            self.target_commit = info.px4_version
-
-        self.logger.info(f"Checking out to: {self.target_commit}")
-        git_checkout = run_command(['git', 'checkout', self.target_commit], cwd=PX4_DIR)
-        if git_checkout.returncode != 0:
-            self.logger.error(f"Failed to checkout to {self.target_commit}. Make sure is a valid px4 tag or commit. {git_checkout.stderr}")
-            sys.exit(1)
-
-        self.logger.info("Syncronizing submodules")
-        run_command(["git", "submodule", "deinit", "-f", "--all"], cwd=PX4_DIR)
-        run_command(["git", "submodule", "sync", "--recursive"], cwd=PX4_DIR)
-        run_command(["git", "submodule", "update", "--init", "--recursive"], cwd=PX4_DIR)
-
-        # self.commit_hash = run_command(['git', 'rev-list', '-n', '1', self.target_commit], cwd=PX4_DIR).stdout
-        # self.logger.debug(f"Saving commit_hash: {self.commit_hash}")
-
-        if not info.px4_commit:
-            self.logger.debug(f"px4_commit not provided. We are in a tagged commit.")
-            self.logger.debug(f"Removing original px4 tag: {info.px4_version}")
-            run_command(['git', 'tag', '-d', info.px4_version], cwd=PX4_DIR, check=True)
+        parser.add_argument("--board-jobs",
+                            type=int,
+                            help="Boards of a multi-board firmware (`boards` in info.toml) compiled at once "
+                                 "(default: all of them).")
 
-        self.logger.debug(f"Re-tagging to add custom version")
+        parser.add_argument("--cpu-budget",
+                            type=int,
+                            help="CPU cores shared by the boards compiled at once, each gets an equal share "
+                                 "(default: CPU count).")
 
-        # =====================================================================================
-        # Hacky way (for now) to make the tags work without changing the PX4 source code
-        # or maybe I should start a conversation with PX4 to see what can we do ?
-        px4_split = info.px4_version.split("-")
+        parser.add_argument("--reproducible",
+                            action="store_true",
+                            help="Pin the build environment (SOURCE_DATE_EPOCH of the PX4 commit, source path prefix, "
+                                 "locale, time zone) so identical inputs produce identical artifacts on any host.")
 
-        if len(px4_split) > 1:
-            px4_version = px4_split[0]
-            px4_release = px4_split[1]
-            self.renamed_tag = f"{px4_version}-{info.custom_fw_version.split('-')[0]}-{px4_release}"
-        else:
-            self.renamed_tag = f"{px4_split[0]}-{info.custom_fw_version.split('-')[0]}"
-        # =====================================================================================
+        parser.add_argument("--verify-reproducible",
+                            action="store_true",
+                            help="Like --reproducible, then rebuild from scratch without ccache and fail if the "
+                                 "artifacts differ.")
 
-        self.logger.debug(f"Re-tagging: {info.px4_version} -> {self.renamed_tag}")
+        parser.add_argument("--gc-quota",
+                            type=disk_size,
+                            help="After the build, remove the least recently used PX4 build directories until all of "
+                                 f"them fit in this size, e.g. 50G (default: ${GC_QUOTA_ENV}, no limit).")
 
-        run_command(['git', 'tag', self.renamed_tag], cwd=PX4_DIR, check=True)
+        parser.add_argument("--px4-versions",
+                            nargs="+",
+                            metavar="VERSION",
+                            help="Build against several PX4 release tags or commits (overriding info.toml), "
+                                 "each in its own cached worktree, and print a summary table.")
 
+        parser.add_argument("--jobs", "-j",
+                            type=int,
+                            help="Versions compiling at once with --px4-versions, the next one prepares its worktree meanwhile (default: all).")
 
     def execute(self, args: Namespace) -> None:
-
-        self.logger.debug(f"Loading directory {args.path} as {args.type}")
-        directory = load_directory(args.path, args.type)
-
-        info = directory.get_info()
-        self.logger.debug(f"Info: {info}")
-
-        tooling_cmd, px4board, init_romfs_dir, airframe_match, target = {
-            "firmware": (
-                ["bash", "./Tools/setup/ubuntu.sh", "--no-sim-tools"],
-                PX4_DIR / "boards" / info.vendor / info.model / f"{info.name}.px4board",
-                PX4_DIR / "ROMFS" / "px4fmu_common" / "init.d",
-                "[4000, 4999] Quadrotor x",
-                f"{info.vendor}_{info.model}_{info.name}"
-            ),
-            "sitl": (
-                ["bash", "./Tools/setup/ubuntu.sh"],
-                PX4_DIR / "boards" / "px4" / "sitl" / f"{info.name}.px4board",
-                PX4_DIR / "ROMFS" / "px4fmu_common" / "init.d-posix",
-                "# [22000, 22999] Reserve for custom models",
-                f"px4_sitl_{info.name}"
-            )
-        }[args.type]
-
-        if args.msgs_output:
-            self.logger.info("Copying msg/ and srv/ from firmware.")
-            self.logger.debug(f"Checking for msg/ and srv/ in {args.msgs_output}")
-            msg_src = PX4_DIR / "msg"
-            msg_versioned_src = PX4_DIR / "msg/versioned"
-            srv_src = PX4_DIR / "srv"
-            msg_dst = args.msgs_output / "msg"
-            srv_dst = args.msgs_output / "srv"
-
-            if msg_dst.exists() and msg_dst.exists():
-                self.logger.debug("Found msg and srv directories. Deleting ...")
-                shutil.rmtree(msg_dst)
-                shutil.rmtree(srv_dst)
-            else:
-                self.logger.warn(f"The provided directory {args.msgs_output} does not seem to contain the folders 'msg' and 'srv'.")
-                self.logger.warn(f"This may be intentional, or you may not be copying the files to the intended directory (usually to px4_msgs).")
-
-            self.logger.debug(f"Creating empty version of msg and srv directories.")
-            msg_dst.mkdir(parents=True, exist_ok=True)
-            srv_dst.mkdir(parents=True, exist_ok=True)
-
-            self.logger.debug(f"Copying *.msg and *.srv into {args.msgs_output}...")
-            for file in msg_src.glob("*.msg"):
-                shutil.copy(file, msg_dst)
-            for file in msg_versioned_src.glob("*.msg"):
-                shutil.copy(file, msg_dst)
-            for file in srv_src.glob("*.srv"):
-                shutil.copy(file, srv_dst)
-
-        if args.skip_compilation:
-            self.logger.info("Found --skip-compilation. Skipping...")
-            sys.exit(0)
-
-        if not args.overwrite and (PX4_DIR / "build" / target).exists():
-            self.logger.info(f"Target {target} already built. Use --overwrite to rebuild.")
-            sys.exit(0)
-
-        self.__setup_git(info)
-        self.__copy_dds_topics(directory, args.path)
-
-        if args.install_dependencies:
-            self.logger.info("Installing PX4 dependencies...")
-            tooling = run_command(tooling_cmd, live=True, logger=self.logger, cwd=PX4_DIR)
-            if tooling.returncode != 0:
-                self.logger.error(f"Failed to install dependencies. {tooling.stderr}, {tooling.stdout}")
-                sys.exit(1)
-
-        shutil.copy2(args.path / directory.modules_file, px4board)
-
-        airframes = init_romfs_dir / "airframes"
-        components_insert_dir = PX4_DIR / "ROMFS" / "px4fmu_common" / "init.d"
-        cmake_components = components_insert_dir / "CMakeLists.txt"
-
-        airframe_file = f"{info.id}_{info.name}"
-        target_airframe = airframes / airframe_file
-        cmake_airframes = airframes / "CMakeLists.txt"
-
-        shutil.copy2(args.path / directory.params_file, target_airframe)
-        self.__prepend_insertion(cmake_airframes, airframe_match, airframe_file)
-
-        if (directory.params_post_file is not None):
-            airframe_post_file = f"{info.id}_{info.name}.post"
-            target_airframe_post = airframes / airframe_post_file
-            shutil.copy2(args.path / directory.params_post_file, target_airframe_post)
-            self.__prepend_insertion(cmake_airframes, airframe_match, airframe_post_file)
-
-        if args.comps is not None:
-            if info.components is not None and self.__validate_comps(info.components, args.comps):
-                for component in info.components:
-                    shutil.copy2(args.comps / component, components_insert_dir / component)
-                components_normalized = " ".join(info.components) if isinstance(info.components, list) else info.components
-                self.__prepend_insertion(cmake_components, "rcS", components_normalized)
-            else:
-                self.logger.warn(f"No components defined in {directory.info_file}, skipping components population.")
-        else:
-            if info.components is not None:
-                self.logger.error(f"{directory.info_file} defines components but no --comps provided.")
-                sys.exit(1)
-
-        self.logger.info(f"Building firmware for target {target}")
-
-        if args.clean_run:
-            self.logger.info(f"Make clean build")
-            run_command(["make", "clean"], live=True, logger=self.logger, cwd=PX4_DIR)
-
-        build_px4 = run_command(["make", target], live=True, logger=self.logger, cwd=PX4_DIR)
-
-        if build_px4.returncode != 0:
-            self.logger.error(f"Build failed for {target}. {build_px4.stderr} {build_px4.stdout}")
+        """
+        Thin wrapper over `Builder`: maps typed errors to a non-zero exit code.
+        """
+        try:
+            if args.px4_versions:
+                self.__matrix(args)
+                return
+            self.builder = Builder(BuildOptions.from_args(args), logger=self.logger)
+            self.builder.run()
+        except EasyPX4Error as e:
+            self.logger.error(str(e))
+            for line in e.tail:
+                self.logger.error(f"  {line}")
             sys.exit(1)
 
-        if args.output and args.type == "firmware":
-            output_file = args.output / f"{info.name}.px4"
-            shutil.copy2(PX4_DIR / "build" / target / f"{target}.px4", output_file)
-            self.logger.info(f"firmware file in: {output_file}")
+    def __matrix(self, args: Namespace) -> None:
+        self.matrix = MatrixBuilder(BuildOptions.from_args(args), args.px4_versions, jobs=args.jobs, logger=self.logger)
+        entries = self.matrix.run()
 
-        self.logger.info("Done.")
+        for line in self.matrix.table():
+            self.logger.info(line)
 
+        if any(entry.result is None or not entry.result.ok for entry in entries):
+            sys.exit(1)
 
     def cleanup(self):
-        self.logger.debug(f"Restoring tags.")
-        self.logger.debug(f"Deleting {self.renamed_tag}")
-        run_command(['git', 'tag', '-d', self.renamed_tag], cwd=PX4_DIR, check=True)
-
-        run_command(['git', 'restore', '.'], cwd=PX4_DIR, check=True)
+        if self.builder is not None:
+            self.builder.cleanup()
+        if self.matrix is not None:
+            self.matrix.cleanup()
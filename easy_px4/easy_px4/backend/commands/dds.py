@@ -0,0 +1,106 @@
+import sys
+from argparse import ArgumentParser, Namespace
+
+from easy_px4_utils import load_directory, valid_dir_path
+
+from .command import Command
+from ..dds import DEFAULT_RATE_HZ, TRANSPORT_OVERHEAD, bandwidth, default_topics, estimate, topic_rate
+from ..logger import flush_logs
+from ..msgs import read_msgs
+from ..paths import PX4_DIR
+from ..planner import Planner
+
+
+class DdsCommand(Command):
+    """
+    Estimates the uXRCE-DDS link bandwidth of an airframe.
+
+    The topics of its dds_topics.yaml (or the PX4 default) are sized from the
+    `.msg` definitions at the PX4 commit of the airframe, read from the git
+    objects of the PX4 tree, so nothing is checked out.
+    """
+    cmd_name = "dds"
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+
+        parser.add_argument("--path",
+                            type=valid_dir_path,
+                            required=True,
+                            help="Airframe directory.")
+
+        parser.add_argument("--type",
+                            type=str.lower,
+                            default="firmware",
+                            choices=["firmware", "sitl"],
+                            help="Type of the airframe directory (default: firmware).")
+
+        parser.add_argument("--commit",
+                            help="PX4 commit or tag to read the messages from (default: the one of info.toml).")
+
+        parser.add_argument("--dds-rate",
+                            type=topic_rate,
+                            action="append",
+                            default=[],
+                            metavar="TOPIC=HZ",
+                            help="Rate of a topic, overriding its rate_limit. Repeatable.")
+
+        parser.add_argument("--default-rate",
+                            type=float,
+                            default=DEFAULT_RATE_HZ,
+                            help=f"Rate of topics without rate_limit or --dds-rate (default: {DEFAULT_RATE_HZ:g} Hz).")
+
+        parser.add_argument("--transport",
+                            choices=list(TRANSPORT_OVERHEAD),
+                            default="serial",
+                            help="Link transport, for the framing overhead (default: serial).")
+
+        parser.add_argument("--budget-out",
+                            type=bandwidth,
+                            help="Budget of the flight controller to companion direction in bytes/s (e.g. 40k).")
+
+        parser.add_argument("--budget-in",
+                            type=bandwidth,
+                            help="Budget of the companion to flight controller direction in bytes/s.")
+
+    def execute(self, args: Namespace) -> None:
+        try:
+            directory = load_directory(args.path, args.type)
+            info = directory.get_info()
+        except (FileNotFoundError, KeyError, TypeError, ValueError) as e:
+            self.logger.error(f"Invalid airframe directory {args.path}: {e}")
+            sys.exit(1)
+
+        commit = args.commit or Planner(PX4_DIR).resolve(info)
+        if commit is None:
+            self.logger.error(f"PX4 {info.px4_commit or info.px4_version} is not available locally. "
+                              "Build once or fetch it first.")
+            sys.exit(1)
+
+        dds_topics_file = getattr(directory, "dds_topics_file", None)
+        if dds_topics_file is not None:
+            topics = (args.path / dds_topics_file).read_text(encoding="utf-8")
+        else:
+            self.logger.info("No custom dds_topics.yaml provided. Using PX4 default.")
+            topics = default_topics(PX4_DIR, commit)
+            if topics is None:
+                self.logger.error(f"PX4 {commit} has no dds_topics.yaml.")
+                sys.exit(1)
+
+        try:
+            result = estimate(topics, read_msgs(PX4_DIR, commit), dict(args.dds_rate),
+                              default_rate=args.default_rate, transport=args.transport)
+        except ValueError as e:
+            self.logger.error(f"Cannot estimate the DDS bandwidth: {e}")
+            sys.exit(1)
+
+        flush_logs()
+        for line in result.table():
+            print(line)
+        if any(t.rate_source == "default" for t in result.topics):
+            print(f"* no rate_limit, assumed {args.default_rate:g} Hz")
+
+        problems = result.over_budget({"out": args.budget_out, "in": args.budget_in})
+        for problem in problems:
+            self.logger.error(problem)
+        if problems:
+            sys.exit(1)
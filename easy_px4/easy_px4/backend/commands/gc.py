@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+
+from .command import Command
+from ..gc import GC_QUOTA_ENV, collect, disk_size, format_size, scan
+from ..logger import flush_logs
+
+
+class GcCommand(Command):
+    """
+    Removes the least recently used PX4 build directories (of the PX4 tree and
+    the version matrix worktrees) until they fit in a disk quota.
+
+    Builds and SITL launches record when they used a build directory. Targets
+    locked by running builds and directories a process runs in are never removed.
+    """
+    cmd_name = "gc"
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+
+        parser.add_argument("--quota",
+                            type=disk_size,
+                            help=f"Size the build directories may use, e.g. 50G (default: ${GC_QUOTA_ENV}). "
+                                 "Without a quota the build directories are only listed.")
+
+        parser.add_argument("--dry-run",
+                            action="store_true",
+                            help="Only print what would be removed.")
+
+    def execute(self, args: Namespace) -> None:
+        quota = args.quota
+        if quota is None and os.environ.get(GC_QUOTA_ENV):
+            try:
+                quota = disk_size(os.environ[GC_QUOTA_ENV])
+            except ArgumentTypeError as e:
+                self.logger.error(f"Invalid {GC_QUOTA_ENV}: {e}")
+                sys.exit(1)
+
+        if quota is None:
+            build_dirs = scan()
+            flush_logs()
+            print(f"{'target':<48} {'size':>10}  {'last used':<16}  tree")
+            for entry in reversed(build_dirs):
+                last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.last_used))
+                in_use = f"  ({entry.in_use})" if entry.in_use else ""
+                print(f"{entry.target:<48} {format_size(entry.size):>10}  {last_used:<16}  {entry.tree}{in_use}")
+            print(f"total: {format_size(sum(entry.size for entry in build_dirs))}")
+            return
+
+        result = collect(quota, dry_run=args.dry_run, logger=self.logger)
+        self.logger.info(f"{'Would free' if args.dry_run else 'Freed'} {format_size(result.freed)} "
+                         f"({len(result.evicted)} build directories), "
+                         f"{format_size(result.total - result.freed)} of {format_size(quota)} used.")
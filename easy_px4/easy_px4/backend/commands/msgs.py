@@ -0,0 +1,81 @@
+import sys
+import json
+from argparse import ArgumentParser, Namespace
+
+from .command import Command
+from ..logger import flush_logs
+from ..msgs import diff_indexes, load_index
+from ..paths import PX4_DIR
+from ..planner import resolve_ref
+
+
+class MsgsCommand(Command):
+    """
+    PX4 message and service definitions across versions.
+
+    - index: parse the `.msg`/`.srv` files of PX4 versions into the cache.
+    - diff: added, removed and changed messages, fields and constants between two versions.
+
+    Definitions are read from the git objects of the PX4 tree (no checkout) and
+    cached per commit, so a diff of indexed versions does not touch git at all.
+    """
+    cmd_name = "msgs"
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+        actions = parser.add_subparsers(dest="action", required=True)
+
+        index = actions.add_parser("index", help="Index the message definitions of PX4 versions.")
+        index.add_argument("versions",
+                           nargs="+",
+                           metavar="VERSION",
+                           help="PX4 release tags or commits.")
+
+        diff = actions.add_parser("diff", help="Compare the message definitions of two PX4 versions.")
+        diff.add_argument("old", metavar="VERSION_A", help="PX4 release tag or commit.")
+        diff.add_argument("new", metavar="VERSION_B", help="PX4 release tag or commit.")
+        diff.add_argument("--json",
+                          action="store_true",
+                          help="Print the changes as JSON.")
+
+        for action in (index, diff):
+            action.add_argument("--no-fetch",
+                                action="store_true",
+                                help="Do not fetch release tags missing in the PX4 tree.")
+
+    def __index(self, ref: str, fetch: bool):
+        commit = resolve_ref(PX4_DIR, ref, fetch=fetch)
+        if commit is None:
+            self.logger.error(f"PX4 version {ref} not found.")
+            sys.exit(1)
+
+        try:
+            return load_index(PX4_DIR, commit)
+        except ValueError as e:
+            self.logger.error(f"Cannot index PX4 {ref}: {e}")
+            sys.exit(1)
+
+    def execute(self, args: Namespace) -> None:
+        fetch = not args.no_fetch
+
+        if args.action == "index":
+            for ref in args.versions:
+                index = self.__index(ref, fetch)
+                self.logger.info(f"{ref} ({index.commit[:12]}): {len(index.messages)} messages, "
+                                 f"{len(index.services)} services")
+            return
+
+        report = diff_indexes(self.__index(args.old, fetch), self.__index(args.new, fetch))
+
+        flush_logs()
+        if args.json:
+            print(json.dumps([{"change": header, "details": details} for header, details in report], indent=2))
+            return
+
+        if not report:
+            self.logger.info(f"No message changes between {args.old} and {args.new}.")
+            return
+
+        for header, details in report:
+            print(header)
+            for line in details:
+                print(f"    {line}")
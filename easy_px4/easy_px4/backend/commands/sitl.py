@@ -0,0 +1,241 @@
+import sys
+import time
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+
+from easy_px4_utils import load_directory, valid_dir_path
+
+from .command import Command
+from ..errors import ConfigurationError, EasyPX4Error
+from ..sitl import DDS_AGENT_PORT, SitlLauncher
+from ..benchmark import READY_PATTERN, record, regressions, run_benchmark
+
+
+def env_pair(value: str) -> tuple[str, str]:
+    key, sep, val = value.partition("=")
+    if not sep or not key:
+        raise ArgumentTypeError(f"Expected KEY=VALUE, got {value!r}")
+    return key, val
+
+
+class SitlCommand(Command):
+    """
+    Run built SITL targets (software in the loop).
+
+    - run: start N instances of a `px4_sitl_<name>` target, pinned to their own
+      CPU sets, with per-instance working directories and ports.
+    - bench: measure boot latency and steady-state CPU/RSS of one headless
+      instance and compare against the previous run of the same airframe.
+    """
+    cmd_name = "sitl"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.launcher: Optional[SitlLauncher] = None
+        self.stop_timeout = 10.0
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+        actions = parser.add_subparsers(dest="action", required=True)
+
+        run = actions.add_parser("run", help="Launch multiple SITL instances of a built airframe.")
+
+        run.add_argument("--path",
+                         type=valid_dir_path,
+                         required=True,
+                         help="Airframe directory built with `easy_px4 build --type sitl`.")
+
+        run.add_argument("--count", "-n",
+                         type=int,
+                         default=1,
+                         help="Number of instances (default: 1).")
+
+        run.add_argument("--first-instance",
+                         type=int,
+                         default=0,
+                         help="Instance number of the first vehicle. MAVLink ports are offset by it (default: 0).")
+
+        run.add_argument("--cpus-per-instance",
+                         type=int,
+                         default=1,
+                         help="Logical CPUs pinned to each instance (default: 1).")
+
+        run.add_argument("--oversubscribe",
+                         action="store_true",
+                         help="Allow more CPUs to be requested than the host has (CPU sets are shared round-robin).")
+
+        run.add_argument("--dds-port",
+                         type=int,
+                         default=DDS_AGENT_PORT,
+                         help=f"UDP port of the uXRCE-DDS agent (default: {DDS_AGENT_PORT}).")
+
+        run.add_argument("--dds-port-stride",
+                         type=int,
+                         default=0,
+                         help="Per-instance offset of the DDS agent port. 0 shares one agent, namespaced px4_<i> (default: 0).")
+
+        run.add_argument("--workdir",
+                         type=Path,
+                         help="Base directory for the instance working directories (default: the build directory).")
+
+        run.add_argument("--env",
+                         type=env_pair,
+                         action="append",
+                         default=[],
+                         help="Extra environment for every instance, e.g. --env PX4_SIMULATOR=sihsim. Can be repeated.")
+
+        run.add_argument("--duration",
+                         type=float,
+                         help="Stop the instances after this many seconds (default: run until Ctrl-C).")
+
+        run.add_argument("--stop-timeout",
+                         type=float,
+                         default=10.0,
+                         help="Seconds to wait for a clean shutdown before killing (default: 10).")
+
+        bench = actions.add_parser("bench", help="Benchmark boot latency and steady-state CPU/RSS of a built SITL airframe.")
+
+        bench.add_argument("--path",
+                           type=valid_dir_path,
+                           required=True,
+                           help="Airframe directory built with `easy_px4 build --type sitl`.")
+
+        bench.add_argument("--window",
+                           type=float,
+                           default=30.0,
+                           help="Seconds of steady-state CPU/RSS sampling after boot (default: 30).")
+
+        bench.add_argument("--interval",
+                           type=float,
+                           default=0.5,
+                           help="Sampling interval in seconds (default: 0.5).")
+
+        bench.add_argument("--boot-timeout",
+                           type=float,
+                           default=60.0,
+                           help="Seconds to wait for the ready state (default: 60).")
+
+        bench.add_argument("--ready-pattern",
+                           default=READY_PATTERN,
+                           help=f"Output line marking the ready state (default: '{READY_PATTERN}').")
+
+        bench.add_argument("--threshold",
+                           type=float,
+                           default=0.10,
+                           help="Relative increase flagged as regression (default: 0.10 = 10%%).")
+
+        bench.add_argument("--fail-on-regression",
+                           action="store_true",
+                           help="Exit with code 1 if a regression is detected.")
+
+        bench.add_argument("--env",
+                           type=env_pair,
+                           action="append",
+                           default=[],
+                           help="Extra environment for the instance, e.g. --env PX4_SIMULATOR=sihsim. Can be repeated.")
+
+    def __load_info(self, path: Path):
+        try:
+            return load_directory(path, "sitl").get_info()
+        except (FileNotFoundError, KeyError, TypeError, ValueError) as e:
+            raise ConfigurationError(f"Invalid airframe directory {path}: {e}") from e
+
+    def __bench(self, args: Namespace) -> None:
+        info = self.__load_info(args.path)
+
+        workdir = Path(tempfile.mkdtemp(prefix="easy_px4_bench_"))
+        self.launcher = SitlLauncher.for_target(
+            f"px4_sitl_{info.name}",
+            autostart=info.id,
+            count=1,
+            oversubscribe=True,
+            workdir=workdir,
+            extra_env=dict(args.env),
+        )
+
+        self.logger.info(f"Benchmarking px4_sitl_{info.name} ({args.window}s window)...")
+        try:
+            result = run_benchmark(self.launcher, info.name,
+                                   ready_pattern=args.ready_pattern,
+                                   boot_timeout=args.boot_timeout,
+                                   window=args.window,
+                                   interval=args.interval)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.logger.info(f"commit {result.commit}: boot {result.boot_s}s, "
+                         f"cpu {result.cpu_percent}% (max {result.cpu_percent_max}%), "
+                         f"rss {result.rss_mb} MiB (max {result.rss_mb_max} MiB)")
+
+        previous = record(result)
+        if previous is None:
+            self.logger.info("No previous benchmark of this airframe, recorded as baseline.")
+            return
+
+        found = regressions(result, previous, args.threshold)
+        if not found:
+            self.logger.info(f"No regression against commit {previous.get('commit')}.")
+            return
+
+        for regression in found:
+            self.logger.warning(f"Regression against commit {previous.get('commit')}: {regression}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+    def __run(self, args: Namespace) -> None:
+        info = self.__load_info(args.path)
+        target = f"px4_sitl_{info.name}"
+
+        self.stop_timeout = args.stop_timeout
+        self.launcher = SitlLauncher.for_target(
+            target,
+            autostart=info.id,
+            count=args.count,
+            first_instance=args.first_instance,
+            cpus_per_instance=args.cpus_per_instance,
+            oversubscribe=args.oversubscribe,
+            dds_port=args.dds_port,
+            dds_port_stride=args.dds_port_stride,
+            workdir=args.workdir,
+            extra_env=dict(args.env),
+        )
+
+        for instance in self.launcher.start():
+            gcs, offboard = instance.mavlink_ports
+            self.logger.info(
+                f"instance {instance.index}: pid {instance.process.pid}, cpus {sorted(instance.cpus)}, "
+                f"mavlink gcs {gcs} offboard {offboard}, dds {instance.env['PX4_UXRCE_DDS_NS']}@{instance.env['PX4_UXRCE_DDS_PORT']}, "
+                f"logs in {instance.workdir}"
+            )
+
+        self.logger.info(f"{args.count} instances of {target} running. Press Ctrl-C to stop.")
+
+        deadline = time.monotonic() + args.duration if args.duration is not None else None
+        try:
+            while self.launcher.running():
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+
+        exited = [i for i in self.launcher.instances if i.process.poll() is not None]
+        for instance in exited:
+            self.logger.warning(f"instance {instance.index} exited with code {instance.process.returncode}, see {instance.workdir}")
+
+    def execute(self, args: Namespace) -> None:
+        try:
+            if args.action == "run":
+                self.__run(args)
+            elif args.action == "bench":
+                self.__bench(args)
+        except EasyPX4Error as e:
+            self.logger.error(str(e))
+            sys.exit(1)
+
+    def cleanup(self):
+        if self.launcher is not None and self.launcher.running():
+            self.logger.info("Stopping SITL instances...")
+            self.launcher.stop(timeout=self.stop_timeout)
@@ -0,0 +1,115 @@
+import sys
+from argparse import ArgumentParser, Namespace
+
+from easy_px4_utils import load_directory, valid_dir_path
+
+from .command import Command
+from ..logger import flush_logs
+from ..paths import PX4_DIR
+from ..size import analyze, deltas, load_history, previous_report, record
+
+
+class SizeCommand(Command):
+    """
+    Flash and RAM usage of a built firmware, per module and symbol, against the
+    flash of the board and the previous build of the same airframe.
+
+    Reads `<target>.elf`, `<target>.map` and `<target>.px4` of the build
+    directory; no toolchain or network access is needed.
+    """
+    cmd_name = "size"
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+
+        parser.add_argument("--path",
+                            type=valid_dir_path,
+                            required=True,
+                            help="Airframe directory built with `easy_px4 build --type firmware`.")
+
+        parser.add_argument("--build-dir",
+                            type=valid_dir_path,
+                            help="PX4 build directory of the target (default: build/<target> of the PX4 tree).")
+
+        parser.add_argument("--modules",
+                            type=int,
+                            default=15,
+                            help="Number of modules listed, largest first (default: 15).")
+
+        parser.add_argument("--symbols",
+                            type=int,
+                            default=15,
+                            help="Number of symbols listed, largest first (default: 15).")
+
+        parser.add_argument("--record",
+                            action="store_true",
+                            help="Add the report to the size history of the airframe (builds do this automatically).")
+
+        parser.add_argument("--history",
+                            action="store_true",
+                            help="Print the recorded flash usage of the airframe instead of analyzing the build.")
+
+    def execute(self, args: Namespace) -> None:
+        try:
+            info = load_directory(args.path, "firmware").get_info()
+        except (FileNotFoundError, KeyError, TypeError, ValueError) as e:
+            self.logger.error(f"Invalid airframe directory {args.path}: {e}")
+            sys.exit(1)
+
+        if args.history:
+            self.__history(info.name)
+            return
+
+        target = f"{info.vendor}_{info.model}_{info.name}"
+        build_dir = args.build_dir or PX4_DIR / "build" / target
+        if not (build_dir / f"{target}.elf").is_file():
+            self.logger.error(f"No {target}.elf in {build_dir}. Build the firmware first.")
+            sys.exit(1)
+
+        try:
+            report = analyze(build_dir, target, info.name, None,
+                             board_dir=PX4_DIR / "boards" / info.vendor / info.model)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Size analysis failed: {e}")
+            sys.exit(1)
+
+        previous = record(report) if args.record else previous_report(report)
+
+        self.logger.info(f"{target}: {report.describe()}")
+        flush_logs()
+
+        modules = sorted(report.modules.items(), key=lambda m: m[1]["text"] + m[1]["data"], reverse=True)
+        if modules:
+            print(f"{'module':<40} {'text':>10} {'data':>10} {'bss':>10}")
+            for name, usage in modules[:args.modules]:
+                print(f"{name:<40} {usage['text']:>10} {usage['data']:>10} {usage['bss']:>10}")
+            print()
+        else:
+            self.logger.warning(f"No {target}.map, per-module usage is not available.")
+
+        print(f"{'symbol':<40} {'kind':>6} {'size':>10}")
+        for symbol in report.symbols[:args.symbols]:
+            print(f"{symbol['name'][:40]:<40} {symbol['kind']:>6} {symbol['size']:>10}")
+
+        if previous is not None:
+            changes = deltas(report, previous)
+            self.logger.info(f"Changes since the build of {previous.get('timestamp')}: "
+                             f"{len(changes) if changes else 'none'}")
+            flush_logs()
+            for line in changes:
+                print(f"  {line}")
+
+    def __history(self, airframe: str) -> None:
+        history = load_history(airframe)
+        if not history:
+            self.logger.info(f"No size history for {airframe}.")
+            return
+
+        flush_logs()
+        print(f"{'timestamp':<33} {'commit':<12} {'flash':>10} {'change':>8} {'limit':>10}")
+        last = {}
+        for entry in history:
+            flash = entry["text"] + entry["data"]
+            change = flash - last[entry["target"]] if entry["target"] in last else 0
+            last[entry["target"]] = flash
+            print(f"{entry['timestamp']:<33} {(entry.get('commit') or '-')[:12]:<12} "
+                  f"{flash:>10} {change:>+8d} {entry.get('flash_limit') or '-':>10}")
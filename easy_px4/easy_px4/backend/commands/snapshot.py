@@ -0,0 +1,107 @@
+import os
+import sys
+from pathlib import Path
+from argparse import ArgumentParser, Namespace
+
+from .command import Command
+from ..errors import EasyPX4Error
+from ..lock import TreeLock
+from ..paths import PX4_DIR
+from ..snapshot import export_snapshot, import_snapshot
+
+
+def _default_jobs() -> int:
+    return min(os.cpu_count() or 1, 8)
+
+
+class ExportSnapshotCommand(Command):
+    """
+    Packs a PX4 commit and its submodules into git bundles plus a manifest,
+    to provision build nodes without network access (see import-snapshot).
+    """
+    cmd_name = "export-snapshot"
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+
+        parser.add_argument("version",
+                            metavar="VERSION",
+                            help="PX4 release tag or commit of the local PX4 tree.")
+
+        parser.add_argument("--output",
+                            type=Path,
+                            required=True,
+                            help="Directory for the bundles and snapshot.json (created if needed).")
+
+        parser.add_argument("--jobs", "-j",
+                            type=int,
+                            default=_default_jobs(),
+                            help="Repositories bundled in parallel (default: CPU count, at most 8).")
+
+        parser.add_argument("--tag",
+                            help="Release tag the PX4 bundle carries for the commit (default: VERSION if it is a "
+                                 "tag, also when a build removed it from the local tree).")
+
+        parser.add_argument("--allow-missing",
+                            action="store_true",
+                            help="Export even if some submodules were never checked out locally "
+                                 "(the importing node has to fetch them).")
+
+        parser.add_argument("--lock-timeout",
+                            type=float,
+                            help="Seconds to wait for other easy_px4 jobs using the PX4 tree (default: wait forever).")
+
+    def execute(self, args: Namespace) -> None:
+        try:
+            with TreeLock(PX4_DIR, f"export-snapshot {args.version}", timeout=args.lock_timeout, logger=self.logger):
+                snapshot = export_snapshot(PX4_DIR, args.version, args.output, jobs=args.jobs,
+                                           allow_missing=args.allow_missing, tag=args.tag, logger=self.logger)
+        except EasyPX4Error as e:
+            self.logger.error(str(e))
+            for line in e.tail:
+                self.logger.error(f"  {line}")
+            sys.exit(1)
+
+        size = sum(repo.size for repo in snapshot.repos)
+        self.logger.info(f"Exported {snapshot.tag or snapshot.commit[:12]} with {len(snapshot.repos) - 1} submodules "
+                         f"({size / 2**20:.1f} MiB) to {args.output}")
+        for path in snapshot.missing:
+            self.logger.warning(f"Not included: {path}")
+
+
+class ImportSnapshotCommand(Command):
+    """
+    Restores a ready-to-build PX4 tree from a directory written by export-snapshot,
+    without network access.
+    """
+    cmd_name = "import-snapshot"
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+
+        parser.add_argument("snapshot",
+                            type=Path,
+                            metavar="DIRECTORY",
+                            help="Directory written by export-snapshot.")
+
+        parser.add_argument("--px4-dir",
+                            type=Path,
+                            default=PX4_DIR,
+                            help=f"Where to restore the PX4 tree, must not exist or be empty (default: {PX4_DIR}).")
+
+        parser.add_argument("--jobs", "-j",
+                            type=int,
+                            default=_default_jobs(),
+                            help="Submodules restored in parallel (default: CPU count, at most 8).")
+
+    def execute(self, args: Namespace) -> None:
+        try:
+            snapshot = import_snapshot(args.snapshot, args.px4_dir, jobs=args.jobs, logger=self.logger)
+        except EasyPX4Error as e:
+            self.logger.error(str(e))
+            for line in e.tail:
+                self.logger.error(f"  {line}")
+            sys.exit(1)
+
+        self.logger.info(f"PX4 {snapshot.tag or snapshot.commit[:12]} restored to {args.px4_dir}")
+        if snapshot.missing:
+            self.logger.warning(f"{len(snapshot.missing)} submodule(s) were not in the snapshot and will be "
+                                "fetched by the first build.")
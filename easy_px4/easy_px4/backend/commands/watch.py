@@ -0,0 +1,146 @@
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+from argparse import ArgumentParser, Namespace
+
+from easy_px4_utils import valid_dir_path
+
+from .command import Command
+from ..builder import BUILD_TYPES, Builder, BuildOptions, renamed_tag_for, restore_tree
+from ..errors import EasyPX4Error
+from ..inotify import Inotify
+from ..lock import TreeLock
+from ..paths import PX4_DIR
+
+# editor swap/backup files that never affect a build
+IGNORED_SUFFIXES = (".swp", ".swx", ".tmp", "~")
+
+
+class WatchCommand(Command):
+    """
+    Rebuilds an airframe every time one of its files changes.
+
+    The PX4 tree stays prepared between rebuilds (commit, submodules, tag and
+    staged files), so editing params.airframe only re-stages the changed file
+    and runs an incremental `make`. Bursts of edits are debounced into a single
+    rebuild.
+    """
+    cmd_name = "watch"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.options: Optional[BuildOptions] = None
+        self.renamed_tag: Optional[str] = None
+        self.prepared = False
+        self.present: set[str] = set()
+        self.tree_lock: Optional[TreeLock] = None
+
+    def add_arguments(self, parser: ArgumentParser) -> None:
+
+        parser.add_argument("--type",
+                            type=str.lower,
+                            default="sitl",
+                            choices=BUILD_TYPES,
+                            help="Type of build (default: sitl).")
+
+        parser.add_argument("--path",
+                            type=valid_dir_path,
+                            required=True,
+                            help="Directory with build configuration files.")
+
+        parser.add_argument("--comps",
+                            type=valid_dir_path,
+                            help="Directory with components for build filesystem.")
+
+        parser.add_argument("--debounce",
+                            type=float,
+                            default=0.5,
+                            help="Seconds without changes before a rebuild starts (default: 0.5).")
+
+        parser.add_argument("--lock-timeout",
+                            type=float,
+                            help="Seconds to wait for other easy_px4 jobs using the PX4 tree (default: wait forever).")
+
+    def __snapshot(self) -> set[str]:
+        return {f.name for f in self.options.path.iterdir() if f.is_file()}
+
+    def __relevant(self, name: str) -> bool:
+        return bool(name) and not name.startswith(".") and not name.endswith(IGNORED_SUFFIXES)
+
+    def __wait_for_changes(self, inotify: Inotify, debounce: float) -> set[str]:
+        """
+        Blocks until a file changes, then keeps collecting events until the
+        directories stay quiet for `debounce` seconds.
+        """
+        changed = set()
+        events = inotify.read()
+        while events:
+            changed.update(e.name for e in events if self.__relevant(e.name))
+            events = inotify.read(timeout=debounce)
+        return changed
+
+    def __build(self, changed: set[str]) -> None:
+        present = self.__snapshot()
+
+        # a staged file that disappeared (or info.toml pointing somewhere else) leaves
+        # stale entries in the PX4 CMakeLists, start again from a clean tree
+        if self.prepared and ("info.toml" in changed or present != self.present):
+            self.logger.info("Airframe layout changed, restoring PX4 tree.")
+            restore_tree(PX4_DIR, self.renamed_tag, logger=self.logger)
+            self.prepared = False
+
+        self.present = present
+
+        start = time.perf_counter()
+        builder = Builder(self.options, logger=self.logger, tree_lock=self.tree_lock)
+        try:
+            result = builder.run()
+        except EasyPX4Error as e:
+            self.logger.error(str(e))
+            for line in e.tail:
+                self.logger.error(f"  {line}")
+            self.logger.info("Waiting for changes to retry...")
+            return
+        finally:
+            if builder.info is not None:
+                self.renamed_tag = renamed_tag_for(builder.info)
+                self.prepared = True
+
+        self.logger.info(f"{result.target} ready in {time.perf_counter() - start:.1f}s ({result.status}).")
+
+    def execute(self, args: Namespace) -> None:
+        self.options = BuildOptions(build_type=args.type, path=args.path, comps=args.comps, overwrite=True)
+
+        # the tree stays prepared between rebuilds, keep it locked for the whole session
+        self.tree_lock = TreeLock(PX4_DIR, f"watch {args.path.name}", timeout=args.lock_timeout, logger=self.logger)
+        try:
+            self.tree_lock.acquire()
+        except EasyPX4Error as e:
+            self.logger.error(str(e))
+            sys.exit(1)
+
+        watched = [args.path] + ([args.comps] if args.comps is not None else [])
+
+        with Inotify() as inotify:
+            for directory in watched:
+                inotify.add_watch(directory)
+
+            try:
+                self.__build({"info.toml"})
+                self.logger.info(f"Watching {', '.join(str(Path(d)) for d in watched)}. Press Ctrl-C to stop.")
+
+                while True:
+                    changed = self.__wait_for_changes(inotify, args.debounce)
+                    if changed:
+                        self.logger.info(f"Changed: {', '.join(sorted(changed))}")
+                        self.__build(changed)
+            except KeyboardInterrupt:
+                self.logger.info("Stopping watch.")
+
+    def cleanup(self):
+        if self.prepared:
+            restore_tree(PX4_DIR, self.renamed_tag, logger=self.logger)
+            self.prepared = False
+        if self.tree_lock is not None:
+            self.tree_lock.release()
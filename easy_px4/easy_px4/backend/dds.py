@@ -0,0 +1,165 @@
+import re
+from pathlib import Path
+from argparse import ArgumentTypeError
+from dataclasses import dataclass, field
+from typing import Optional
+
+import yaml
+
+from .msgs import MsgDefinition, MsgSizer
+from .planner import git
+
+# default topics of the uXRCE-DDS client in the PX4 tree
+DDS_TOPICS_PATH = "src/modules/uxrce_dds_client/dds_topics.yaml"
+
+# rate assumed for topics without `rate_limit` and without a --dds-rate
+DEFAULT_RATE_HZ = 50.0
+
+# XRCE message header with client key (8), submessage header (4) and WRITE_DATA header (4)
+XRCE_OVERHEAD = 16
+
+# framing of one XRCE message: serial (flag, addresses, length, CRC) or IPv4 + UDP headers
+TRANSPORT_OVERHEAD = {
+    "serial": 7,
+    "udp": 28,
+}
+
+DIRECTIONS = ("out", "in")
+
+_UNITS = {"": 1, "k": 1000, "m": 1000 ** 2}
+
+
+def bandwidth(value: str) -> float:
+    """
+    argparse type for a bandwidth in bytes per second: `92160`, `90k`, `1.5M`.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmM]?)\s*(?:B/s)?\s*", value)
+    if match is None:
+        raise ArgumentTypeError(f"Expected a bandwidth in bytes per second (e.g. 90k), got {value!r}")
+    return float(match.group(1)) * _UNITS[match.group(2).lower()]
+
+
+def topic_rate(value: str) -> tuple[str, float]:
+    """
+    argparse type for TOPIC=HZ, e.g. `vehicle_odometry=30`.
+    """
+    topic, sep, rate = value.partition("=")
+    try:
+        if not sep or not topic:
+            raise ValueError
+        return topic, float(rate)
+    except ValueError:
+        raise ArgumentTypeError(f"Expected TOPIC=HZ, got {value!r}") from None
+
+
+@dataclass
+class TopicLoad:
+    topic: str
+    type: str
+    direction: str
+    sample_bytes: int
+    rate_hz: float
+    # "yaml" (rate_limit), "option" (--dds-rate) or "default"
+    rate_source: str
+
+    @property
+    def bytes_per_s(self) -> float:
+        return self.sample_bytes * self.rate_hz
+
+
+@dataclass
+class BandwidthEstimate:
+    transport: str
+    topics: list[TopicLoad] = field(default_factory=list)
+
+    def total(self, direction: str) -> float:
+        return sum(t.bytes_per_s for t in self.topics if t.direction == direction)
+
+    def over_budget(self, budgets: dict[str, Optional[float]]) -> list[str]:
+        """
+        One message per direction whose estimate exceeds its budget.
+        """
+        problems = []
+        for direction in DIRECTIONS:
+            budget = budgets.get(direction)
+            total = self.total(direction)
+            if budget is not None and total > budget:
+                top = max((t for t in self.topics if t.direction == direction), key=lambda t: t.bytes_per_s)
+                problems.append(f"DDS {direction} bandwidth {total / 1000:.1f} kB/s exceeds the budget of "
+                                f"{budget / 1000:.1f} kB/s (largest: {top.topic} {top.bytes_per_s / 1000:.1f} kB/s)")
+        return problems
+
+    def table(self) -> list[str]:
+        lines = [f"{'dir':<4} {'topic':<48} {'bytes':>6} {'Hz':>8} {'kB/s':>9}"]
+        for t in sorted(self.topics, key=lambda t: (DIRECTIONS.index(t.direction), -t.bytes_per_s)):
+            rate = f"{t.rate_hz:g}" + ("*" if t.rate_source == "default" else "")
+            lines.append(f"{t.direction:<4} {t.topic:<48} {t.sample_bytes:>6} {rate:>8} {t.bytes_per_s / 1000:>9.2f}")
+        for direction in DIRECTIONS:
+            lines.append(f"total {direction}: {self.total(direction) / 1000:.2f} kB/s ({self.transport})")
+        return lines
+
+
+def load_topics(text: str) -> list[tuple[str, str, str, Optional[float]]]:
+    """
+    (direction, topic, message type, rate_limit) of every topic of a dds_topics.yaml.
+    """
+    data = yaml.safe_load(text) or {}
+    if not isinstance(data, dict):
+        raise ValueError("dds_topics.yaml must be a mapping of publications/subscriptions")
+
+    topics = []
+    for section, entries in data.items():
+        if section == "publications":
+            direction = "out"
+        elif section.startswith("subscriptions"):
+            direction = "in"
+        else:
+            continue
+
+        for entry in entries or []:
+            try:
+                message_type = entry["type"].rsplit("::", 1)[-1]
+                rate = entry.get("rate_limit")
+                topics.append((direction, entry["topic"], message_type, float(rate) if rate is not None else None))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                raise ValueError(f"Invalid entry in {section}: {entry!r}") from e
+    return topics
+
+
+def _rate_for(topic: str, rates: dict[str, float]) -> Optional[float]:
+    # --dds-rate accepts the full topic or its last component
+    return rates.get(topic, rates.get(topic.rsplit("/", 1)[-1]))
+
+
+def estimate(topics_text: str,
+             definitions: dict[str, MsgDefinition],
+             rates: Optional[dict[str, float]] = None,
+             default_rate: float = DEFAULT_RATE_HZ,
+             transport: str = "serial") -> BandwidthEstimate:
+    """
+    Link bandwidth of the topics of a dds_topics.yaml, per sample: the serialized
+    message plus the XRCE and transport overhead. Samples are assumed to be sent
+    in their own XRCE message, so the estimate is an upper bound.
+    """
+    if transport not in TRANSPORT_OVERHEAD:
+        raise ValueError(f"Unknown transport: {transport}. Expected one of {list(TRANSPORT_OVERHEAD)}")
+
+    rates = rates or {}
+    sizer = MsgSizer(definitions)
+    overhead = XRCE_OVERHEAD + TRANSPORT_OVERHEAD[transport]
+    result = BandwidthEstimate(transport)
+
+    for direction, topic, message_type, rate_limit in load_topics(topics_text):
+        rate, source = _rate_for(topic, rates), "option"
+        if rate is None:
+            rate, source = (rate_limit, "yaml") if rate_limit is not None else (default_rate, "default")
+        result.topics.append(TopicLoad(topic, message_type, direction, sizer.size(message_type) + overhead, rate, source))
+
+    return result
+
+
+def default_topics(px4_dir: Path, commit: str) -> Optional[str]:
+    """
+    dds_topics.yaml of the PX4 tree at `commit`.
+    """
+    return git(px4_dir, "show", f"{commit}:{DDS_TOPICS_PATH}")
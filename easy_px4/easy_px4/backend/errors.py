@@ -0,0 +1,52 @@
+from typing import Optional
+
+
+class EasyPX4Error(Exception):
+    """
+    Base class for every error raised by easy_px4.
+
+    Args:
+    - message: human readable description of the failure.
+    - tail: last output lines of the failing command (if any).
+    """
+
+    def __init__(self, message: str, tail: Optional[list[str]] = None) -> None:
+        super().__init__(message)
+        self.tail = tail or []
+        self.result = None  # BuildResult attached by the builder
+
+
+class ConfigurationError(EasyPX4Error):
+    """
+    Invalid airframe directory, info.toml, components or build options.
+    """
+
+
+class GitError(EasyPX4Error):
+    """
+    A git operation on the PX4 tree failed.
+    """
+
+
+class DependencyError(EasyPX4Error):
+    """
+    Installing the PX4 toolchain failed.
+    """
+
+
+class CompilationError(EasyPX4Error):
+    """
+    PX4 `make` failed.
+    """
+
+
+class ReproducibilityError(EasyPX4Error):
+    """
+    A clean rebuild from the same inputs produced different artifacts (--verify-reproducible).
+    """
+
+
+class LockTimeoutError(EasyPX4Error):
+    """
+    Another easy_px4 job kept the PX4 tree locked for longer than the lock timeout.
+    """
@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+from pathlib import Path
+from argparse import ArgumentTypeError
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .lock import TreeLock
+from .logger import get_logger
+from .paths import PX4_DIR, STATE_DIR, WORKTREES_DIR
+
+# last use of every build directory (resolved path -> unix time)
+USAGE_FILE = STATE_DIR / "usage.json"
+
+# quota of the automatic collection after every build, e.g. "50G"
+GC_QUOTA_ENV = "EASY_PX4_GC_QUOTA"
+
+# build directories being deleted are renamed first, so a build never sees half of one
+_TRASH_PREFIX = ".easy_px4-gc-"
+
+_UNITS = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30, "t": 2**40}
+
+
+def disk_size(value: str) -> int:
+    """
+    argparse type for a size in bytes: `1073741824`, `500M`, `50G`, `1.5T` (binary units).
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)(?:i?B)?\s*", value)
+    if match is None:
+        raise ArgumentTypeError(f"Expected a size (e.g. 50G), got {value!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def _update_usage(update) -> None:
+    USAGE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with USAGE_FILE.with_name(f"{USAGE_FILE.name}.lock").open("a") as guard:
+        fcntl.flock(guard, fcntl.LOCK_EX)
+        usage = load_usage()
+        update(usage)
+        temp = USAGE_FILE.with_name(f".{USAGE_FILE.name}.tmp")
+        with temp.open("w", encoding="utf-8") as f:
+            json.dump(usage, f, indent=2, sort_keys=True)
+        temp.replace(USAGE_FILE)
+
+
+def load_usage() -> dict[str, float]:
+    try:
+        with USAGE_FILE.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def record_use(*build_dirs: Path) -> None:
+    """
+    Marks build directories as used now (builds, SITL launches).
+    """
+    now = time.time()
+    _update_usage(lambda usage: usage.update({str(path.resolve()): now for path in build_dirs}))
+
+
+def _disk_usage(path: Path) -> int:
+    # allocated blocks, like du: sparse files and hardlinks into the ccache are not counted twice
+    total, seen = 0, set()
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_blocks * 512
+    return total
+
+
+def _busy_paths() -> set[Path]:
+    """
+    Working directories and executables of the running processes (e.g. SITL instances).
+    """
+    paths = set()
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        for link in ("cwd", "exe"):
+            try:
+                paths.add(Path(os.readlink(f"/proc/{pid}/{link}")))
+            except OSError:
+                continue
+    return paths
+
+
+def _locked_targets(tree: Path) -> Optional[set[str]]:
+    """
+    Targets of the jobs holding or waiting for the lock of `tree`, None if one
+    of them did not say which targets it uses (the whole tree is in use).
+    """
+    targets = set()
+    for _, owner in TreeLock(tree, "gc").queue():
+        if owner.get("targets") is None:
+            return None
+        targets.update(owner["targets"])
+    return targets
+
+
+def trees() -> list[Path]:
+    """
+    The PX4 tree and its version matrix worktrees.
+    """
+    found = [PX4_DIR] if PX4_DIR.is_dir() else []
+    if WORKTREES_DIR.is_dir():
+        found += sorted(path for path in WORKTREES_DIR.iterdir() if path.is_dir())
+    return found
+
+
+@dataclass
+class BuildDir:
+    path: Path
+    tree: Path
+    size: int
+    last_used: float
+    # why it can not be removed now, None if it can
+    in_use: Optional[str] = None
+
+    @property
+    def target(self) -> str:
+        return self.path.name
+
+
+@dataclass
+class CollectResult:
+    build_dirs: list[BuildDir] = field(default_factory=list)
+    evicted: list[BuildDir] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(entry.size for entry in self.build_dirs)
+
+    @property
+    def freed(self) -> int:
+        return sum(entry.size for entry in self.evicted)
+
+
+def _in_use(path: Path, tree: Path, busy: set[Path]) -> Optional[str]:
+    locked = _locked_targets(tree)
+    if locked is None:
+        return "tree locked"
+    if path.name in locked:
+        return "target locked"
+    if any(p == path or path in p.parents for p in busy):
+        return "process running in it"
+    return None
+
+
+def scan(tree_dirs: Optional[list[Path]] = None) -> list[BuildDir]:
+    """
+    Build directories of the trees, least recently used first. Directories never
+    recorded by a build count as used at their last modification.
+    """
+    usage = load_usage()
+    busy = _busy_paths()
+    found = []
+
+    for tree in tree_dirs if tree_dirs is not None else trees():
+        build_root = tree / "build"
+        if not build_root.is_dir():
+            continue
+        for path in build_root.iterdir():
+            if not path.is_dir() or path.is_symlink():
+                continue
+            if path.name.startswith(_TRASH_PREFIX):
+                # left over by an interrupted collection
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            last_used = usage.get(str(path.resolve()), path.stat().st_mtime)
+            found.append(BuildDir(path, tree, _disk_usage(path), last_used, _in_use(path, tree, busy)))
+
+    return sorted(found, key=lambda entry: entry.last_used)
+
+
+def collect(quota: int, dry_run: bool = False, tree_dirs: Optional[list[Path]] = None, logger=None) -> CollectResult:
+    """
+    Removes the least recently used build directories until all of them fit in `quota` bytes.
+    Directories of targets locked by running jobs, or used by a running process, are never removed.
+    """
+    logger = logger if logger is not None else get_logger("gc")
+    result = CollectResult(scan(tree_dirs))
+
+    total = result.total
+    for entry in result.build_dirs:
+        if total <= quota:
+            break
+        if entry.in_use is not None:
+            continue
+
+        if not dry_run:
+            trash = entry.path.with_name(f"{_TRASH_PREFIX}{os.getpid()}-{entry.target}")
+            # no job can join the queue of the tree between the check and the rename
+            with TreeLock(entry.tree, "gc").queue_guard():
+                # the lock may have been taken since the scan
+                entry.in_use = _in_use(entry.path, entry.tree, _busy_paths())
+                if entry.in_use is not None:
+                    continue
+                try:
+                    entry.path.rename(trash)
+                except OSError as e:
+                    logger.warning(f"Cannot remove {entry.path}: {e}")
+                    continue
+            shutil.rmtree(trash, ignore_errors=True)
+
+        logger.info(f"{'Would remove' if dry_run else 'Removed'} {entry.path} ({format_size(entry.size)}, "
+                    f"last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.last_used))})")
+        result.evicted.append(entry)
+        total -= entry.size
+
+    if result.evicted and not dry_run:
+        removed = {str(entry.path.resolve()) for entry in result.evicted}
+        _update_usage(lambda usage: [usage.pop(path, None) for path in removed])
+
+    if total > quota:
+        logger.warning(f"Build directories still use {format_size(total)}, over the quota of {format_size(quota)}: "
+                       "the rest is in use.")
+    return result
@@ -0,0 +1,100 @@
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+# see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# every event that can change the content of a file in a watched directory
+FILE_CHANGES = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyEvent(NamedTuple):
+    directory: Path
+    name: str
+    mask: int
+
+
+class Inotify:
+    """
+    Minimal inotify(7) wrapper on top of libc, without third party dependencies.
+    """
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c")
+        self.__libc = ctypes.CDLL(libc_name, use_errno=True)
+
+        self.fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+
+        self.__watches: dict[int, Path] = {}
+
+    def add_watch(self, directory: Union[str, Path], mask: int = FILE_CHANGES) -> int:
+        directory = Path(directory).resolve()
+        wd = self.__libc.inotify_add_watch(self.fd, os.fsencode(directory), mask | IN_ONLYDIR)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch({directory}) failed: {os.strerror(err)}")
+        self.__watches[wd] = directory
+        return wd
+
+    def read(self, timeout: Optional[float] = None) -> list[InotifyEvent]:
+        """
+        Waits up to `timeout` seconds (forever if None) and returns the pending events.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+
+            if mask & IN_IGNORED:
+                self.__watches.pop(wd, None)
+                continue
+            if wd in self.__watches:
+                events.append(InotifyEvent(self.__watches[wd], name, mask))
+        return events
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import fcntl
+import socket
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Optional
+from datetime import datetime, timezone
+
+from .errors import LockTimeoutError
+from .logger import get_logger
+from .paths import STATE_DIR
+
+LOCKS_DIR = STATE_DIR / "locks"
+
+# overrides the job name shown to the jobs waiting in the queue (e.g. the CI job id)
+JOB_NAME_ENV = "EASY_PX4_JOB_NAME"
+
+# jobs touch their ticket at this interval (seconds), tickets from other hosts
+# untouched for STALE_AFTER are considered left by a crashed job
+HEARTBEAT = 30.0
+STALE_AFTER = 300.0
+
+
+def _process_start(pid: int) -> Optional[int]:
+    """
+    Start time of a process (clock ticks after boot), None if it does not exist.
+    Together with the pid it identifies a process even if the pid is reused.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _format_age(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+class TreeLock:
+    """
+    Cross-process lock of one PX4 tree with a FIFO wait queue.
+
+    Every job takes a numbered ticket (a file in the lock directory) and waits
+    until all lower tickets are gone, then takes an exclusive flock on the
+    tree. Tickets of processes that died without releasing are removed by the
+    waiting jobs, and the flock is released by the kernel, so a crashed job
+    never blocks the queue. The process of a job on another host sharing the
+    work dir can not be checked: its ticket is removed once its heartbeat
+    (the mtime of the ticket) is older than STALE_AFTER.
+
+    `targets` are the build directories the job uses, recorded in its ticket for
+    `easy_px4 gc`. Without them the job is assumed to use the whole tree.
+    """
+
+    def __init__(self, tree: Path, job: str, timeout: Optional[float] = None, logger=None, poll: float = 1.0,
+                 targets: Optional[list[str]] = None) -> None:
+        self.tree = tree
+        self.job = os.environ.get(JOB_NAME_ENV) or job
+        self.targets = targets
+        self.timeout = timeout
+        self.logger = logger if logger is not None else get_logger("lock")
+        self.poll = poll
+
+        key = hashlib.sha1(str(Path(tree).resolve()).encode()).hexdigest()[:16]
+        self.directory = LOCKS_DIR / key
+        self.ticket: Optional[Path] = None
+        self.fd: Optional[int] = None
+        self.__stop_heartbeat: Optional[threading.Event] = None
+
+    @property
+    def held(self) -> bool:
+        return self.fd is not None
+
+    @contextmanager
+    def queue_guard(self):
+        """
+        Keeps new jobs from joining the queue inside the block, e.g. between
+        checking the queue and acting on what it holds.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with (self.directory / "queue.lock").open("a") as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            yield
+
+    def __take_ticket(self) -> Path:
+        with self.queue_guard():
+            counter = self.directory / "counter"
+            try:
+                number = int(counter.read_text()) + 1
+            except (FileNotFoundError, ValueError):
+                number = 1
+            counter.write_text(str(number))
+
+            pid = os.getpid()
+            ticket = self.directory / f"{number:012d}.ticket"
+            ticket.write_text(json.dumps({
+                "job": self.job,
+                "tree": str(self.tree),
+                "targets": self.targets,
+                "pid": pid,
+                "start": _process_start(pid),
+                "host": socket.gethostname(),
+                "since": datetime.now(timezone.utc).isoformat(),
+            }))
+        return ticket
+
+    def __start_heartbeat(self) -> None:
+        ticket, stop = self.ticket, threading.Event()
+
+        def beat() -> None:
+            while not stop.wait(HEARTBEAT):
+                try:
+                    os.utime(ticket)
+                except FileNotFoundError:
+                    return
+
+        self.__stop_heartbeat = stop
+        threading.Thread(target=beat, name="easy_px4-lock-heartbeat", daemon=True).start()
+
+    def __stop(self) -> None:
+        if self.__stop_heartbeat is not None:
+            self.__stop_heartbeat.set()
+            self.__stop_heartbeat = None
+
+    def __alive(self, ticket: Path, owner: dict) -> bool:
+        if owner.get("host") != socket.gethostname():
+            # the process is on another host sharing the work dir, only its heartbeat can tell
+            try:
+                return time.time() - ticket.stat().st_mtime < STALE_AFTER
+            except FileNotFoundError:
+                return True  # released meanwhile
+        start = _process_start(owner.get("pid", -1))
+        return start is not None and start == owner.get("start")
+
+    def queue(self) -> list[tuple[Path, dict]]:
+        """
+        Tickets in the queue, oldest first. Tickets of dead processes are removed.
+        """
+        tickets = []
+        for ticket in sorted(self.directory.glob("*.ticket")):
+            try:
+                owner = json.loads(ticket.read_text())
+            except (OSError, ValueError):
+                continue  # being written or already released
+            if not self.__alive(ticket, owner):
+                self.logger.warning(f"Removing stale lock of job '{owner.get('job')}' "
+                                    f"(pid {owner.get('pid')} on {owner.get('host')})")
+                ticket.unlink(missing_ok=True)
+                continue
+            tickets.append((ticket, owner))
+        return tickets
+
+    def __try_lock(self) -> bool:
+        fd = os.open(self.directory / "tree.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)  # the previous holder is still releasing
+            return False
+        self.fd = fd
+        return True
+
+    def acquire(self) -> None:
+        if self.held:
+            return
+
+        started = time.monotonic()
+        self.ticket = self.__take_ticket()
+        self.__start_heartbeat()
+        last_head = None
+
+        try:
+            while True:
+                ahead = [(t, owner) for t, owner in self.queue() if t.name < self.ticket.name]
+
+                if not ahead and self.__try_lock():
+                    if last_head is not None:
+                        self.logger.info(f"Acquired the PX4 tree lock after {_format_age(time.monotonic() - started)}.")
+                    return
+
+                if ahead and ahead[0][0] != last_head:
+                    last_head, owner = ahead[0]
+                    since = datetime.fromisoformat(owner["since"])
+                    age = (datetime.now(timezone.utc) - since).total_seconds()
+                    self.logger.info(
+                        f"PX4 tree {self.tree} is busy. Waiting behind job '{owner.get('job')}' "
+                        f"(pid {owner.get('pid')} on {owner.get('host')}, running for {_format_age(age)}), "
+                        f"{len(ahead)} job(s) ahead."
+                    )
+
+                if self.timeout is not None and time.monotonic() - started >= self.timeout:
+                    holder = ahead[0][1].get("job") if ahead else "unknown"
+                    raise LockTimeoutError(
+                        f"Timed out after {_format_age(self.timeout)} waiting for the PX4 tree lock "
+                        f"(held by job '{holder}', {len(ahead)} job(s) ahead)."
+                    )
+
+                time.sleep(self.poll)
+        except BaseException:
+            self.__stop()
+            self.ticket.unlink(missing_ok=True)
+            self.ticket = None
+            raise
+
+    def release(self) -> None:
+        self.__stop()
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        if self.ticket is not None:
+            self.ticket.unlink(missing_ok=True)
+            self.ticket = None
+
+    def __enter__(self) -> "TreeLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
@@ -1,6 +1,14 @@
 import os
 import sys
+import json
+import queue
+import atexit
 import logging
+import logging.handlers
+from typing import Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
 
 # ANSI escape codes for colors
 LOG_COLORS = {
@@ -12,15 +20,85 @@ LOG_COLORS = {
     'RESET': '\033[0m',
 }
 
+LOG_FORMATS = ["text", "json"]
+
+# build phase of the current thread (set by the builder), attached to every record
+_phase: ContextVar[Optional[str]] = ContextVar("phase", default=None)
+
+
+@contextmanager
+def log_phase(name: str):
+    token = _phase.set(name)
+    try:
+        yield
+    finally:
+        _phase.reset(token)
+
+
+class PhaseFilter(logging.Filter):
+    """
+    Stores the build phase on the record while still in the logging thread.
+    """
+    def filter(self, record):
+        if not hasattr(record, "phase"):
+            record.phase = _phase.get()
+        return True
+
+
 class ColoredCommandFormatter(logging.Formatter):
-    def format(self, record):
-        color = LOG_COLORS.get(record.levelname, '')
-        reset = LOG_COLORS['RESET']
-        level = f"{color}[{record.levelname}]{reset}"
+    # level prefixes are built once, not on every record
+    LEVELS = {name: f"{color}[{name}]{LOG_COLORS['RESET']}" for name, color in LOG_COLORS.items() if name != 'RESET'}
 
+    def format(self, record):
+        level = self.LEVELS.get(record.levelname) or f"[{record.levelname}]"
         command = record.__dict__.get("command", __package__)
-        record.msg = f"{level} [{command}] {record.msg}"
-        return super().format(record)
+        return f"{level} [{command}] {super().format(record)}"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, command, phase, message and
+    the `fields` given as extra (`logger.info("...", extra={"fields": {...}})`).
+    """
+    def format(self, record):
+        event = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "command": record.__dict__.get("command", __package__),
+            "phase": record.__dict__.get("phase"),
+            "message": record.getMessage(),
+        }
+        fields = record.__dict__.get("fields")
+        if fields:
+            event["fields"] = fields
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            event["exception"] = record.exc_text
+        return json.dumps(event, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # the listener is the only consumer: merge the arguments and the traceback
+        # now (their objects may change later) but skip the format and copy of the stdlib
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class CommandAdapter(logging.LoggerAdapter):
+    """
+    LoggerAdapter adding the command to every record, keeping the caller's extra.
+    """
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
 
 # Check DEBUG=1 from environme
 debug_enabled = os.getenv("DEBUG") == "1"
@@ -38,9 +116,68 @@ if not _base_logger.handlers:
 
     _base_logger.addHandler(handler)
 
+if not any(isinstance(f, PhaseFilter) for f in _base_logger.filters):
+    _base_logger.addFilter(PhaseFilter())
+
 _base_logger.propagate = False
 
+_queue: Optional[queue.Queue] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_log_format = "text"
+
+
+def configure_logging(log_format: str = "text") -> None:
+    """
+    Routes the easy_px4 logs through a queue to a background thread writing to stdout,
+    so a slow terminal or pipe never blocks the thread reading subprocess output.
+    """
+    global _queue, _listener, _log_format
+
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format: {log_format}. Expected one of {LOG_FORMATS}")
+
+    shutdown_logging()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setLevel(logging.DEBUG)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else ColoredCommandFormatter("%(message)s"))
+
+    _queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(_queue, handler, respect_handler_level=True)
+
+    for old in list(_base_logger.handlers):
+        _base_logger.removeHandler(old)
+    _base_logger.addHandler(_QueueHandler(_queue))
+
+    _log_format = log_format
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """
+    Writes the queued records and stops the background thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def flush_logs() -> None:
+    """
+    Blocks until every queued record has been written (before printing to stdout directly).
+    """
+    if _queue is not None and _listener is not None:
+        _queue.join()
+
+
+def structured_logging() -> bool:
+    return _log_format == "json"
+
+
 # Function to get a logger with command context
 def get_logger(command: str = "main") -> logging.LoggerAdapter:
-    return logging.LoggerAdapter(_base_logger, {"command": command})
-
+    return CommandAdapter(_base_logger, {"command": command})
@@ -0,0 +1,109 @@
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Union
+
+from .paths import ARTIFACTS_DIR
+
+MANIFEST_SCHEMA = 1
+MANIFEST_NAME = "easy_px4_manifest.json"
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: Union[str, Path]) -> str:
+    """
+    Returns the hex SHA-256 digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_inputs(files: dict[str, Path]) -> dict[str, str]:
+    """
+    Hashes the build inputs.
+
+    Args:
+    - files: mapping from a stable label (e.g. "params.airframe") to the file path.
+    """
+    return {label: sha256_file(path) for label, path in sorted(files.items())}
+
+
+def store_artifact(source: Path, destination: Path) -> dict:
+    """
+    Stores `source` in the content-addressed artifact store and places it at `destination`.
+
+    Identical artifacts are kept once in the store and hardlinked into every output
+    directory, read-only like the store. If a hardlink is not possible (e.g. the
+    output lives on another filesystem) the artifact is copied instead, as a
+    regular writable file.
+
+    Returns the manifest entry describing the artifact.
+    """
+    digest = sha256_file(source)
+    blob = ARTIFACTS_DIR / digest[:2] / digest
+
+    if not blob.is_file():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        temp = blob.with_name(f"{digest}.{os.getpid()}.tmp")
+        shutil.copy2(source, temp)
+        # blobs are shared by every hardlink, never edit them in place
+        temp.chmod(0o444)
+        temp.replace(blob)
+
+    linked = destination.exists() and os.path.samefile(blob, destination)
+
+    if not linked:
+        if destination.exists() or destination.is_symlink():
+            destination.unlink()
+        try:
+            os.link(blob, destination)
+            linked = True
+        except OSError:
+            # the content and mtime of the blob, with the default permissions of a new file
+            shutil.copyfile(blob, destination)
+            stat = blob.stat()
+            os.utime(destination, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    return {
+        "name": destination.name,
+        "path": str(destination),
+        "sha256": digest,
+        "size": blob.stat().st_size,
+        "hardlinked": linked,
+    }
+
+
+def describe_artifact(path: Path) -> dict:
+    """
+    Manifest entry for an artifact that is not copied out of the build directory.
+    """
+    return {
+        "name": path.name,
+        "path": str(path),
+        "sha256": sha256_file(path),
+        "size": path.stat().st_size,
+        "hardlinked": False,
+    }
+
+
+def write_manifest(path: Path, manifest: dict) -> None:
+    """
+    Atomically writes a manifest as JSON.
+    """
+    manifest = {"schema": MANIFEST_SCHEMA, **manifest}
+    temp = path.with_name(f"{path.name}.tmp")
+    with temp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    temp.replace(path)
+
+
+def load_manifest(path: Path) -> dict:
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,259 @@
+import re
+import time
+import threading
+from pathlib import Path
+from typing import Optional
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+
+from easy_px4_utils import load_directory
+
+from .errors import EasyPX4Error, ConfigurationError, GitError
+from .logger import get_logger
+from .paths import PX4_DIR, WORKTREES_DIR
+from .runner import run_command
+from .planner import Planner, remember_tag
+from .lock import TreeLock
+from .builder import Builder, BuildOptions, BuildResult, renamed_tag_for
+
+# abbreviated or full commit hashes, anything else is treated as a release tag
+COMMIT_PATTERN = re.compile(r"[0-9a-fA-F]{7,40}")
+
+
+@dataclass
+class MatrixEntry:
+    """
+    One PX4 version (release tag or commit) of a matrix build.
+    """
+    ref: str
+    px4_version: Optional[str]
+    px4_commit: Optional[str]
+    worktree: Path
+    result: Optional[BuildResult] = None
+    duration_s: float = 0.0
+
+    @property
+    def firmware_size(self) -> Optional[int]:
+        if self.result is None or not self.result.artifacts:
+            return None
+        return self.result.artifacts[0].get("size")
+
+
+def worktree_name(ref: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", ref)
+
+
+class MatrixBuilder:
+    """
+    Builds one airframe directory against several PX4 versions.
+
+    Every version gets its own git worktree of the PX4 repository under
+    WORKTREES_DIR, so the checkouts (and their build directories) are kept
+    between runs and versions compile in parallel. Worktrees share the object
+    store and refs, therefore git steps are serialized, `make` is not.
+
+    The builds are pipelined: `jobs` bounds the versions compiling at once,
+    and one more version fetches, checks out and stages its worktree in the
+    meantime, so git and network I/O overlap with compilation.
+    """
+
+    def __init__(self, options: BuildOptions, refs: list[str], jobs: Optional[int] = None,
+                 logger=None, px4_dir: Path = PX4_DIR) -> None:
+        if not refs:
+            raise ConfigurationError("No PX4 versions given.")
+        if options.msgs_output is not None:
+            raise ConfigurationError("--msgs-output can not be combined with a version matrix.")
+        if jobs is not None and jobs < 1:
+            raise ConfigurationError(f"'jobs' must be at least 1, got {jobs}")
+
+        self.options = options
+        self.refs = list(dict.fromkeys(refs))
+        self.jobs = jobs
+        self.logger = logger if logger is not None else get_logger("build")
+        self.px4_dir = px4_dir
+
+        self.git_lock = threading.Lock()
+        self.compile_slots: Optional[threading.Semaphore] = None
+        self.info = None
+        self.entries: list[MatrixEntry] = []
+        self.builders: list[Builder] = []
+
+    def __entry(self, ref: str) -> MatrixEntry:
+        worktree = WORKTREES_DIR / worktree_name(ref)
+        if COMMIT_PATTERN.fullmatch(ref):
+            return MatrixEntry(ref, None, ref, worktree)
+        return MatrixEntry(ref, ref, None, worktree)
+
+    def __resolve(self, info, entry: MatrixEntry) -> str:
+        """
+        Commit of the entry, fetching the release tag into the shared repository if needed.
+        """
+        entry_info = replace(info, px4_version=entry.px4_version or info.px4_version, px4_commit=entry.px4_commit)
+        planner = Planner(self.px4_dir)
+
+        commit = planner.resolve(entry_info)
+        if commit is not None:
+            return commit
+
+        if entry.px4_commit:
+            raise GitError(f"Commit {entry.px4_commit} is not known locally.")
+
+        self.logger.info(f"Fetching PX4 tag: {entry.px4_version}")
+        fetch = run_command(["git", "fetch", "origin", "tag", entry.px4_version], cwd=self.px4_dir)
+        commit = planner.resolve(entry_info) if fetch.returncode == 0 else None
+        if commit is None:
+            raise GitError(f"Failed to fetch tag {entry.px4_version}", fetch.stderr.splitlines()[-50:])
+        remember_tag(entry.px4_version, commit)
+        return commit
+
+    def __prepare_worktree(self, entry: MatrixEntry, commit: str) -> None:
+        if (entry.worktree / ".git").exists():
+            return
+
+        self.logger.info(f"Creating worktree for {entry.ref} in {entry.worktree}")
+        run_command(["git", "worktree", "prune"], cwd=self.px4_dir)
+        entry.worktree.parent.mkdir(parents=True, exist_ok=True)
+        res = run_command(["git", "worktree", "add", "--detach", str(entry.worktree), commit], cwd=self.px4_dir)
+        if res.returncode != 0:
+            raise GitError(f"Failed to create worktree for {entry.ref}", res.stderr.splitlines()[-50:])
+
+    def __options_for(self, entry: MatrixEntry) -> BuildOptions:
+        output = self.options.output
+        if output is not None:
+            output = output / worktree_name(entry.ref)
+            if not self.options.dry_run:
+                output.mkdir(parents=True, exist_ok=True)
+
+        return replace(self.options,
+                       output=output if output is None or output.is_dir() else None,
+                       px4_version=entry.px4_version,
+                       px4_commit=entry.px4_commit)
+
+    def __prepare(self, entry: MatrixEntry) -> bool:
+        """
+        Resolves (fetching if needed) the commit of the entry and creates its worktree.
+        """
+        # fetching and adding worktrees changes the refs of the main tree
+        with self.git_lock, TreeLock(self.px4_dir, f"matrix {self.info.name}",
+                                     timeout=self.options.lock_timeout, logger=self.logger):
+            try:
+                self.__prepare_worktree(entry, self.__resolve(self.info, entry))
+            except EasyPX4Error as e:
+                self.logger.error(str(e))
+                entry.result = BuildResult(status="failed", error=str(e), tail=e.tail)
+                return False
+        return True
+
+    def __build(self, entry: MatrixEntry) -> None:
+        logger = get_logger(f"build {entry.ref}")
+        started = time.perf_counter()
+
+        if not self.options.dry_run and not self.__prepare(entry):
+            entry.duration_s = round(time.perf_counter() - started, 3)
+            return
+
+        if not (entry.worktree / ".git").exists():
+            # only reachable with --dry-run, the worktree is created on the real run
+            entry.result = BuildResult(status="planned", plan=[f"run  worktree   {entry.worktree} missing"])
+            return
+
+        builder = Builder(self.__options_for(entry), logger=logger, px4_dir=entry.worktree,
+                          live=False, git_lock=self.git_lock, compile_slots=self.compile_slots)
+        self.builders.append(builder)
+
+        try:
+            entry.result = builder.run()
+        except EasyPX4Error as e:
+            logger.error(str(e))
+            for line in e.tail:
+                logger.error(f"  {line}")
+            entry.result = e.result if e.result is not None else BuildResult(status="failed", error=str(e))
+        finally:
+            entry.duration_s = round(time.perf_counter() - started, 3)
+            builder.cleanup()
+            self.builders.remove(builder)
+
+        logger.info(f"{entry.result.status} in {entry.duration_s}s")
+
+    def __build_group(self, group: list[MatrixEntry]) -> None:
+        for entry in group:
+            self.__build(entry)
+
+    def run(self) -> list[MatrixEntry]:
+        """
+        Builds every version and returns the entries with their results.
+        Failures of single versions are recorded in their result, not raised.
+        """
+        try:
+            info = self.info = load_directory(self.options.path, self.options.build_type).get_info()
+        except (FileNotFoundError, KeyError, TypeError, ValueError) as e:
+            raise ConfigurationError(f"Invalid airframe directory {self.options.path}: {e}") from e
+
+        groups: dict[str, list[MatrixEntry]] = {}
+        self.entries = [self.__entry(ref) for ref in self.refs]
+
+        for entry in self.entries:
+            # entries sharing the renamed tag (commits annotated with the same px4_version)
+            # can not be tagged at the same time, they are built one after the other
+            entry_info = replace(info, px4_version=entry.px4_version or info.px4_version)
+            groups.setdefault(renamed_tag_for(entry_info), []).append(entry)
+
+        jobs = self.jobs or max(len(groups), 1)
+        self.compile_slots = threading.Semaphore(jobs)
+        self.logger.info(f"Building {info.name} against {len(self.refs)} PX4 versions ({jobs} compiling at once)")
+
+        started = time.perf_counter()
+        # one worker more than compile slots: the next version prepares while the others compile
+        with ThreadPoolExecutor(max_workers=max(min(len(groups), jobs + 1), 1)) as pool:
+            for future in [pool.submit(self.__build_group, group) for group in groups.values()]:
+                future.result()
+
+        if not self.options.dry_run:
+            make_s = sum(e.result.timings.get("make", 0.0) for e in self.entries if e.result is not None)
+            self.logger.info(f"Matrix took {time.perf_counter() - started:.1f}s, the compile times add up to {make_s:.1f}s")
+
+        return self.entries
+
+    def table(self) -> list[str]:
+        """
+        Summary lines: version, status, build time, CPU time of the children, firmware size and commit.
+        """
+        width = max(len("version"), *(len(e.ref) for e in self.entries))
+        lines = [f"{'version':<{width}}  {'status':<10}  {'time':>9}  {'cpu':>9}  {'size':>12}  commit"]
+        for entry in self.entries:
+            result = entry.result or BuildResult(status="failed")
+            size = entry.firmware_size
+            size_text = f"{size / 1024:.1f} KiB" if size is not None else "-"
+            cpu = sum(usage.user_s + usage.system_s for usage in result.rusage.values())
+            lines.append(
+                f"{entry.ref:<{width}}  {result.status:<10}  {entry.duration_s:>8.1f}s  {cpu:>8.1f}s  {size_text:>12}  "
+                f"{(result.commit or '-')[:12]}"
+            )
+        return lines
+
+    def cleanup(self) -> None:
+        """
+        Restores the worktrees of builds still running (interrupted matrix).
+        """
+        for builder in list(self.builders):
+            builder.cleanup()
+
+
+def build_matrix(path, refs: list[str], build_type: str = "firmware", jobs: Optional[int] = None,
+                 logger=None, **options) -> list[MatrixEntry]:
+    """
+    Builds an airframe directory against several PX4 versions (release tags or commits) in-process.
+
+    Args:
+    - path: airframe directory.
+    - refs: PX4 release tags (e.g. "v1.16.0") or commit hashes, overriding info.toml.
+    - build_type: "firmware" or "sitl".
+    - jobs: versions compiling at once (the next one prepares meanwhile), default all of them.
+    - logger: optional logger, defaults to the easy_px4 "build" logger.
+    - **options: any other field of `BuildOptions`.
+    """
+    matrix = MatrixBuilder(BuildOptions(build_type=build_type, path=path, **options), refs, jobs=jobs, logger=logger)
+    try:
+        return matrix.run()
+    finally:
+        matrix.cleanup()
@@ -0,0 +1,142 @@
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+from .runner import run_command
+
+# directory of the node-exporter textfile collector, used when --metrics-dir is not given
+METRICS_DIR_ENV = "EASY_PX4_METRICS_DIR"
+
+PREFIX = "easy_px4_build"
+
+
+def ccache_stats() -> Optional[dict[str, int]]:
+    """
+    Hit and miss counters of ccache, or None if ccache is not installed
+    or too old for `--print-stats` (ccache < 4.4).
+    """
+    if shutil.which("ccache") is None:
+        return None
+
+    res = run_command(["ccache", "--print-stats"])
+    if res.returncode != 0:
+        return None
+
+    stats = {}
+    for line in res.stdout.splitlines():
+        key, _, value = line.partition("\t")
+        if value.strip().isdigit():
+            stats[key] = int(value)
+
+    if "cache_miss" not in stats:
+        return None
+    return {
+        "hits": stats.get("direct_cache_hit", 0) + stats.get("preprocessed_cache_hit", 0),
+        "misses": stats["cache_miss"],
+    }
+
+
+def ccache_delta(before: Optional[dict[str, int]], after: Optional[dict[str, int]]) -> Optional[dict[str, int]]:
+    if before is None or after is None:
+        return None
+    return {key: max(after[key] - before[key], 0) for key in after}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict[str, str]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsFile:
+    """
+    Builder of a file in the Prometheus text exposition format, as read by the
+    node-exporter textfile collector.
+    """
+
+    def __init__(self) -> None:
+        self.families: dict[str, tuple[str, str, list[str]]] = {}
+
+    def add(self, name: str, kind: str, help_text: str, labels: dict[str, str], value: float) -> None:
+        name = f"{PREFIX}_{name}"
+        family = self.families.setdefault(name, (kind, help_text, []))
+        family[2].append(f"{name}{_labels(labels)} {value}")
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, samples) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def metrics_file_name(target: str, px4_version: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", f"easy_px4_{target}_{px4_version}") + ".prom"
+
+
+def write_metrics(directory: Path, result, airframe: str, px4_version: str) -> Path:
+    """
+    Writes the metrics of a finished (or failed) build to `directory`.
+
+    The file is replaced atomically, so the collector never reads a partial file.
+    """
+    target = result.target or airframe
+    base = {"airframe": airframe, "target": target, "px4_version": px4_version}
+    metrics = MetricsFile()
+
+    metrics.add("success", "gauge", "1 if the last build succeeded (or was up to date), 0 otherwise.",
+                base, int(result.ok))
+    metrics.add("status", "gauge", "Outcome of the last build, 1 for the current status.",
+                {**base, "status": result.status}, 1)
+    finished = result.finished_at if result.finished_at is not None else time.time()
+    metrics.add("last_run_timestamp_seconds", "gauge", "Unix time the last build finished.",
+                base, round(finished, 3))
+    if result.started_at is not None:
+        metrics.add("duration_seconds", "gauge", "Wall-clock duration of the last build.",
+                    base, round(finished - result.started_at, 3))
+
+    for phase, seconds in result.timings.items():
+        metrics.add("phase_duration_seconds", "gauge", "Wall-clock duration of a phase of the last build.",
+                    {**base, "phase": phase}, seconds)
+
+    for phase, usage in result.rusage.items():
+        metrics.add("phase_cpu_seconds", "gauge", "User and system CPU time of the child processes of a phase.",
+                    {**base, "phase": phase}, round(usage.user_s + usage.system_s, 3))
+        metrics.add("phase_max_rss_bytes", "gauge", "Peak resident memory of the child processes of a phase.",
+                    {**base, "phase": phase}, int(usage.max_rss_mb * 2**20))
+
+    for artifact in result.artifacts:
+        metrics.add("artifact_size_bytes", "gauge", "Size of a build artifact.",
+                    {**base, "artifact": artifact["name"]}, artifact["size"])
+
+    for cache, counters in result.cache.items():
+        metrics.add("cache_hits", "gauge", "Cache hits of the last build (steps skipped, ccache hits).",
+                    {**base, "cache": cache}, counters.get("hits", 0))
+        metrics.add("cache_misses", "gauge", "Cache misses of the last build.",
+                    {**base, "cache": cache}, counters.get("misses", 0))
+
+    if result.size is not None:
+        metrics.add("flash_bytes", "gauge", "Flash used by the firmware (text and initialized data).",
+                    base, result.size.flash)
+        metrics.add("ram_static_bytes", "gauge", "Statically allocated RAM of the firmware (data and bss).",
+                    base, result.size.data + result.size.bss)
+        if result.size.flash_limit:
+            metrics.add("flash_limit_bytes", "gauge", "Flash available for the firmware on the board.",
+                        base, result.size.flash_limit)
+
+    for direction, value in result.dds_bandwidth.items():
+        metrics.add("dds_bandwidth_bytes_per_second", "gauge", "Estimated uXRCE-DDS link bandwidth of the custom topics.",
+                    {**base, "direction": direction}, round(value, 1))
+
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / metrics_file_name(target, px4_version)
+    temp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temp.write_text(metrics.render(), encoding="utf-8")
+    temp.replace(path)
+    return path
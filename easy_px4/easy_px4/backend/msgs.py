@@ -0,0 +1,329 @@
+import re
+import json
+from pathlib import Path
+from dataclasses import asdict, dataclass, field
+from typing import NamedTuple, Optional
+
+from .paths import STATE_DIR
+from .runner import run_command
+
+# parsed definitions per PX4 commit (<commit>.json)
+MSGS_DIR = STATE_DIR / "msgs"
+INDEX_SCHEMA = 1
+
+# directories of the message and service definitions in the PX4 tree
+DEFINITION_DIRS = ("msg", "srv")
+
+# size of the primitive types of a .msg file (CDR aligns each one to its size)
+PRIMITIVES = {
+    "bool": 1, "byte": 1, "char": 1, "int8": 1, "uint8": 1,
+    "int16": 2, "uint16": 2,
+    "int32": 4, "uint32": 4, "float32": 4,
+    "int64": 8, "uint64": 8, "float64": 8,
+}
+
+_FIELD = re.compile(
+    r"^(?P<type>[A-Za-z_][\w/]*)"
+    r"(?:\[(?P<bounded><=)?(?P<length>\d*)\])?"
+    r"\s+(?P<name>[A-Za-z_]\w*)"
+    r"(?:\s*=\s*(?P<constant>.+?)|\s+(?P<default>\S.*?))?\s*$"
+)
+
+
+class MsgField(NamedTuple):
+    type: str
+    name: str
+    # None for a scalar, the (maximum) length for an array, 0 for an unbounded array
+    length: Optional[int] = None
+    bounded: bool = False
+
+
+@dataclass
+class MsgDefinition:
+    name: str
+    fields: list[MsgField] = field(default_factory=list)
+    constants: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def version(self) -> Optional[int]:
+        """
+        MESSAGE_VERSION of a versioned message (msg/versioned, PX4 >= v1.16).
+        """
+        value = self.constants.get("MESSAGE_VERSION")
+        return int(value) if value is not None and value.isdigit() else None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MsgDefinition":
+        return cls(data["name"], [MsgField(*f) for f in data["fields"]], data["constants"])
+
+
+def parse_msg(name: str, text: str) -> MsgDefinition:
+    """
+    Fields and constants of a `.msg` file. Comments (`# TOPICS ...` included) are ignored.
+    """
+    definition = MsgDefinition(name)
+    for number, raw in enumerate(text.splitlines(), start=1):
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+
+        match = _FIELD.match(line)
+        if match is None:
+            raise ValueError(f"{name}.msg:{number}: cannot parse {raw.strip()!r}")
+
+        field_type = match.group("type").rsplit("/", 1)[-1]
+        if match.group("constant") is not None:
+            definition.constants[match.group("name")] = match.group("constant")
+            continue
+
+        length = None
+        if match.group("length") is not None or match.group("bounded"):
+            length = int(match.group("length") or 0)
+        definition.fields.append(MsgField(field_type, match.group("name"), length, bool(match.group("bounded"))))
+
+    return definition
+
+
+@dataclass
+class SrvDefinition:
+    name: str
+    request: MsgDefinition
+    response: MsgDefinition
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SrvDefinition":
+        return cls(data["name"], MsgDefinition.from_dict(data["request"]), MsgDefinition.from_dict(data["response"]))
+
+
+def parse_srv(name: str, text: str) -> SrvDefinition:
+    """
+    Request and response of a `.srv` file (separated by `---`).
+    """
+    parts = re.split(r"^---\s*$", text, maxsplit=1, flags=re.MULTILINE)
+    response = parts[1] if len(parts) > 1 else ""
+    return SrvDefinition(name, parse_msg(f"{name}_Request", parts[0]), parse_msg(f"{name}_Response", response))
+
+
+@dataclass
+class MsgIndex:
+    """
+    Parsed `.msg` and `.srv` definitions of a PX4 commit, with the path of each in the tree.
+    """
+    commit: str
+    messages: dict[str, MsgDefinition] = field(default_factory=dict)
+    services: dict[str, SrvDefinition] = field(default_factory=dict)
+    paths: dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {"schema": INDEX_SCHEMA, **asdict(self)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MsgIndex":
+        return cls(
+            data["commit"],
+            {name: MsgDefinition.from_dict(m) for name, m in data["messages"].items()},
+            {name: SrvDefinition.from_dict(s) for name, s in data["services"].items()},
+            data["paths"],
+        )
+
+
+def _read_blobs(px4_dir: Path, commit: str, paths: list[str]) -> dict[str, str]:
+    # a single `git cat-file --batch` instead of one `git show` per file
+    request = "".join(f"{commit}:{path}\n" for path in paths).encode()
+    batch = run_command(["git", "cat-file", "--batch"], cwd=px4_dir, input=request, text=False)
+    if batch.returncode != 0:
+        raise ValueError(f"Cannot read the definitions of {commit}: {batch.stderr.decode(errors='replace').strip()}")
+
+    blobs = {}
+    data, offset = batch.stdout, 0
+    for path in paths:
+        end = data.index(b"\n", offset)
+        header = data[offset:end].split()
+        offset = end + 1
+        if header[-1] == b"missing":
+            continue
+        size = int(header[2])
+        blobs[path] = data[offset:offset + size].decode("utf-8", errors="replace")
+        offset += size + 1
+    return blobs
+
+
+def build_index(px4_dir: Path, commit: str) -> MsgIndex:
+    """
+    Parses every definition of `commit` from the git objects (the working tree may be at another commit).
+    """
+    listing = run_command(["git", "ls-tree", "-r", "--name-only", commit, "--", *DEFINITION_DIRS], cwd=px4_dir)
+    if listing.returncode != 0:
+        raise ValueError(f"Cannot list the definitions of {commit}: {listing.stderr.strip()}")
+
+    paths = [path for path in listing.stdout.splitlines() if path.endswith((".msg", ".srv"))]
+    index = MsgIndex(commit)
+
+    for path, text in _read_blobs(px4_dir, commit, paths).items():
+        name = Path(path).stem
+        if path.endswith(".srv"):
+            index.services[name] = parse_srv(name, text)
+            index.paths[f"srv/{name}"] = path
+        # msg/versioned/ holds the current definition of a message also kept in msg/
+        elif name not in index.messages or "/versioned/" in path:
+            index.messages[name] = parse_msg(name, text)
+            index.paths[name] = path
+
+    return index
+
+
+def index_file(commit: str) -> Path:
+    return MSGS_DIR / f"{commit}.json"
+
+
+def load_index(px4_dir: Path, commit: str) -> MsgIndex:
+    """
+    Index of `commit`, parsed once and then read from the cache (a commit never changes).
+    """
+    path = index_file(commit)
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("schema") == INDEX_SCHEMA:
+            return MsgIndex.from_dict(data)
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+        pass
+
+    index = build_index(px4_dir, commit)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f".{path.name}.tmp")
+    with temp.open("w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f)
+    temp.replace(path)
+    return index
+
+
+def read_msgs(px4_dir: Path, commit: str) -> dict[str, MsgDefinition]:
+    """
+    Message definitions of `commit`.
+    """
+    return load_index(px4_dir, commit).messages
+
+
+def _describe_field(member: MsgField) -> str:
+    if member.length is None:
+        return f"{member.type} {member.name}"
+    return f"{member.type}[{'<=' if member.bounded else ''}{member.length or ''}] {member.name}"
+
+
+def diff_definitions(old: MsgDefinition, new: MsgDefinition) -> list[str]:
+    """
+    Added, removed and changed fields and constants between two versions of a message.
+    """
+    changes = []
+    if old.version != new.version:
+        changes.append(f"~ version {old.version} -> {new.version}")
+
+    old_fields = {f.name: f for f in old.fields}
+    new_fields = {f.name: f for f in new.fields}
+    for member in new.fields:
+        if member.name not in old_fields:
+            changes.append(f"+ field {_describe_field(member)}")
+        elif old_fields[member.name] != member:
+            changes.append(f"~ field {_describe_field(old_fields[member.name])} -> {_describe_field(member)}")
+    for member in old.fields:
+        if member.name not in new_fields:
+            changes.append(f"- field {_describe_field(member)}")
+
+    common = [name for name in (f.name for f in old.fields) if name in new_fields]
+    if common != [name for name in (f.name for f in new.fields) if name in old_fields]:
+        changes.append("~ field order changed (serialization differs)")
+
+    for name in sorted(set(old.constants) | set(new.constants)):
+        if name == "MESSAGE_VERSION":
+            continue
+        if name not in old.constants:
+            changes.append(f"+ const {name} = {new.constants[name]}")
+        elif name not in new.constants:
+            changes.append(f"- const {name} = {old.constants[name]}")
+        elif old.constants[name] != new.constants[name]:
+            changes.append(f"~ const {name} {old.constants[name]} -> {new.constants[name]}")
+
+    return changes
+
+
+def diff_indexes(old: MsgIndex, new: MsgIndex) -> list[tuple[str, list[str]]]:
+    """
+    (header, changes) per added, removed or changed message and service.
+    """
+    report = []
+
+    def compare(kind: str, before: dict, after: dict, pairs) -> None:
+        for name in sorted(set(before) | set(after)):
+            if name not in before:
+                report.append((f"+ {kind} {name}", []))
+            elif name not in after:
+                report.append((f"- {kind} {name}", []))
+            else:
+                changes = []
+                for a, b, prefix in pairs(before[name], after[name]):
+                    changes.extend(f"{prefix}{change}" for change in diff_definitions(a, b))
+                if changes:
+                    report.append((f"~ {kind} {name}", changes))
+
+    compare("msg", old.messages, new.messages, lambda a, b: [(a, b, "")])
+    compare("srv", old.services, new.services,
+            lambda a, b: [(a.request, b.request, "request: "), (a.response, b.response, "response: ")])
+    return report
+
+
+def _align(offset: int, alignment: int) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class MsgSizer:
+    """
+    Serialized (XCDR1) size of messages: fields in declaration order, each primitive
+    aligned to its size, arrays to their element and nested messages to their members.
+    Bounded sequences count their maximum length.
+    """
+
+    def __init__(self, definitions: dict[str, MsgDefinition]) -> None:
+        self.definitions = definitions
+        self.__alignments: dict[str, int] = {}
+
+    def definition(self, name: str) -> MsgDefinition:
+        try:
+            return self.definitions[name]
+        except KeyError:
+            raise ValueError(f"Unknown message type: {name}") from None
+
+    def alignment(self, field_type: str) -> int:
+        if field_type in PRIMITIVES:
+            return PRIMITIVES[field_type]
+        if field_type not in self.__alignments:
+            self.__alignments[field_type] = 1  # recursion guard
+            members = self.definition(field_type).fields
+            self.__alignments[field_type] = max((self.alignment(f.type) for f in members), default=1)
+        return self.__alignments[field_type]
+
+    def serialize(self, name: str, offset: int = 0, stack: tuple[str, ...] = ()) -> int:
+        """
+        Offset after serializing a `name` message starting at `offset`.
+        """
+        if name in stack:
+            raise ValueError(f"Recursive message type: {' -> '.join(stack + (name,))}")
+
+        for member in self.definition(name).fields:
+            if member.length == 0 and not member.bounded:
+                raise ValueError(f"{name}.{member.name}: unbounded arrays have no maximum size")
+
+            count = 1 if member.length is None else member.length
+            if member.bounded:
+                offset = _align(offset, 4) + 4  # sequence length
+
+            if member.type in PRIMITIVES:
+                offset = _align(offset, PRIMITIVES[member.type]) + count * PRIMITIVES[member.type]
+            else:
+                for _ in range(count):
+                    offset = _align(offset, self.alignment(member.type))
+                    offset = self.serialize(member.type, offset, stack + (name,))
+        return offset
+
+    def size(self, name: str) -> int:
+        return self.serialize(name)
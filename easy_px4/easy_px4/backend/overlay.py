@@ -0,0 +1,119 @@
+import os
+import filecmp
+import shutil
+from pathlib import Path
+from dataclasses import dataclass, field
+
+from .errors import ConfigurationError
+from .manifest import sha256_file
+
+
+@dataclass(frozen=True)
+class OverlayCopy:
+    """
+    A file from the airframe directory (or components) copied into the PX4 tree.
+
+    If `replaces` is set the target is a file tracked by PX4 and must already exist.
+    """
+    source: Path
+    target: Path
+    replaces: bool = False
+
+    def is_applied(self) -> bool:
+        return self.target.is_file() and filecmp.cmp(self.source, self.target, shallow=False)
+
+
+@dataclass(frozen=True)
+class OverlayInsertion:
+    """
+    A line inserted into a PX4 CMakeLists.txt right before the first line containing `match`.
+    """
+    file: Path
+    match: str
+    insert: str
+
+    def is_applied(self) -> bool:
+        if not self.file.is_file():
+            return False
+        with self.file.open("r") as f:
+            return any(line.rstrip("\n") == self.insert for line in f)
+
+
+@dataclass
+class Overlay:
+    """
+    Every change easy_px4 applies on top of a PX4 checkout for one airframe.
+
+    Applying an overlay is idempotent: files are only copied when their content
+    differs and insertions are skipped when the line is already present.
+    """
+    copies: list[OverlayCopy] = field(default_factory=list)
+    insertions: list[OverlayInsertion] = field(default_factory=list)
+
+    def is_applied(self) -> bool:
+        return all(c.is_applied() for c in self.copies) and all(i.is_applied() for i in self.insertions)
+
+    def tracked_targets(self) -> set[Path]:
+        """
+        PX4 files modified in place by the overlay.
+        """
+        return {c.target for c in self.copies if c.replaces} | {i.file for i in self.insertions}
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        Content hash and mtime of the PX4 files modified in place, taken after a successful build.
+        """
+        return {
+            str(path): {"sha256": sha256_file(path), "mtime_ns": path.stat().st_mtime_ns}
+            for path in sorted(self.tracked_targets()) if path.is_file()
+        }
+
+    def restore_mtimes(self, snapshot: dict[str, dict]) -> None:
+        """
+        Gives files whose content equals the snapshot their previous mtime back.
+
+        `git restore` followed by a new insertion produces the same content with a
+        new mtime, which would otherwise make CMake reconfigure the whole target.
+        """
+        for path in self.tracked_targets():
+            previous = snapshot.get(str(path))
+            if previous is None or not path.is_file():
+                continue
+            if sha256_file(path) == previous["sha256"]:
+                os.utime(path, ns=(previous["mtime_ns"], previous["mtime_ns"]))
+
+    def apply(self, logger=None) -> None:
+        for copy in self.copies:
+            if copy.replaces and not copy.target.is_file():
+                raise ConfigurationError(
+                    f"PX4 file to replace does not exist: {copy.target}. "
+                    "The selected PX4 version may have changed this path."
+                )
+            if copy.is_applied():
+                continue
+            if logger is not None:
+                logger.debug(f"Staging {copy.source} -> {copy.target}")
+            copy.target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(copy.source, copy.target)
+
+        for insertion in self.insertions:
+            if not insertion.is_applied():
+                prepend_insertion(insertion.file, insertion.match, insertion.insert)
+
+
+def prepend_insertion(file: Path, match: str, insert: str) -> None:
+    """
+    Writes `insert` as a new line before every line of `file` containing `match`.
+    """
+    if not file.is_file():
+        raise ConfigurationError(f"Invalid file path: {file}")
+
+    temp = file.parent / f"{file.stem}.tmp"
+
+    with file.open("r") as infile, temp.open("w") as outfile:
+        for line in infile:
+            if match in line:
+                outfile.write(insert + '\n')
+            outfile.write(line)
+
+    temp.replace(file)
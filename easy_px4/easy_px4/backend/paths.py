@@ -5,3 +5,12 @@ env_work_dir = os.environ.get("EASY_PX4_WORK_DIR", str(Path.home()))
 WORK_DIR = Path(env_work_dir) / ".easy_px4"
 
 PX4_DIR = WORK_DIR / "PX4-Autopilot"
+
+# Content-addressed store for build artifacts. Output directories hardlink into it.
+ARTIFACTS_DIR = WORK_DIR / "artifacts"
+
+# Small bookkeeping files (resolved tags, usage, checkpoints, ...).
+STATE_DIR = WORK_DIR / "state"
+
+# Per-version git worktrees of PX4_DIR (version matrix builds).
+WORKTREES_DIR = WORK_DIR / "worktrees"
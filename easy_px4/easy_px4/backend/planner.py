@@ -0,0 +1,267 @@
+import json
+from pathlib import Path
+from typing import Optional
+from dataclasses import dataclass, field
+
+from .paths import STATE_DIR
+from .overlay import Overlay
+from .runner import run_command
+from .manifest import MANIFEST_NAME, load_manifest, sha256_file
+
+# Steps of a build, in execution order.
+STEPS = [
+    "restore",
+    "fetch",
+    "checkout",
+    "submodules",
+    "tag",
+    "staging",
+    "make",
+]
+
+TAGS_CACHE = STATE_DIR / "tags.json"
+
+# Inputs that only end up in the ROMFS (startup scripts). Everything else needs a full build.
+ROMFS_INPUTS = {"params.airframe", "params.airframe.post"}
+ROMFS_INPUT_PREFIXES = ("components/",)
+
+# Scopes of the make step
+MAKE_FULL = "full"
+MAKE_ROMFS = "romfs"
+
+
+@dataclass
+class PlanStep:
+    name: str
+    needed: bool
+    reason: str
+
+
+@dataclass
+class BuildPlan:
+    """
+    Steps of a build and whether the current state of the PX4 tree already satisfies them.
+    """
+    target_commit: Optional[str] = None
+    steps: list[PlanStep] = field(default_factory=list)
+    make_scope: Optional[str] = None
+
+    def needs(self, name: str) -> bool:
+        return any(step.needed for step in self.steps if step.name == name)
+
+    @property
+    def up_to_date(self) -> bool:
+        return not any(step.needed for step in self.steps)
+
+    def describe(self) -> list[str]:
+        return [f"{'run ' if step.needed else 'skip'} {step.name:<10} {step.reason}" for step in self.steps]
+
+
+def git(px4_dir: Path, *args: str) -> Optional[str]:
+    """
+    Runs a read-only git query in `px4_dir`. Returns stripped stdout or None on failure.
+    """
+    res = run_command(["git", *args], cwd=px4_dir)
+    if res.returncode != 0:
+        return None
+    return res.stdout.strip()
+
+
+def resolve_ref(px4_dir: Path, ref: str, fetch: bool = True) -> Optional[str]:
+    """
+    Commit of a PX4 tag or commit, fetching a missing tag from origin if `fetch`.
+    """
+    for candidate in (f"refs/tags/{ref}", ref):
+        commit = git(px4_dir, "rev-parse", "--verify", "--quiet", f"{candidate}^{{commit}}")
+        if commit:
+            return commit
+
+    if fetch and run_command(["git", "fetch", "origin", "tag", ref], cwd=px4_dir).returncode == 0:
+        return git(px4_dir, "rev-parse", "--verify", "--quiet", f"refs/tags/{ref}^{{commit}}")
+    return None
+
+
+def load_tags_cache() -> dict[str, str]:
+    try:
+        with TAGS_CACHE.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def remember_tag(tag: str, commit: str) -> None:
+    """
+    Records the commit a PX4 release tag points to, so later builds can skip the fetch.
+    """
+    tags = load_tags_cache()
+    tags[tag] = commit
+    TAGS_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    temp = TAGS_CACHE.with_name(f"{TAGS_CACHE.name}.tmp")
+    with temp.open("w", encoding="utf-8") as f:
+        json.dump(tags, f, indent=2, sort_keys=True)
+    temp.replace(TAGS_CACHE)
+
+
+class Planner:
+    """
+    Inspects a PX4 tree and decides which build steps are still needed.
+
+    Every check is a local, read-only git query (no network), so planning takes
+    milliseconds and is safe to run with --dry-run.
+    """
+
+    def __init__(self, px4_dir: Path) -> None:
+        self.px4_dir = px4_dir
+
+    def resolve(self, info) -> Optional[str]:
+        """
+        Commit hash the build targets, or None if it is not known locally (a fetch is required).
+        """
+        if info.px4_commit:
+            return git(self.px4_dir, "rev-parse", "--verify", "--quiet", f"{info.px4_commit}^{{commit}}")
+
+        commit = git(self.px4_dir, "rev-parse", "--verify", "--quiet", f"refs/tags/{info.px4_version}^{{commit}}")
+        if commit:
+            return commit
+
+        cached = load_tags_cache().get(info.px4_version)
+        if cached and git(self.px4_dir, "cat-file", "-e", f"{cached}^{{commit}}") is not None:
+            return cached
+        return None
+
+    def __dirty_paths(self) -> set[Path]:
+        status = run_command(["git", "status", "--porcelain", "--untracked-files=no", "--ignore-submodules=all"],
+                             cwd=self.px4_dir)
+        return {self.px4_dir / line[3:] for line in status.stdout.splitlines() if line.strip()}
+
+    def __submodules_in_sync(self) -> bool:
+        status = run_command(["git", "submodule", "status", "--recursive"], cwd=self.px4_dir)
+        if status.returncode != 0:
+            return False
+        return not any(line[:1] in ("-", "+", "U") for line in status.stdout.splitlines())
+
+    def __tag_in_place(self, info, renamed_tag: str, commit: str) -> bool:
+        tagged = git(self.px4_dir, "rev-parse", "--verify", "--quiet", f"refs/tags/{renamed_tag}^{{commit}}")
+        if tagged != commit:
+            return False
+        if not info.px4_commit:
+            # the original release tag must be gone, otherwise it wins in `git describe`
+            return git(self.px4_dir, "rev-parse", "--verify", "--quiet", f"refs/tags/{info.px4_version}") is None
+        return True
+
+    def __previous_manifest(self, target: str) -> Optional[dict]:
+        manifest_file = self.px4_dir / "build" / target / MANIFEST_NAME
+        try:
+            return load_manifest(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def __outputs_intact(self, target: str, manifest: dict) -> bool:
+        build_dir = self.px4_dir / "build" / target
+        hashes = {artifact["sha256"] for artifact in manifest.get("artifacts", [])}
+        for output in (build_dir / f"{target}.px4", build_dir / "bin" / "px4"):
+            if output.is_file():
+                return sha256_file(output) in hashes
+        return False
+
+    def classify(self, target: str, commit: Optional[str], inputs: dict[str, str]) -> tuple[Optional[str], str]:
+        """
+        Compares the inputs with the last successful build of `target`.
+
+        Returns the make scope and the reason:
+        - (None, ...): build outputs are current.
+        - (MAKE_ROMFS, ...): only startup scripts (params, components) changed.
+        - (MAKE_FULL, ...): anything else (new commit, modules, DDS topics, info.toml, no previous build).
+        """
+        manifest = self.__previous_manifest(target)
+        if manifest is None:
+            return MAKE_FULL, "no previous build"
+
+        if commit is None or manifest.get("commit") != commit:
+            return MAKE_FULL, "PX4 commit changed"
+
+        if not self.__outputs_intact(target, manifest):
+            return MAKE_FULL, "build outputs missing or modified"
+
+        previous = manifest.get("inputs", {})
+        changed = sorted({label for label in set(previous) | set(inputs) if previous.get(label) != inputs.get(label)})
+        if not changed:
+            return None, "build outputs current"
+
+        reason = f"inputs changed: {', '.join(changed)}"
+        if all(label in ROMFS_INPUTS or label.startswith(ROMFS_INPUT_PREFIXES) for label in changed):
+            return MAKE_ROMFS, reason
+        return MAKE_FULL, reason
+
+    def plan(self,
+             info,
+             renamed_tag: str,
+             overlay: Overlay,
+             target: str,
+             inputs: dict[str, str],
+             clean_run: bool = False,
+             force: bool = False) -> BuildPlan:
+
+        commit = self.resolve(info)
+        plan = BuildPlan(target_commit=commit)
+
+        def add(name: str, needed: bool, reason: str) -> None:
+            plan.steps.append(PlanStep(name, needed, reason))
+
+        if force:
+            for name in STEPS:
+                add(name, True, "forced")
+            plan.make_scope = MAKE_FULL
+            return plan
+
+        scope, reason = self.classify(target, commit, inputs)
+
+        if clean_run:
+            # a clean build recompiles everything, whatever changed
+            reason = reason if scope is not None else "clean run requested"
+            scope = MAKE_FULL
+
+        if scope is None:
+            for name in STEPS:
+                add(name, False, reason)
+            return plan
+
+        plan.make_scope = scope
+
+        head = git(self.px4_dir, "rev-parse", "HEAD")
+        at_target = commit is not None and head == commit
+
+        dirty = self.__dirty_paths()
+        foreign_changes = dirty - overlay.tracked_targets()
+        restore = bool(foreign_changes) or (not at_target and bool(dirty))
+        add("restore", restore,
+            f"{len(foreign_changes)} modified files in tree" if foreign_changes
+            else ("overlay must be removed before checkout" if restore else "tree clean"))
+
+        if commit is not None:
+            add("fetch", False, f"target resolved to {commit[:12]}")
+        elif info.px4_commit:
+            add("fetch", False, f"px4_commit {info.px4_commit} is checked out as is")
+        else:
+            add("fetch", True, f"{info.px4_version} not known locally")
+
+        if at_target:
+            add("checkout", False, f"already at {commit[:12]}")
+        else:
+            add("checkout", True, f"HEAD at {(head or 'unknown')[:12]}")
+
+        in_sync = at_target and self.__submodules_in_sync()
+        add("submodules", not in_sync, "submodules in sync" if in_sync else "submodules out of sync")
+
+        tagged = at_target and self.__tag_in_place(info, renamed_tag, commit)
+        add("tag", not tagged, f"{renamed_tag} present" if tagged else f"{renamed_tag} missing")
+
+        staged = at_target and not restore and overlay.is_applied()
+        add("staging", not staged, "overlay unchanged" if staged else "overlay missing or changed")
+
+        if scope == MAKE_ROMFS:
+            add("make", True, f"ROMFS and packaging only, {reason}")
+        else:
+            add("make", True, f"{'clean ' if clean_run else ''}full build, {reason}")
+
+        return plan
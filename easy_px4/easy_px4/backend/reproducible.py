@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+from .planner import git
+
+# the PX4 tree appears under this path in debug info and __FILE__, whatever the checkout (or worktree) location
+PREFIX = "/px4"
+
+# pinned for every command of the build, on top of SOURCE_DATE_EPOCH and the prefix mapping
+PINNED_ENV = {
+    "TZ": "UTC",
+    "LC_ALL": "C",
+    "LANG": "C",
+    "PYTHONHASHSEED": "0",
+}
+
+# compiler flag variables CMake reads when it configures a build directory
+FLAG_VARIABLES = ("CFLAGS", "CXXFLAGS", "ASMFLAGS")
+
+# written into a build directory configured with the reproducible environment
+MARKER_NAME = "easy_px4_reproducible"
+
+
+def profile() -> str:
+    """
+    Identifies the pinned settings. Recorded as a build input, so turning the
+    reproducible mode on or off (or changing it) forces a full build.
+    """
+    settings = {"env": PINNED_ENV, "prefix": PREFIX, "flags": FLAG_VARIABLES}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def prefix_map(px4_dir: Path) -> str:
+    return f"-ffile-prefix-map={px4_dir}={PREFIX}"
+
+
+def source_date_epoch(px4_dir: Path, commit: str) -> int:
+    """
+    Committer time of `commit`, the timestamp embedded instead of the build time.
+    """
+    timestamp = git(px4_dir, "log", "-1", "--format=%ct", commit)
+    return int(timestamp) if timestamp else 0
+
+
+def reproducible_env(px4_dir: Path, epoch: int, ccache: bool = True) -> dict[str, str]:
+    """
+    Environment of the build commands in reproducible mode.
+
+    ccache is kept (CCACHE_BASEDIR makes its keys independent of the checkout
+    location) unless `ccache` is False, to rebuild everything from source.
+    """
+    env = dict(os.environ)
+    env.update(PINNED_ENV)
+    env["SOURCE_DATE_EPOCH"] = str(epoch)
+    for name in FLAG_VARIABLES:
+        env[name] = " ".join(flag for flag in (os.environ.get(name), prefix_map(px4_dir)) if flag)
+    env["CCACHE_BASEDIR"] = str(px4_dir)
+    env["CCACHE_NOHASHDIR"] = "true"
+    if not ccache:
+        env["CCACHE_DISABLE"] = "1"
+    return env
+
+
+def _marker(build_dir: Path) -> Path:
+    return build_dir / MARKER_NAME
+
+
+def mark_configured(build_dir: Path, px4_dir: Path) -> None:
+    _marker(build_dir).write_text(f"{profile()} {prefix_map(px4_dir)}\n", encoding="utf-8")
+
+
+def configured_reproducibly(build_dir: Path, px4_dir: Path) -> bool:
+    """
+    Whether `build_dir` was configured by a reproducible build of this PX4 tree
+    (flags from the environment are only read when a build directory is configured).
+    """
+    try:
+        return _marker(build_dir).read_text(encoding="utf-8").strip() == f"{profile()} {prefix_map(px4_dir)}"
+    except FileNotFoundError:
+        return False
+
+
+def normalize_px4(path: Path, epoch: int) -> bool:
+    """
+    Replaces the build time px_mkfw.py writes into a `.px4` container by `epoch`.
+    Returns True if the file was changed.
+    """
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            container = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+        return False
+
+    if not isinstance(container, dict) or container.get("build_time", epoch) == epoch:
+        return False
+    container["build_time"] = epoch
+    with path.open("w", encoding="utf-8") as f:
+        # as written by px_mkfw.py
+        json.dump(container, f, indent=4)
+    return True
+
+
+def compare_artifacts(first: Path, second: Path) -> Optional[str]:
+    """
+    None if both files are identical, otherwise what differs (the fields of a `.px4` container).
+    """
+    if first.read_bytes() == second.read_bytes():
+        return None
+
+    if first.suffix == ".px4":
+        try:
+            a, b = (json.loads(path.read_text(encoding="utf-8")) for path in (first, second))
+            fields = sorted(key for key in set(a) | set(b) if a.get(key) != b.get(key))
+            if fields:
+                return f"{first.name} differs in {', '.join(fields)}"
+        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+            pass
+    return f"{first.name} differs"
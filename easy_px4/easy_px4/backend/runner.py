@@ -1,7 +1,45 @@
+import os
+import threading
 import subprocess
+from collections import deque
+from contextlib import contextmanager
 from typing import Union, Optional
 from dataclasses import dataclass, field
 
+from .logger import flush_logs, structured_logging
+
+
+@dataclass
+class Rusage:
+    """
+    Resources used by a child process and all the descendants it waited for.
+    """
+    user_s: float = 0.0
+    system_s: float = 0.0
+    max_rss_mb: float = 0.0
+    read_mb: float = 0.0
+    written_mb: float = 0.0
+
+    @classmethod
+    def from_struct(cls, ru) -> "Rusage":
+        # ru_maxrss is in KiB, block counts in 512 byte units (Linux)
+        return cls(ru.ru_utime, ru.ru_stime, ru.ru_maxrss / 1024, ru.ru_inblock * 512 / 2**20, ru.ru_oublock * 512 / 2**20)
+
+    def add(self, other: "Rusage") -> None:
+        """
+        Accumulates another command: CPU time and I/O are summed, RSS is the peak.
+        """
+        self.user_s += other.user_s
+        self.system_s += other.system_s
+        self.max_rss_mb = max(self.max_rss_mb, other.max_rss_mb)
+        self.read_mb += other.read_mb
+        self.written_mb += other.written_mb
+
+    def describe(self) -> str:
+        return (f"user {self.user_s:.1f}s, sys {self.system_s:.1f}s, max rss {self.max_rss_mb:.1f} MiB, "
+                f"read {self.read_mb:.1f} MiB, written {self.written_mb:.1f} MiB")
+
+
 @dataclass
 class CommandResult:
     returncode: int
@@ -9,11 +47,100 @@ class CommandResult:
     stderr: str = ''
     error: Optional[str] = None
     obj: Optional[object] = field(default=None)  # Store process object
+    rusage: Optional[Rusage] = None
+
+
+def _reap(process: subprocess.Popen) -> Optional[Rusage]:
+    """
+    Waits for `process` with wait4, which keeps the resource usage of its whole
+    process tree, and sets its returncode. Its output must be drained first.
+    """
+    if process.returncode is not None:
+        return None
+    try:
+        _, status, ru = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # same as Popen: the child was already reaped (SIGCLD ignored), status unknown
+        process.returncode = 0
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return Rusage.from_struct(ru)
+
+
+def _terminate(process: subprocess.Popen, timeout: float = 10.0) -> None:
+    """
+    Stops a command left running by an interrupt (Ctrl+C, SIGTERM) and reaps it.
+    make and ninja pass the signal on to the jobs they started.
+    """
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def _drain(process: subprocess.Popen, input=None) -> tuple[Optional[str], Optional[str]]:
+    """
+    Feeds `input` to the process and reads stdout and stderr to the end, like
+    Popen.communicate but without waiting for the process.
+    """
+    outputs = {}
+
+    def read(name, stream) -> None:
+        # one thread per pipe, so neither can fill up and block the process
+        outputs[name] = stream.read()
+        stream.close()
+
+    readers = [threading.Thread(target=read, args=(name, stream), daemon=True)
+               for name, stream in (("stdout", process.stdout), ("stderr", process.stderr)) if stream is not None]
+    for reader in readers:
+        reader.start()
+
+    if process.stdin is not None:
+        try:
+            if input:
+                process.stdin.write(input)
+            process.stdin.close()
+        except BrokenPipeError:
+            # the process exited without reading its input
+            pass
+
+    for reader in readers:
+        reader.join()
+    return outputs.get("stdout"), outputs.get("stderr")
+
+
+_accounting = threading.local()
+
+
+@contextmanager
+def account_rusage():
+    """
+    Sums the resource usage of every command run by the current thread inside the block.
+
+    Blocks can be nested, a command counts for every enclosing block.
+    """
+    total = Rusage()
+    stack = _accounting.__dict__.setdefault("stack", [])
+    stack.append(total)
+    try:
+        yield total
+    finally:
+        stack.remove(total)
+
+
+def _record(rusage: Optional[Rusage]) -> None:
+    if rusage is not None:
+        for total in getattr(_accounting, "stack", []):
+            total.add(rusage)
 
 def run_command(
     cmd: Union[str, list[str]],
     live: bool = False,
     logger: Optional[object] = None,
+    tail: int = 50,
     **kwargs
 ) -> CommandResult:
     """
@@ -23,13 +150,15 @@ def run_command(
         cmd: Command string or list of arguments.
         live: If True, print output live on the same line.
         logger: Optional logger object with .info(str) method to override print.
+        tail: In live mode, number of last output lines kept in `stdout` of the result.
         **kwargs: Additional args passed to subprocess.
 
     Returns:
         CommandResult object.
     """
-    def make_result(returncode, stdout='', stderr='', error=None, obj=None):
-        return CommandResult(returncode, stdout, stderr, error, obj)
+    def make_result(returncode, stdout='', stderr='', error=None, obj=None, rusage=None):
+        _record(rusage)
+        return CommandResult(returncode, stdout, stderr, error, obj, rusage)
 
     if isinstance(cmd, str):
         cmd = cmd.split()
@@ -40,14 +169,20 @@ def run_command(
         kwargs.setdefault('text', True)
         kwargs.setdefault('bufsize', 1)
 
+        process = None
         try:
             process = subprocess.Popen(cmd, **kwargs)
             last_len = 0
+            last_lines = deque(maxlen=tail)
 
-            use_logger_debug = logger and logger.getEffectiveLevel() <= 10  # 10 = DEBUG
+            # structured logs must not be interleaved with raw output: lines only go to the debug log
+            use_logger_debug = logger and (logger.getEffectiveLevel() <= 10 or structured_logging())  # 10 = DEBUG
+            if not use_logger_debug:
+                flush_logs()
 
             for line in process.stdout:
                 line = line.rstrip('\n')
+                last_lines.append(line)
 
                 clear = ' ' * max(last_len - len(line), 0)
                 last_len = len(line)
@@ -57,23 +192,43 @@ def run_command(
                 else:
                     print(f'\r{line}{clear}', end='', flush=True)
 
-            process.wait()
+            process.stdout.close()
+            rusage = _reap(process)
             if not use_logger_debug:
-                print()
-
-            return make_result(process.returncode, obj=process)
-        except Exception as e:
+                print(flush=True)
+
+            return make_result(process.returncode, stdout='\n'.join(last_lines), obj=process, rusage=rusage)
+        except BaseException as e:
+            # the command must not outlive us, e.g. keep writing into the build directory
+            if process is not None:
+                _terminate(process)
+            if not isinstance(e, Exception):
+                raise
             return make_result(-1, error=str(e))
     else:
-        kwargs.setdefault('capture_output', True)
+        check = kwargs.pop('check', False)
+        stdin_data = kwargs.pop('input', None)
+        if stdin_data is not None:
+            kwargs['stdin'] = subprocess.PIPE
+        if kwargs.pop('capture_output', True):
+            kwargs.setdefault('stdout', subprocess.PIPE)
+            kwargs.setdefault('stderr', subprocess.PIPE)
         kwargs.setdefault('text', True)
 
         try:
-            result = subprocess.run(cmd, **kwargs)
-
-            return make_result(result.returncode, result.stdout, result.stderr, obj=result)
-        except subprocess.CalledProcessError as e:
-            return make_result(e.returncode, e.stdout or '', e.stderr or '', str(e))
+            # subprocess.run, reaping the process itself to keep the rusage
+            with subprocess.Popen(cmd, **kwargs) as process:
+                try:
+                    stdout, stderr = _drain(process, stdin_data)
+                    rusage = _reap(process)
+                except BaseException:
+                    _terminate(process)
+                    raise
+            error = None
+            if check and process.returncode != 0:
+                error = str(subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr))
+
+            return make_result(process.returncode, stdout or '', stderr or '', error, obj=process, rusage=rusage)
         except Exception as e:
             return make_result(-1, error=str(e))
 
@@ -0,0 +1,170 @@
+import os
+import time
+import signal
+import subprocess
+from pathlib import Path
+from typing import Optional
+from dataclasses import dataclass, field
+
+from .errors import ConfigurationError
+from .gc import record_use
+from .paths import PX4_DIR
+
+# PX4 posix rcS derives the MAVLink ports from the instance number
+MAVLINK_GCS_PORT = 18570
+MAVLINK_OFFBOARD_PORT = 14540
+DDS_AGENT_PORT = 8888
+
+_CPU_SYSFS = Path("/sys/devices/system/cpu")
+
+
+def cpu_topology() -> list[int]:
+    """
+    Logical CPUs usable by this process, ordered by (package, core) so that
+    SMT siblings are adjacent and packages are contiguous.
+    """
+    available = sorted(os.sched_getaffinity(0))
+
+    def key(cpu: int) -> tuple[int, int, int]:
+        topology = _CPU_SYSFS / f"cpu{cpu}" / "topology"
+        try:
+            package = int((topology / "physical_package_id").read_text())
+            core = int((topology / "core_id").read_text())
+        except (OSError, ValueError):
+            package, core = 0, cpu
+        return package, core, cpu
+
+    return sorted(available, key=key)
+
+
+def allocate_cpus(count: int, per_instance: int, oversubscribe: bool = False) -> list[set[int]]:
+    """
+    Splits the host CPUs into `count` disjoint sets of `per_instance` CPUs.
+
+    Consecutive CPUs in topology order are grouped, so an instance gets SMT
+    siblings of the same core before spilling to the next one.
+    """
+    cpus = cpu_topology()
+    needed = count * per_instance
+
+    if needed > len(cpus) and not oversubscribe:
+        raise ConfigurationError(
+            f"{count} instances x {per_instance} CPUs need {needed} CPUs but only {len(cpus)} are available. "
+            "Reduce --cpus-per-instance/--count or pass --oversubscribe."
+        )
+
+    return [
+        {cpus[(i * per_instance + j) % len(cpus)] for j in range(per_instance)}
+        for i in range(count)
+    ]
+
+
+@dataclass
+class SitlInstance:
+    index: int
+    workdir: Path
+    cpus: set[int]
+    env: dict[str, str]
+    process: Optional[subprocess.Popen] = None
+
+    @property
+    def mavlink_ports(self) -> tuple[int, int]:
+        """
+        (GCS, offboard) UDP ports of this instance.
+        """
+        return MAVLINK_GCS_PORT + self.index, MAVLINK_OFFBOARD_PORT + self.index
+
+
+@dataclass
+class SitlLauncher:
+    """
+    Starts N instances of a built SITL target, each in its own working directory,
+    pinned to its own CPU set and in its own process group.
+    """
+    build_dir: Path
+    autostart: int
+    count: int
+    first_instance: int = 0
+    cpus_per_instance: int = 1
+    oversubscribe: bool = False
+    dds_port: int = DDS_AGENT_PORT
+    dds_port_stride: int = 0
+    workdir: Optional[Path] = None
+    extra_env: dict[str, str] = field(default_factory=dict)
+    instances: list[SitlInstance] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        if not (self.build_dir / "bin" / "px4").is_file():
+            raise ConfigurationError(f"No SITL binary in {self.build_dir}. Build it first with `easy_px4 build --type sitl`.")
+        if self.count < 1 or self.cpus_per_instance < 1:
+            raise ConfigurationError("--count and --cpus-per-instance must be at least 1.")
+
+    @classmethod
+    def for_target(cls, target: str, **kwargs) -> "SitlLauncher":
+        return cls(build_dir=PX4_DIR / "build" / target, **kwargs)
+
+    def start(self) -> list[SitlInstance]:
+        record_use(self.build_dir)
+        base = self.workdir if self.workdir is not None else self.build_dir
+        cpu_sets = allocate_cpus(self.count, self.cpus_per_instance, self.oversubscribe)
+
+        for n, cpus in enumerate(cpu_sets):
+            index = self.first_instance + n
+            workdir = base / f"instance_{index}"
+            workdir.mkdir(parents=True, exist_ok=True)
+
+            env = dict(os.environ)
+            env.update({
+                "PX4_SYS_AUTOSTART": str(self.autostart),
+                "PX4_UXRCE_DDS_NS": f"px4_{index}",
+                "PX4_UXRCE_DDS_PORT": str(self.dds_port + index * self.dds_port_stride),
+                "HEADLESS": "1",
+            })
+            env.update(self.extra_env)
+
+            instance = SitlInstance(index, workdir, cpus, env)
+            instance.process = self.__spawn(instance)
+            self.instances.append(instance)
+
+        return self.instances
+
+    def __spawn(self, instance: SitlInstance) -> subprocess.Popen:
+        cpus = instance.cpus
+        with (instance.workdir / "out.log").open("w") as out, (instance.workdir / "err.log").open("w") as err:
+            return subprocess.Popen(
+                [str(self.build_dir / "bin" / "px4"), "-i", str(instance.index), "-d", str(self.build_dir / "etc")],
+                cwd=instance.workdir,
+                env=instance.env,
+                stdin=subprocess.DEVNULL,
+                stdout=out,
+                stderr=err,
+                start_new_session=True,
+                # pin before exec so every PX4 thread inherits the CPU set
+                preexec_fn=lambda: os.sched_setaffinity(0, cpus),
+            )
+
+    def running(self) -> list[SitlInstance]:
+        return [i for i in self.instances if i.process is not None and i.process.poll() is None]
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Interrupts every instance (whole process group), then kills the ones
+        still alive after `timeout` seconds.
+        """
+        for sig in (signal.SIGINT, signal.SIGKILL):
+            for instance in self.running():
+                try:
+                    os.killpg(instance.process.pid, sig)
+                except ProcessLookupError:
+                    pass
+
+            deadline = time.monotonic() + timeout
+            while self.running() and time.monotonic() < deadline:
+                time.sleep(0.1)
+
+            if not self.running():
+                break
+
+        for instance in self.instances:
+            if instance.process is not None:
+                instance.process.wait()
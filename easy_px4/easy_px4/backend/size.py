@@ -0,0 +1,392 @@
+import re
+import json
+import mmap
+import zlib
+import base64
+import struct
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+from datetime import datetime, timezone
+from dataclasses import asdict, dataclass, field
+
+from .paths import STATE_DIR
+
+SIZE_DIR = STATE_DIR / "size"
+
+# number of largest symbols kept in a report
+TOP_SYMBOLS = 100
+
+# ELF constants
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+STT_OBJECT = 1
+STT_FUNC = 2
+SHN_LORESERVE = 0xff00
+
+
+class Section(NamedTuple):
+    name: str
+    type: int
+    flags: int
+    addr: int
+    offset: int
+    size: int
+    link: int
+    entsize: int
+
+
+def section_kind(flags: int, section_type: int) -> Optional[str]:
+    """
+    Berkeley `size` classification: read-only allocated sections (code and
+    constants) are text, writable ones data, or bss if they take no space in the image.
+    """
+    if not flags & SHF_ALLOC:
+        return None
+    if section_type == SHT_NOBITS:
+        return "bss"
+    return "data" if flags & SHF_WRITE else "text"
+
+
+class ElfFile:
+    """
+    Minimal memory-mapped ELF reader (32/64 bit, both endiannesses): sections and symbols.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.__file = path.open("rb")
+        try:
+            self.data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:  # empty file
+            self.__file.close()
+            raise ValueError(f"{path} is not an ELF file") from e
+
+        if self.data[:4] != b"\x7fELF":
+            self.close()
+            raise ValueError(f"{path} is not an ELF file")
+
+        self.is64 = self.data[4] == 2
+        self.endian = "<" if self.data[5] == 1 else ">"
+
+        header = "HHIQQQIHHHHHH" if self.is64 else "HHIIIIIHHHHHH"
+        (_, _, _, _, _, shoff, _, _, _, _, shentsize, shnum, shstrndx) = struct.unpack_from(self.endian + header, self.data, 16)
+
+        section_format = self.endian + ("IIQQQQIIQQ" if self.is64 else "IIIIIIIIII")
+        raw = [struct.unpack_from(section_format, self.data, shoff + i * shentsize) for i in range(shnum)]
+
+        names_offset = raw[shstrndx][4] if shnum else 0
+        self.sections = [
+            Section(self.__string(names_offset + s[0]), s[1], s[2], s[3], s[4], s[5], s[6], s[9])
+            for s in raw
+        ]
+
+    def __string(self, offset: int) -> str:
+        end = self.data.find(b"\x00", offset)
+        return self.data[offset:end].decode("utf-8", errors="replace")
+
+    def symbols(self) -> Iterator[tuple[str, int, int, int]]:
+        """
+        (name, size, type, section index) of every symbol of the symbol table.
+        """
+        symbol_format = self.endian + ("IBBHQQ" if self.is64 else "IIIBBH")
+        for section in self.sections:
+            if section.type != SHT_SYMTAB or not section.entsize:
+                continue
+            strtab = self.sections[section.link].offset
+            block = self.data[section.offset:section.offset + section.size]
+            for entry in struct.iter_unpack(symbol_format, block):
+                if self.is64:
+                    name, info, _, shndx, _, size = entry
+                else:
+                    name, _, size, info, _, shndx = entry
+                yield self.__string(strtab + name), size, info & 0xf, shndx
+
+    def close(self) -> None:
+        self.data.close()
+        self.__file.close()
+
+    def __enter__(self) -> "ElfFile":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+@dataclass
+class Usage:
+    text: int = 0
+    data: int = 0
+    bss: int = 0
+
+    @property
+    def flash(self) -> int:
+        # initialized data is stored in flash and copied to RAM at boot
+        return self.text + self.data
+
+    @property
+    def ram(self) -> int:
+        return self.data + self.bss
+
+    def add(self, kind: str, size: int) -> None:
+        setattr(self, kind, getattr(self, kind) + size)
+
+
+def analyze_elf(path: Path) -> tuple[Usage, list[dict]]:
+    """
+    Section usage of an ELF and its largest function and object symbols.
+    """
+    usage = Usage()
+    symbols = []
+
+    with ElfFile(path) as elf:
+        kinds = [section_kind(s.flags, s.type) for s in elf.sections]
+        for section, kind in zip(elf.sections, kinds):
+            if kind is not None:
+                usage.add(kind, section.size)
+
+        for name, size, symbol_type, shndx in elf.symbols():
+            if size and symbol_type in (STT_FUNC, STT_OBJECT) and shndx < min(SHN_LORESERVE, len(kinds)) and kinds[shndx]:
+                symbols.append({"name": name, "kind": kinds[shndx], "size": size})
+
+    symbols.sort(key=lambda s: s["size"], reverse=True)
+    return usage, symbols[:TOP_SYMBOLS]
+
+
+# input section of a GNU ld map file, the file may be on the next line for long section names
+_MAP_SECTION = re.compile(r"^ (\.\S+|COMMON)(?:\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)\s+(\S.*))?$")
+_MAP_CONTINUATION = re.compile(r"^\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)\s+(\S.*)$")
+
+
+def _map_kind(section: str) -> Optional[str]:
+    if section == "COMMON" or section.startswith((".bss", ".noinit")):
+        return "bss"
+    if section.startswith(".data"):
+        return "data"
+    if section.startswith((".text", ".rodata", ".ARM.ex", ".ramfunc", ".init_array", ".fini_array")):
+        return "text"
+    return None
+
+
+def module_name(origin: str) -> str:
+    """
+    Module of an object in a map file: the archive (`libmodules__ekf2.a(ekf.cpp.obj)` ->
+    `modules__ekf2`), else the object file itself.
+    """
+    archive = re.match(r"(.+?\.a)\(", origin)
+    name = Path(archive.group(1) if archive else origin.strip()).name
+    name = re.sub(r"\.(a|o|obj)$", "", name)
+    return name[3:] if archive and name.startswith("lib") else name
+
+
+def parse_map(path: Path) -> dict[str, Usage]:
+    """
+    Usage per module from the linker map file (input sections placed in the memory map).
+    """
+    modules: dict[str, Usage] = {}
+    pending = None
+    in_memory_map = False
+
+    def add(section: str, address: str, size: str, origin: str) -> None:
+        kind = _map_kind(section)
+        if kind is None or int(address, 16) == 0 or int(size, 16) == 0:
+            return
+        modules.setdefault(module_name(origin), Usage()).add(kind, int(size, 16))
+
+    with path.open("r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not in_memory_map:
+                in_memory_map = line.startswith("Linker script and memory map")
+                continue
+
+            if pending is not None:
+                match = _MAP_CONTINUATION.match(line)
+                if match:
+                    add(pending, *match.groups())
+                pending = None
+                continue
+
+            match = _MAP_SECTION.match(line)
+            if match is None:
+                continue
+            section, address, size, origin = match.groups()
+            if address is None:
+                pending = section
+            else:
+                add(section, address, size, origin)
+
+    return modules
+
+
+def read_px4(path: Path) -> dict:
+    """
+    Metadata of a `.px4` firmware container (JSON with a zlib compressed, base64 encoded image).
+    """
+    with path.open("r", encoding="utf-8") as f:
+        container = json.load(f)
+
+    image = zlib.decompress(base64.b64decode(container.get("image", "")))
+    declared = container.get("image_size")
+    if declared is not None and declared != len(image):
+        raise ValueError(f"{path}: image is {len(image)} bytes, the container declares {declared}")
+
+    return {
+        "board_id": container.get("board_id"),
+        "version": container.get("version"),
+        "git_identity": container.get("git_identity"),
+        "image_size": len(image),
+        "image_maxsize": container.get("image_maxsize"),
+    }
+
+
+_FLASH_REGION = re.compile(r"^\s*flash\w*\s*\([^)]*\)\s*:\s*ORIGIN\s*=\s*\w+\s*,\s*LENGTH\s*=\s*(\d+|0x[0-9a-fA-F]+)\s*([KM]?)",
+                           re.IGNORECASE | re.MULTILINE)
+
+
+def linker_flash_size(board_dir: Path) -> Optional[int]:
+    """
+    Length of the FLASH memory region in the NuttX linker scripts of a board.
+    """
+    for script in sorted(board_dir.glob("nuttx-config/scripts/*.ld")):
+        match = _FLASH_REGION.search(script.read_text(errors="replace"))
+        if match:
+            value, unit = match.groups()
+            return int(value, 0) * {"": 1, "K": 1024, "M": 1024 * 1024}[unit.upper()]
+    return None
+
+
+@dataclass
+class SizeReport:
+    airframe: str
+    target: str
+    commit: Optional[str]
+    timestamp: str
+    text: int
+    data: int
+    bss: int
+    image_size: Optional[int] = None
+    flash_limit: Optional[int] = None
+    modules: dict[str, dict] = field(default_factory=dict)
+    symbols: list[dict] = field(default_factory=list)
+
+    @property
+    def flash(self) -> int:
+        return self.text + self.data
+
+    @property
+    def flash_percent(self) -> Optional[float]:
+        if not self.flash_limit:
+            return None
+        return 100.0 * self.flash / self.flash_limit
+
+    def describe(self) -> str:
+        usage = f"text {self.text} B, data {self.data} B, bss {self.bss} B, flash {self.flash} B"
+        if self.flash_limit:
+            usage += f" of {self.flash_limit} B ({self.flash_percent:.1f}%, {self.flash_limit - self.flash} B free)"
+        return usage
+
+
+def analyze(build_dir: Path, target: str, airframe: str, commit: Optional[str], board_dir: Optional[Path] = None) -> SizeReport:
+    """
+    Size report of a NuttX target: `<target>.elf` (required), `<target>.map` and `<target>.px4` (optional).
+    """
+    usage, symbols = analyze_elf(build_dir / f"{target}.elf")
+
+    modules = {}
+    map_file = build_dir / f"{target}.map"
+    if map_file.is_file():
+        modules = {name: asdict(u) for name, u in sorted(parse_map(map_file).items())}
+
+    image_size = flash_limit = None
+    px4_file = build_dir / f"{target}.px4"
+    if px4_file.is_file():
+        container = read_px4(px4_file)
+        image_size = container["image_size"]
+        flash_limit = container["image_maxsize"]
+
+    if flash_limit is None and board_dir is not None:
+        flash_limit = linker_flash_size(board_dir)
+
+    return SizeReport(
+        airframe=airframe,
+        target=target,
+        commit=commit,
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        text=usage.text,
+        data=usage.data,
+        bss=usage.bss,
+        image_size=image_size,
+        flash_limit=flash_limit,
+        modules=modules,
+        symbols=symbols,
+    )
+
+
+def history_file(airframe: str) -> Path:
+    return SIZE_DIR / f"{airframe}.json"
+
+
+def load_history(airframe: str) -> list[dict]:
+    try:
+        with history_file(airframe).open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def previous_report(report: SizeReport) -> Optional[dict]:
+    """
+    Latest recorded report of the same airframe and target.
+    """
+    for previous in reversed(load_history(report.airframe)):
+        if previous.get("target") == report.target:
+            return previous
+    return None
+
+
+def record(report: SizeReport) -> Optional[dict]:
+    """
+    Appends the report to the history of the airframe and returns the previous report of the target.
+    """
+    previous = previous_report(report)
+    history = load_history(report.airframe)
+    history.append(asdict(report))
+
+    path = history_file(report.airframe)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f"{path.name}.tmp")
+    with temp.open("w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    temp.replace(path)
+
+    return previous
+
+
+def deltas(report: SizeReport, previous: dict, limit: int = 10) -> list[str]:
+    """
+    Changes against a previous report: totals, then the modules and symbols that changed most.
+    """
+    lines = []
+    for kind in ("text", "data", "bss"):
+        change = getattr(report, kind) - previous.get(kind, 0)
+        if change:
+            lines.append(f"{kind:<6} {change:+d} B")
+
+    def changes(current: dict[str, int], before: dict[str, int]) -> list[tuple[str, int]]:
+        found = [(name, current.get(name, 0) - before.get(name, 0)) for name in set(current) | set(before)]
+        return sorted((c for c in found if c[1]), key=lambda c: abs(c[1]), reverse=True)[:limit]
+
+    flash = lambda usage: usage.get("text", 0) + usage.get("data", 0)
+    for name, change in changes({n: flash(u) for n, u in report.modules.items()},
+                                {n: flash(u) for n, u in previous.get("modules", {}).items()}):
+        lines.append(f"module {name} {change:+d} B")
+
+    # symbols are only the largest ones, a symbol missing on one side is not necessarily gone
+    before = {s["name"]: s["size"] for s in previous.get("symbols", [])}
+    current = {s["name"]: s["size"] for s in report.symbols}
+    for name, change in changes({n: s for n, s in current.items() if n in before},
+                                {n: s for n, s in before.items() if n in current}):
+        lines.append(f"symbol {name} {change:+d} B")
+
+    return lines
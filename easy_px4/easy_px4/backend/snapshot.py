@@ -0,0 +1,262 @@
+import os
+import json
+import shutil
+from pathlib import Path
+from datetime import datetime, timezone
+from dataclasses import asdict, dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .errors import ConfigurationError, GitError
+from .logger import get_logger
+from .manifest import sha256_file
+from .planner import git, load_tags_cache, remember_tag
+from .runner import run_command
+
+SNAPSHOT_MANIFEST = "snapshot.json"
+SNAPSHOT_SCHEMA = 1
+
+# temporary tag a bundle is created from (a bundle needs a ref, clones only copy heads and tags)
+SNAPSHOT_TAG = "refs/tags/easy_px4-snapshot"
+
+# git refuses file:// submodule clones by default (CVE-2022-39253), the bundles are our own files
+_ALLOW_FILE = ["-c", "protocol.file.allow=always"]
+
+
+@dataclass
+class SnapshotRepo:
+    """
+    One repository of a snapshot: the PX4 tree (path "") or a submodule at `path`
+    (relative to the PX4 tree) registered in the repository at `parent`.
+    """
+    path: str
+    commit: str
+    url: Optional[str]
+    name: Optional[str] = None
+    parent: str = ""
+    bundle: Optional[str] = None
+    sha256: Optional[str] = None
+    size: int = 0
+
+
+@dataclass
+class Snapshot:
+    commit: str
+    tag: Optional[str]
+    created: str
+    repos: list[SnapshotRepo] = field(default_factory=list)
+    # submodules not available locally at export, left for `git submodule update` to fetch
+    missing: list[str] = field(default_factory=list)
+
+    def write(self, directory: Path) -> Path:
+        path = directory / SNAPSHOT_MANIFEST
+        with path.open("w", encoding="utf-8") as f:
+            json.dump({"schema": SNAPSHOT_SCHEMA, **asdict(self)}, f, indent=2)
+        return path
+
+    @classmethod
+    def read(cls, directory: Path) -> "Snapshot":
+        try:
+            with (directory / SNAPSHOT_MANIFEST).open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigurationError(f"{directory} is not a snapshot: {e}") from e
+
+        if data.get("schema") != SNAPSHOT_SCHEMA:
+            raise ConfigurationError(f"Unsupported snapshot schema {data.get('schema')} in {directory}")
+        repos = [SnapshotRepo(**repo) for repo in data.pop("repos")]
+        data.pop("schema")
+        return cls(**data, repos=repos)
+
+
+def gitlinks(repo: Path, commit: str) -> list[tuple[str, str, str, Optional[str]]]:
+    """
+    (name, path, commit, url) of the submodules recorded in `commit` of `repo`.
+    """
+    tree = run_command(["git", "ls-tree", "-r", commit], cwd=repo)
+    if tree.returncode != 0:
+        raise GitError(f"Cannot list the tree of {commit} in {repo}", tree.stderr.splitlines()[-5:])
+
+    links = {}
+    for line in tree.stdout.splitlines():
+        meta, _, path = line.partition("\t")
+        mode, kind, sha = meta.split()
+        if kind == "commit":
+            links[path] = sha
+    if not links:
+        return []
+
+    config = git(repo, "config", "--blob", f"{commit}:.gitmodules", "--get-regexp", r"^submodule\..*\.(path|url)$") or ""
+    names, urls = {}, {}
+    for line in config.splitlines():
+        key, _, value = line.partition(" ")
+        name, _, attribute = key[len("submodule."):].rpartition(".")
+        if attribute == "path":
+            names[value] = name
+        else:
+            urls[name] = value
+
+    return [(names.get(path, path), path, sha, urls.get(names.get(path, path))) for path, sha in sorted(links.items())]
+
+
+def _bundle(repo: Path, commit: str, output: Path, ref: str = SNAPSHOT_TAG) -> None:
+    """
+    Bundles the history of `commit` through `ref`, created for the bundle if the repository does not have it.
+    """
+    temporary = git(repo, "rev-parse", "--verify", "--quiet", ref) is None
+    if temporary:
+        run_command(["git", "update-ref", ref, commit], cwd=repo, check=True)
+    try:
+        res = run_command(["git", "bundle", "create", str(output), ref], cwd=repo)
+        if res.returncode != 0:
+            raise GitError(f"Failed to bundle {repo}", res.stderr.splitlines()[-5:])
+    finally:
+        if temporary:
+            run_command(["git", "update-ref", "-d", ref], cwd=repo)
+
+
+def export_snapshot(px4_dir: Path, ref: str, output: Path, jobs: int = 4,
+                    allow_missing: bool = False, tag: Optional[str] = None, logger=None) -> Snapshot:
+    """
+    Packs `ref` of the PX4 tree and its submodules (recursively, at the commits
+    `ref` records) into git bundles plus a manifest in `output`.
+
+    The PX4 bundle carries the release tag `tag` (default: `ref` if it is a tag),
+    whether or not the local tree still has it.
+
+    Submodule histories come from the local checkouts, so the submodules must
+    have been updated for `ref` at least once (e.g. by a build).
+    """
+    logger = logger if logger is not None else get_logger("snapshot")
+
+    commit = git(px4_dir, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}")
+    is_tag = commit is not None and git(px4_dir, "rev-parse", "--verify", "--quiet", f"refs/tags/{ref}") is not None
+    if commit is None:
+        # builds delete the local release tag (re-tagged), the planner remembers its commit
+        cached = load_tags_cache().get(ref)
+        if cached and git(px4_dir, "cat-file", "-e", f"{cached}^{{commit}}") is not None:
+            commit, is_tag = cached, True
+    if commit is None:
+        raise ConfigurationError(f"{ref} is not known in {px4_dir}. Build or fetch it first.")
+
+    tag = tag or (ref if is_tag else None)
+    if tag is not None:
+        existing = git(px4_dir, "rev-parse", "--verify", "--quiet", f"refs/tags/{tag}^{{commit}}")
+        if existing is not None and existing != commit:
+            raise ConfigurationError(f"Tag {tag} points to {existing[:12]} in {px4_dir}, not to {commit[:12]}.")
+
+    snapshot = Snapshot(commit, tag, datetime.now(timezone.utc).isoformat())
+    snapshot.repos.append(SnapshotRepo("", commit, git(px4_dir, "remote", "get-url", "origin"), bundle="px4.bundle"))
+
+    # walk the submodules breadth first, parents before their children
+    pending = [("", commit)]
+    while pending:
+        parent, parent_commit = pending.pop(0)
+        for name, path, sub_commit, url in gitlinks(px4_dir / parent, parent_commit):
+            full = f"{parent}/{path}" if parent else path
+            checkout = px4_dir / full
+            if not (checkout / ".git").exists() or git(checkout, "cat-file", "-e", f"{sub_commit}^{{commit}}") is None:
+                snapshot.missing.append(full)
+                continue
+            bundle = "submodules/" + full.replace("/", "__") + ".bundle"
+            snapshot.repos.append(SnapshotRepo(full, sub_commit, url, name, parent, bundle))
+            pending.append((full, sub_commit))
+
+    if snapshot.missing and not allow_missing:
+        raise ConfigurationError(f"{len(snapshot.missing)} submodule(s) are not available locally at {commit[:12]}: "
+                                 f"{', '.join(snapshot.missing[:5])}. Build {ref} once or use --allow-missing.")
+
+    (output / "submodules").mkdir(parents=True, exist_ok=True)
+
+    def pack(repo: SnapshotRepo) -> None:
+        target = output / repo.bundle
+        _bundle(px4_dir / repo.path, repo.commit, target,
+                ref=f"refs/tags/{tag}" if repo.path == "" and tag else SNAPSHOT_TAG)
+        repo.sha256, repo.size = sha256_file(target), target.stat().st_size
+        logger.debug(f"Bundled {repo.path or 'PX4-Autopilot'} ({repo.size / 2**20:.1f} MiB)")
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        list(pool.map(pack, snapshot.repos))
+
+    snapshot.write(output)
+    return snapshot
+
+
+def import_snapshot(directory: Path, px4_dir: Path, jobs: int = 4, logger=None) -> Snapshot:
+    """
+    Restores a PX4 tree at the commit of a snapshot, with its submodules checked
+    out, from the bundles alone. The remotes point to the original URLs afterwards.
+
+    The tree is assembled next to `px4_dir` and moved in place at the end, so
+    an interrupted import never leaves a half restored tree behind.
+    """
+    logger = logger if logger is not None else get_logger("snapshot")
+    snapshot = Snapshot.read(directory)
+
+    if px4_dir.exists() and any(px4_dir.iterdir()):
+        raise ConfigurationError(f"{px4_dir} already exists and is not empty.")
+
+    def verify(repo: SnapshotRepo) -> Optional[str]:
+        if sha256_file(directory / repo.bundle) != repo.sha256:
+            return repo.bundle
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        corrupted = [bundle for bundle in pool.map(verify, snapshot.repos) if bundle is not None]
+    if corrupted:
+        raise ConfigurationError(f"Corrupted snapshot bundles: {', '.join(corrupted)}")
+
+    staging = px4_dir.with_name(f".{px4_dir.name}.import-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    def run(cmd: list[str], cwd: Path, message: str) -> None:
+        res = run_command(cmd, cwd=cwd)
+        if res.returncode != 0:
+            raise GitError(message, (res.stderr or res.error or "").splitlines()[-5:])
+
+    try:
+        root = snapshot.repos[0]
+        logger.info(f"Cloning PX4-Autopilot {snapshot.tag or snapshot.commit[:12]} from {root.bundle}")
+        run(["git", "clone", "--no-checkout", str((directory / root.bundle).resolve()), str(staging)],
+            staging.parent, "Failed to clone the PX4 bundle")
+        run(["git", "checkout", "--detach", snapshot.commit], staging, "Failed to check out the snapshot commit")
+
+        # parents first (the manifest is breadth first): the submodules of a repository need its checkout
+        submodules = snapshot.repos[1:]
+        by_parent: dict[str, list[SnapshotRepo]] = {}
+        for repo in submodules:
+            by_parent.setdefault(repo.parent, []).append(repo)
+
+        for parent in [""] + [repo.path for repo in submodules]:
+            children = by_parent.get(parent)
+            if not children:
+                continue
+            parent_dir = staging / parent
+            # a submodule's path inside its parent
+            relative = [repo.path[len(parent) + 1:] if parent else repo.path for repo in children]
+            for repo in children:
+                run(["git", "config", f"submodule.{repo.name}.url", str((directory / repo.bundle).resolve())],
+                    parent_dir, f"Failed to configure submodule {repo.path}")
+            logger.info(f"Restoring {len(children)} submodule(s) of {parent or 'PX4-Autopilot'}")
+            run(["git", *_ALLOW_FILE, "submodule", "update", "--init", f"--jobs={max(jobs, 1)}", "--", *relative],
+                parent_dir, f"Failed to restore the submodules of {parent or 'PX4-Autopilot'}")
+            # back to the URLs of .gitmodules, in the config and in the remotes of the submodules
+            run(["git", "submodule", "sync", "--", *relative], parent_dir, "Failed to sync submodule URLs")
+
+        for repo in snapshot.repos:
+            run_command(["git", "update-ref", "-d", SNAPSHOT_TAG], cwd=staging / repo.path)
+
+        if root.url:
+            run(["git", "remote", "set-url", "origin", root.url], staging, "Failed to set the origin URL")
+
+        if px4_dir.exists():
+            px4_dir.rmdir()
+        px4_dir.parent.mkdir(parents=True, exist_ok=True)
+        staging.rename(px4_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if snapshot.tag:
+        remember_tag(snapshot.tag, snapshot.commit)
+    return snapshot
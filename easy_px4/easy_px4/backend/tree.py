@@ -0,0 +1,120 @@
+import json
+import difflib
+from pathlib import Path
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from .paths import STATE_DIR
+from .runner import run_command
+
+# boards, airframes and DDS topics per PX4 commit (<commit>.json)
+TREE_DIR = STATE_DIR / "tree"
+TREE_SCHEMA = 1
+
+BOARDS_DIR = "boards"
+AIRFRAMES_DIRS = ("ROMFS/px4fmu_common/init.d/airframes", "ROMFS/px4fmu_common/init.d-posix/airframes")
+DDS_CLIENT_DIR = "src/modules/uxrce_dds_client"
+
+
+@dataclass
+class TreeIndex:
+    """
+    What a PX4 commit provides to an airframe: its boards (`vendor/model` with the
+    labels of their `.px4board` files), the airframe files per ROMFS directory
+    (`init.d`, `init.d-posix`) by id, and whether the uXRCE-DDS client has a dds_topics.yaml.
+    """
+    commit: str
+    boards: dict[str, list[str]] = field(default_factory=dict)
+    airframes: dict[str, dict[str, str]] = field(default_factory=dict)
+    dds_topics: bool = False
+
+    def has_board(self, vendor: str, model: str) -> bool:
+        return f"{vendor}/{model}" in self.boards
+
+    def airframe(self, romfs: str, airframe_id: int) -> Optional[str]:
+        """
+        Upstream airframe file using `airframe_id` in the ROMFS directory `romfs`.
+        """
+        return self.airframes.get(romfs, {}).get(str(airframe_id))
+
+    def suggest(self, vendor: str, model: str) -> list[str]:
+        """
+        Boards with a name close to `vendor/model`, for typos in info.toml.
+        """
+        return difflib.get_close_matches(f"{vendor}/{model}", list(self.boards), n=3, cutoff=0.6)
+
+
+def build_tree_index(px4_dir: Path, commit: str) -> TreeIndex:
+    """
+    Lists the boards, airframes and DDS client files of `commit` from the git objects
+    (the working tree may be at another commit).
+    """
+    listing = run_command(["git", "ls-tree", "-r", "--name-only", commit, "--",
+                           BOARDS_DIR, *AIRFRAMES_DIRS, DDS_CLIENT_DIR], cwd=px4_dir)
+    if listing.returncode != 0:
+        raise ValueError(f"Cannot list the tree of {commit}: {listing.stderr.strip()}")
+
+    index = TreeIndex(commit)
+    for path in listing.stdout.splitlines():
+        parts = path.split("/")
+        if parts[0] == BOARDS_DIR and len(parts) == 4 and parts[3].endswith(".px4board"):
+            index.boards.setdefault(f"{parts[1]}/{parts[2]}", []).append(parts[3][:-len(".px4board")])
+        elif path == f"{DDS_CLIENT_DIR}/dds_topics.yaml":
+            index.dds_topics = True
+        elif path.startswith(AIRFRAMES_DIRS):
+            # <id>_<name>[.post], next to CMakeLists.txt
+            romfs, name = parts[-3], parts[-1]
+            airframe_id = name.split("_", 1)[0]
+            if airframe_id.isdigit():
+                index.airframes.setdefault(romfs, {}).setdefault(str(int(airframe_id)), name)
+    return index
+
+
+def tree_index_file(commit: str) -> Path:
+    return TREE_DIR / f"{commit}.json"
+
+
+def load_tree_index(px4_dir: Path, commit: str) -> TreeIndex:
+    """
+    Index of `commit`, listed once and then read from the cache (a commit never changes).
+    """
+    path = tree_index_file(commit)
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.pop("schema", None) == TREE_SCHEMA:
+            return TreeIndex(**data)
+    except (FileNotFoundError, json.JSONDecodeError, TypeError):
+        pass
+
+    index = build_tree_index(px4_dir, commit)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f".{path.name}.tmp")
+    with temp.open("w", encoding="utf-8") as f:
+        json.dump({"schema": TREE_SCHEMA, **asdict(index)}, f)
+    temp.replace(path)
+    return index
+
+
+def check_airframe(index: TreeIndex, info, boards: list[tuple[str, str]], romfs: str,
+                   dds_topics: bool = False) -> list[str]:
+    """
+    Problems that would only show up during or after the checkout: unknown boards,
+    an `id` already used by an upstream airframe, or no dds_topics.yaml to replace.
+    """
+    problems = []
+    for vendor, model in boards:
+        if not index.has_board(vendor, model):
+            close = index.suggest(vendor, model)
+            hint = f" Did you mean {', '.join(close)}?" if close else ""
+            problems.append(f"Board {vendor}/{model} does not exist in this PX4 version.{hint}")
+
+    upstream = index.airframe(romfs, info.id)
+    if upstream is not None and upstream.split(".", 1)[0] != f"{info.id}_{info.name}":
+        problems.append(f"Airframe id {info.id} is already used by the PX4 airframe {romfs}/airframes/{upstream}. "
+                        "Pick an id in [22000, 22999].")
+
+    if dds_topics and not index.dds_topics:
+        problems.append(f"{DDS_CLIENT_DIR}/dds_topics.yaml does not exist in this PX4 version, "
+                        "the custom dds_topics.yaml cannot replace it.")
+    return problems
@@ -93,7 +93,8 @@ setup(
     python_requires='>=3.9',
     install_requires=[
         'tomli',
-        'easy_px4_utils',
+        'pyyaml',
+        'easy_px4_utils>=0.1.8',
     ],
     extras_require={
         "test": dev_minimal,
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# the work dir is read when easy_px4 is imported, keep the tests away from ~/.easy_px4
+os.environ["EASY_PX4_WORK_DIR"] = tempfile.mkdtemp(prefix="easy_px4-tests-")
@@ -0,0 +1,83 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from easy_px4 import build
+from easy_px4.backend.paths import PX4_DIR
+from easy_px4.backend.planner import git, load_tags_cache
+
+# a PX4 tree with one board, the airframes directories and a make building every target in no time
+MAKEFILE = """\
+clean:
+\trm -rf build
+%:
+\tmkdir -p build/$@/bin; git describe --tags --always > build/$@/$@.px4; cp build/$@/$@.px4 build/$@/bin/px4
+"""
+
+INFO = """\
+name = "protoflyer"
+id = 22105
+vendor = "px4"
+model = "fmu-v6x"
+px4_version = "v1.15.4"
+"""
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None or shutil.which("make") is None,
+                                reason="needs git and make")
+
+
+def _git(cwd: Path, *args: str) -> None:
+    subprocess.run(["git", "-c", "user.name=easy_px4", "-c", "user.email=easy_px4@localhost", *args],
+                   cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def px4_clone(tmp_path):
+    """
+    Fresh clone of a fake PX4 origin, with the release tag v1.15.4 local.
+    """
+    origin = tmp_path / "origin"
+    for directory in ("boards/px4/fmu-v6x", "ROMFS/px4fmu_common/init.d/airframes",
+                      "ROMFS/px4fmu_common/init.d-posix/airframes", "msg"):
+        (origin / directory).mkdir(parents=True)
+    (origin / "boards/px4/fmu-v6x/default.px4board").write_text("CONFIG_BOARD_TOOLCHAIN=\"arm-none-eabi\"\n")
+    for romfs in ("init.d", "init.d-posix"):
+        (origin / f"ROMFS/px4fmu_common/{romfs}/airframes/CMakeLists.txt").write_text("px4_add_romfs_files(\n)\n")
+    (origin / "Makefile").write_text(MAKEFILE)
+    (origin / ".gitignore").write_text("build/\n")
+    _git(origin, "init", "-q")
+    _git(origin, "add", "-A")
+    _git(origin, "commit", "-qm", "init")
+    _git(origin, "tag", "v1.15.4")
+
+    shutil.rmtree(PX4_DIR, ignore_errors=True)
+    PX4_DIR.parent.mkdir(parents=True, exist_ok=True)
+    _git(tmp_path, "clone", "-q", str(origin), str(PX4_DIR))
+    yield git(PX4_DIR, "rev-parse", "v1.15.4^{commit}")
+    shutil.rmtree(PX4_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def airframe(tmp_path):
+    directory = tmp_path / "protoflyer"
+    directory.mkdir()
+    (directory / "info.toml").write_text(INFO)
+    (directory / "params.airframe").write_text("#!/bin/sh\n# @type Quadrotor\n. ${R}etc/init.d/rc.mc_defaults\n")
+    (directory / "board.modules").write_text("CONFIG_MODULES_UXRCE_DDS_CLIENT=y\n")
+    return directory
+
+
+def test_build_remembers_local_release_tag(px4_clone, airframe):
+    commit = px4_clone
+
+    first = build(airframe, overwrite=True)
+    assert first.status == "success"
+    # re-tagged: the release tag is gone, its commit is in the tags cache
+    assert git(PX4_DIR, "rev-parse", "--verify", "--quiet", "refs/tags/v1.15.4") is None
+    assert load_tags_cache()["v1.15.4"] == commit
+
+    second = build(airframe, overwrite=True)
+    assert second.status == "up-to-date"
+    assert second.commit == commit
@@ -1,9 +1,13 @@
 from .info import load_info, load_info_dict
 from .directory import load_directory, valid_dir_path
+from .fleet import FleetEntry, FleetIndex, load_fleet_index
 
 __all__ = [
     "load_info",
     "load_info_dict",
     "load_directory",
     "valid_dir_path",
+    "FleetEntry",
+    "FleetIndex",
+    "load_fleet_index",
 ]
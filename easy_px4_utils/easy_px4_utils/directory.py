@@ -1,7 +1,8 @@
+import os
 from abc import ABC, abstractmethod
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Union
+from typing import Optional, Union
 from .info import Info, load_info
 
 @dataclass(frozen=True)
@@ -23,14 +24,19 @@ class BaseDirectoryStructure(ABC):
         """Return the list of file rules required for this folder structure."""
         pass
 
-    def validate(self, folder: Path) -> None:
+    def validate(self, folder: Path, present: Optional[set[str]] = None) -> set[str]:
+        """
+        Checks that every required file exists and returns the names of the files in `folder`.
+        """
+        present = list_files(folder) if present is None else present
         missing = [
             rule.file_name
             for rule in self.rules
-            if rule.required and not (folder / rule.file_name).is_file()
+            if rule.required and rule.file_name not in present
         ]
         if missing:
             raise FileNotFoundError(f"Missing required files: {', '.join(missing)}")
+        return present
 
 
 class SITLDirectoryStructure(BaseDirectoryStructure):
@@ -55,6 +61,13 @@ class FirmwareDirectoryStructure(BaseDirectoryStructure):
             FileRule("dds_topics_file", "dds_topics.yaml", required=False),
         ]
 
+def list_files(folder: Path) -> set[str]:
+    """
+    Names of the regular files in `folder`, from a single directory scan.
+    """
+    with os.scandir(folder) as entries:
+        return {entry.name for entry in entries if entry.is_file()}
+
 def valid_dir_path(path: Union[str, Path]) -> Path:
 
     directory = None
@@ -82,15 +95,11 @@ class Directory:
 
         self.__structure = self.__validate_structure()
 
-        for rule in self.__structure.get_rules():
-            file_path = self.directory / rule.file_name
-
-            if file_path.is_file():
+        # validate() already listed the directory, no need to stat every file again
+        for rule in self.__structure.rules:
+            if rule.file_name in self.__present:
                 setattr(self, rule.prop_name, rule.file_name)
             else:
-                if rule.required:
-                    # validate() should already prevent this, but keep it safe.
-                    raise FileNotFoundError(f"Missing required file: {rule.file_name}")
                 setattr(self, rule.prop_name, None)
 
         self.__info_manager = load_info(self.directory / self.__structure.info_file)
@@ -105,7 +114,7 @@ class Directory:
         else:
             raise ValueError(f"Unknown build type: {self.dir_type}")
 
-        structure.validate(self.directory)
+        self.__present = structure.validate(self.directory)
         return structure
 
     def get_info(self) -> Info:
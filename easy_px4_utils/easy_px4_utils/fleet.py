@@ -0,0 +1,237 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from dataclasses import asdict, dataclass, field
+from typing import Optional, Union
+
+from .info import Info, load_info
+from .directory import FirmwareDirectoryStructure, SITLDirectoryStructure, valid_dir_path
+
+INDEX_SCHEMA = 1
+INDEX_NAME = ".easy_px4_index.json"
+
+INFO_FILE = "info.toml"
+
+STRUCTURES = {
+    "firmware": FirmwareDirectoryStructure(),
+    "sitl": SITLDirectoryStructure(),
+}
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class FleetEntry:
+    """
+    One airframe directory of the index.
+
+    `files` maps every file of the directory to its mtime, size and sha256.
+    `error` is set (and `info` is None) when info.toml could not be parsed.
+    """
+    path: str
+    info: Optional[Info] = None
+    types: list[str] = field(default_factory=list)
+    files: dict[str, dict] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def components(self) -> list[str]:
+        if self.info is None or self.info.components is None:
+            return []
+        components = self.info.components
+        return components if isinstance(components, list) else [components]
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["info"] = asdict(self.info) if self.info is not None else None
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FleetEntry":
+        info = Info(**data["info"]) if data.get("info") is not None else None
+        return cls(data["path"], info, data.get("types", []), data.get("files", {}), data.get("error"))
+
+
+@dataclass
+class RefreshStats:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+
+class FleetIndex:
+    """
+    On-disk index of every airframe directory (a directory with an info.toml) below `root`.
+
+    Refreshing walks the tree but only re-hashes files whose mtime or size changed
+    and only re-parses info.toml when it changed. Queries never touch the tree.
+    """
+
+    def __init__(self, root: Union[str, Path], index_file: Optional[Union[str, Path]] = None) -> None:
+        self.root = valid_dir_path(root)
+        self.index_file = Path(index_file) if index_file is not None else self.root / INDEX_NAME
+        self.entries: dict[str, FleetEntry] = {}
+
+    def load(self) -> "FleetIndex":
+        """
+        Reads the index file. A missing, corrupted or outdated index is treated as empty.
+        """
+        try:
+            with self.index_file.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return self
+
+        if data.get("schema") != INDEX_SCHEMA:
+            return self
+
+        try:
+            self.entries = {key: FleetEntry.from_dict(value) for key, value in data.get("entries", {}).items()}
+        except (KeyError, TypeError):
+            self.entries = {}
+        return self
+
+    def save(self) -> None:
+        data = {
+            "schema": INDEX_SCHEMA,
+            "entries": {key: entry.to_dict() for key, entry in sorted(self.entries.items())},
+        }
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.index_file.with_name(f"{self.index_file.name}.tmp")
+        with temp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        temp.replace(self.index_file)
+
+    def __airframe_dirs(self):
+        for current, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            if INFO_FILE in files:
+                yield Path(current)
+
+    @staticmethod
+    def __scan(directory: Path) -> dict[str, tuple[int, int]]:
+        stats = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    stats[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    def __index(self, directory: Path, key: str, previous: Optional[FleetEntry]) -> Optional[FleetEntry]:
+        """
+        Entry of `directory`, or None if `previous` is still current.
+        """
+        stats = self.__scan(directory)
+        old_files = previous.files if previous is not None else {}
+
+        files = {}
+        changed = set()
+        for name, (mtime_ns, size) in stats.items():
+            old = old_files.get(name)
+            if old is not None and old["mtime_ns"] == mtime_ns and old["size"] == size:
+                files[name] = old
+            else:
+                files[name] = {"mtime_ns": mtime_ns, "size": size, "sha256": _sha256(directory / name)}
+                changed.add(name)
+
+        if previous is not None and not changed and set(files) == set(old_files):
+            return None
+
+        types = [
+            dir_type for dir_type, structure in STRUCTURES.items()
+            if all(rule.file_name in files for rule in structure.rules if rule.required)
+        ]
+        entry = FleetEntry(key, types=types, files=files)
+
+        if previous is not None and INFO_FILE not in changed:
+            entry.info, entry.error = previous.info, previous.error
+        else:
+            try:
+                entry.info = load_info(directory / INFO_FILE).get_info()
+            except Exception as e:
+                entry.error = str(e)
+
+        return entry
+
+    def refresh(self) -> RefreshStats:
+        """
+        Brings the index up to date with the tree below `root`.
+        """
+        stats = RefreshStats()
+        seen = set()
+
+        for directory in self.__airframe_dirs():
+            key = directory.relative_to(self.root).as_posix()
+            seen.add(key)
+            previous = self.entries.get(key)
+
+            entry = self.__index(directory, key, previous)
+            if entry is None:
+                stats.unchanged += 1
+                continue
+
+            self.entries[key] = entry
+            if previous is None:
+                stats.added += 1
+            else:
+                stats.updated += 1
+
+        for key in set(self.entries) - seen:
+            del self.entries[key]
+            stats.removed += 1
+
+        return stats
+
+    def airframes(self) -> list[FleetEntry]:
+        """
+        Entries with a valid info.toml.
+        """
+        return [entry for entry in self.entries.values() if entry.info is not None]
+
+    def errors(self) -> dict[str, str]:
+        return {key: entry.error for key, entry in self.entries.items() if entry.error is not None}
+
+    def by_px4_version(self, px4_version: str) -> list[FleetEntry]:
+        return [entry for entry in self.airframes() if entry.info.px4_version == px4_version]
+
+    def by_board(self, vendor: str, model: Optional[str] = None) -> list[FleetEntry]:
+        return [
+            entry for entry in self.airframes()
+            if any(v == vendor and (model is None or m == model) for v, m in entry.info.all_boards())
+        ]
+
+    def by_component(self, component: str) -> list[FleetEntry]:
+        return [entry for entry in self.airframes() if component in entry.components]
+
+    def duplicate_ids(self) -> dict[int, list[str]]:
+        """
+        Airframe ids used by more than one directory, mapped to those directories.
+        """
+        paths: dict[int, list[str]] = {}
+        for entry in self.airframes():
+            paths.setdefault(entry.info.id, []).append(entry.path)
+        return {airframe_id: sorted(keys) for airframe_id, keys in paths.items() if len(keys) > 1}
+
+
+def load_fleet_index(root: Union[str, Path],
+                     index_file: Optional[Union[str, Path]] = None,
+                     refresh: bool = True) -> FleetIndex:
+    """
+    Loads the index of the airframe directories below `root`, refreshing
+    (and saving) it unless `refresh` is False.
+    """
+    index = FleetIndex(root, index_file).load()
+    if refresh:
+        stats = index.refresh()
+        if stats.added or stats.updated or stats.removed or not index.index_file.is_file():
+            index.save()
+    return index
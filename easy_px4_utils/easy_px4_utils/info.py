@@ -26,6 +26,24 @@ class Info:
 
     custom_fw_version: Optional[str] = "0.0.0"
     components: Optional[Union[str, list[str]]] = None
+    # further boards the firmware is built for: [{vendor = "px4", model = "fmu-v6c"}, ...]
+    boards: Optional[list[dict[str, str]]] = None
+
+    def all_boards(self) -> list[tuple[str, str]]:
+        """
+        (vendor, model) of every board, `vendor`/`model` first, without duplicates.
+        """
+        boards = [(self.vendor, self.model)]
+        for board in self.boards or []:
+            pair = (board["vendor"], board["model"])
+            if pair not in boards:
+                boards.append(pair)
+        return boards
+
+
+def _type_name(expected_type) -> str:
+    # typing generics (Optional[list[...]]) have no __name__ before Python 3.10
+    return getattr(expected_type, "__name__", None) or str(expected_type).replace("typing.", "")
 
 
 class InfoManager:
@@ -36,7 +54,12 @@ class InfoManager:
 
         if isinstance(input_info, str):
             possible_path = Path(input_info)
-            if possible_path.is_file():
+            try:
+                is_file = possible_path.is_file()
+            except OSError:
+                # TOML content longer than a file name
+                is_file = False
+            if is_file:
                 self.path = possible_path
             else:
                 self.path = None
@@ -141,7 +164,7 @@ class InfoManager:
 
             if not self.__matches_type(value, expected_type):
                 raise TypeError(
-                    f"Field '{expected_key}' must be of type '{expected_type.__name__}'. "
+                    f"Field '{expected_key}' must be of type '{_type_name(expected_type)}'. "
                     f"Got value={value!r} (type={type(value).__name__})"
                 )
 
@@ -157,6 +180,10 @@ class InfoManager:
             if not re.fullmatch(r'([0-9]+)\.([0-9]+)\.([0-9]+)((-dev)|(-alpha[0-9]+)|(-beta[0-9]+)|(-?rc[0-9]+))?$', info_dict['custom_fw_version']):
                 raise ValueError(f"'custom_fw_version' must be semantic version <major>.<minor>.<patch>[-rc<rc>|-beta<beta>|-alpha<alpha>|-dev]. Got {info_dict['custom_fw_version']}")
 
+        for board in info_dict.get("boards") or []:
+            if set(board) != {"vendor", "model"} or not all(board.values()):
+                raise ValueError(f"Every entry of 'boards' must have exactly a 'vendor' and a 'model'. Got {board}")
+
         return True
 
 
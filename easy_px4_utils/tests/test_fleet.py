@@ -0,0 +1,93 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+import easy_px4_utils
+
+DEMOS = Path(__file__).resolve().parent.parent / "demos"
+
+
+@pytest.fixture
+def fleet(tmp_path):
+    root = tmp_path / "fleet"
+    shutil.copytree(DEMOS, root)
+    return root
+
+
+def test_fleet_index_queries(fleet):
+    index = easy_px4_utils.load_fleet_index(fleet)
+
+    assert sorted(entry.path for entry in index.airframes()) == ["drache", "protoflyer"]
+    assert index.errors() == {}
+
+    drache = index.entries["drache"]
+    assert drache.info.name == "drache"
+    assert sorted(drache.types) == ["firmware", "sitl"]
+    assert set(drache.files) == {"board.modules", "info.toml", "params.airframe", "sitl.modules"}
+
+    version = drache.info.px4_version
+    assert "drache" in [entry.path for entry in index.by_px4_version(version)]
+    assert index.by_px4_version("v0.0.1") == []
+    assert [entry.path for entry in index.by_board(drache.info.vendor, drache.info.model)].count("drache") == 1
+
+    for component in drache.components:
+        assert "drache" in [entry.path for entry in index.by_component(component)]
+
+
+def test_fleet_index_persistence(fleet):
+    easy_px4_utils.load_fleet_index(fleet)
+    assert (fleet / ".easy_px4_index.json").is_file()
+
+    index = easy_px4_utils.FleetIndex(fleet).load()
+    assert sorted(index.entries) == ["drache", "protoflyer"]
+    assert index.entries["drache"].info == easy_px4_utils.load_info(fleet / "drache" / "info.toml").get_info()
+
+
+def test_fleet_index_incremental_refresh(fleet):
+    index = easy_px4_utils.FleetIndex(fleet)
+    stats = index.refresh()
+    assert (stats.added, stats.updated, stats.removed, stats.unchanged) == (2, 0, 0, 0)
+
+    stats = index.refresh()
+    assert (stats.added, stats.updated, stats.removed, stats.unchanged) == (0, 0, 0, 2)
+
+    params = fleet / "drache" / "params.airframe"
+    old_hash = index.entries["drache"].files["params.airframe"]["sha256"]
+    params.write_text(params.read_text() + "\nparam set-default MPC_XY_VEL_MAX 5\n")
+    os.utime(params, ns=(0, 10**9))
+
+    stats = index.refresh()
+    assert (stats.added, stats.updated, stats.removed, stats.unchanged) == (0, 1, 0, 1)
+    assert index.entries["drache"].files["params.airframe"]["sha256"] != old_hash
+
+    shutil.rmtree(fleet / "protoflyer")
+    stats = index.refresh()
+    assert (stats.removed, stats.unchanged) == (1, 1)
+    assert "protoflyer" not in index.entries
+
+
+def test_fleet_index_duplicate_ids_and_errors(fleet):
+    shutil.copytree(fleet / "drache", fleet / "nested" / "drache_copy")
+    (fleet / "broken").mkdir()
+    (fleet / "broken" / "info.toml").write_text('name = "broken"\n')
+
+    index = easy_px4_utils.load_fleet_index(fleet)
+    drache_id = index.entries["drache"].info.id
+
+    assert index.duplicate_ids() == {drache_id: ["drache", "nested/drache_copy"]}
+    assert list(index.errors()) == ["broken"]
+    assert index.entries["broken"].info is None
+
+
+def test_fleet_index_by_board_boards(fleet):
+    info = fleet / "protoflyer" / "info.toml"
+    info.write_text(info.read_text() + 'boards = [{ vendor = "holybro", model = "kakuteh7" }]\n')
+
+    index = easy_px4_utils.load_fleet_index(fleet)
+
+    assert [entry.path for entry in index.by_board("holybro", "kakuteh7")] == ["protoflyer"]
+    assert [entry.path for entry in index.by_board("holybro")] == ["protoflyer"]
+    assert "protoflyer" in [entry.path for entry in index.by_board("px4", "fmu-v3")]
+    assert easy_px4_utils.FleetIndex(fleet).load().entries["protoflyer"].info.boards == [
+        {"vendor": "holybro", "model": "kakuteh7"}]
@@ -68,6 +68,60 @@ def test_load_info_list_components():
         components = ["some_component", "other_component"]
     """)
 
+def test_load_info_boards():
+    info = easy_px4_utils.load_info("""
+        name = "drone"
+        id = 12345
+        vendor = "px4"
+        model = "fmu-v6x"
+        px4_version = "v1.15.4"
+        boards = [
+            { vendor = "px4", model = "fmu-v6c" },
+            { vendor = "px4", model = "fmu-v6x" },
+        ]
+    """).get_info()
+
+    assert info.all_boards() == [("px4", "fmu-v6x"), ("px4", "fmu-v6c")]
+
+def test_load_info_no_boards():
+    info = easy_px4_utils.load_info("""
+        name = "drone"
+        id = 12345
+        vendor = "px4"
+        model = "fmu-v3"
+        px4_version = "v1.15.4"
+    """).get_info()
+
+    assert info.boards is None
+    assert info.all_boards() == [("px4", "fmu-v3")]
+
+@pytest.mark.parametrize("boards", [
+    '[{ vendor = "px4" }]',
+    '[{ vendor = "px4", model = "" }]',
+    '[{ vendor = "px4", model = "fmu-v6c", extra = "x" }]',
+])
+def test_load_info_bad_boards(boards):
+    with pytest.raises(ValueError):
+        easy_px4_utils.load_info(f"""
+            name = "drone"
+            id = 12345
+            vendor = "px4"
+            model = "fmu-v6x"
+            px4_version = "v1.15.4"
+            boards = {boards}
+        """)
+
+def test_load_info_boards_not_tables():
+    with pytest.raises(TypeError):
+        easy_px4_utils.load_info("""
+            name = "drone"
+            id = 12345
+            vendor = "px4"
+            model = "fmu-v6x"
+            px4_version = "v1.15.4"
+            boards = ["px4/fmu-v6c"]
+        """)
+
 def test_load_info_bad():
 
     with pytest.raises(tomllib.TOMLDecodeError):